@@ -6,13 +6,29 @@
 import asyncio
 import logging
 import sys
-from aiogram import Bot, Dispatcher
+from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, AUTO_CLOSE_INTERVAL, ARCHIVE_INTERVAL, BACKUP_INTERVAL,
+    FSM_FLUSH_INTERVAL, FSM_CLEANUP_INTERVAL, BOT_MODE, WORKERS,
+    SCHEDULER_METRICS_INTERVAL, DEDUP_FLUSH_INTERVAL, DEDUP_CLEANUP_INTERVAL,
+    ROW_CACHE_METRICS_INTERVAL
+)
 from database import db
 from handlers import common, user, admin, agent, admin_callbacks
+from utils.scheduler import start_periodic, stop_periodic_tasks
+from utils.auto_close import auto_close_tickets
+from utils.archive import archive_old_tickets
+from utils.backup import scheduled_backup
+from utils.fsm_storage import SQLiteStorage, create_fsm_storage
+from utils.chat_scheduler import ChatOrderedDispatcher
+from utils.dedup import UpdateDeduplicationMiddleware, expire_processed_updates
+from utils.throttling import ThrottlingMiddleware
+from utils.routing import install_dispatch_index
+from utils.webhook import run_webhook
+from utils.workers import run_sharded
 
 
 # Настройка логирования
@@ -33,16 +49,42 @@ bot = Bot(
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 
-dp = Dispatcher()
+# Состояния диалогов: в базе (переживают перезапуск) или в ограниченной памяти
+fsm_storage = create_fsm_storage()
+# Обновления одного чата обрабатываются по порядку, разных чатов - параллельно
+dp = ChatOrderedDispatcher(storage=fsm_storage)
+# Повторно доставленные обновления не доходят до обработчиков
+dedup = UpdateDeduplicationMiddleware()
 
 
-async def on_startup():
+async def on_startup(worker_index: int = 0):
     logger.info("🚀 Запуск бота поддержки...")
     
     # Создаем таблицы в базе данных
     await db.create_tables()
     logger.info("✅ База данных инициализирована")
     
+    # Отметки об обработанных обновлениях у каждого процесса свои
+    await dedup.load_recent()
+    start_periodic("dedup_flush", DEDUP_FLUSH_INTERVAL, dedup.flush)
+    # Состояния FSM у каждого процесса-обработчика свои
+    if isinstance(fsm_storage, SQLiteStorage):
+        start_periodic("fsm_flush", FSM_FLUSH_INTERVAL, fsm_storage.flush)
+    start_periodic("fsm_expire", FSM_CLEANUP_INTERVAL, fsm_storage.expire)
+    start_periodic("chat_scheduler_metrics", SCHEDULER_METRICS_INTERVAL, dp.scheduler.log_stats)
+    start_periodic("row_cache_metrics", ROW_CACHE_METRICS_INTERVAL, db.log_cache_stats)
+    
+    # Общие задачи и уведомления - только в одном процессе
+    if worker_index:
+        return
+    
+    # Запускаем фоновые задачи обслуживания
+    start_periodic("auto_close", AUTO_CLOSE_INTERVAL, lambda: auto_close_tickets(bot))
+    start_periodic("archive", ARCHIVE_INTERVAL, archive_old_tickets)
+    if BACKUP_INTERVAL:
+        start_periodic("backup", BACKUP_INTERVAL, scheduled_backup)
+    start_periodic("dedup_expire", DEDUP_CLEANUP_INTERVAL, expire_processed_updates)
+    
     # Получаем информацию о боте
     bot_info = await bot.get_me()
     logger.info(f"✅ Бот запущен: @{bot_info.username}")
@@ -61,9 +103,16 @@ async def on_startup():
             logger.warning(f"Не удалось уведомить админа {admin_id}: {e}")
 
 
-async def on_shutdown():
+async def on_shutdown(worker_index: int = 0):
     logger.info("🛑 Завершение работы бота...")
     
+    # Останавливаем фоновые задачи
+    await stop_periodic_tasks()
+    # Очереди чатов уже дообработаны: записываем последние отметки
+    await dedup.flush()
+    if worker_index:
+        return
+    
     # Уведомляем администраторов о завершении работы
     from config import ADMINS
     for admin_id in ADMINS:
@@ -78,22 +127,46 @@ async def on_shutdown():
             logger.warning(f"Не удалось уведомить админа {admin_id}: {e}")
 
 
+def setup_dispatcher():
+    """Подключить роутеры и обработчики запуска/остановки"""
+    # Повторно доставленные обновления не доходят до обработчиков
+    dp.update.outer_middleware(dedup)
+    # Ограничение частоты действий (лимит группы задаёт флаг throttling_key)
+    throttling = ThrottlingMiddleware()
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
+    
+    # Регистрируем роутеры (порядок важен!)
+    dp.include_router(user.router)
+    dp.include_router(agent.router)
+    dp.include_router(admin.router)
+    dp.include_router(admin_callbacks.router)
+    dp.include_router(common.router)  # Последним, так как содержит общий обработчик
+    # Кнопки и callback-данные ищутся по индексу, а не перебором всех фильтров
+    install_dispatch_index(dp)
+    
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+
+
 async def main():
     """Главная функция"""
     try:
-        # Регистрируем роутеры (порядок важен!)
-        dp.include_router(user.router)
-        dp.include_router(agent.router)
-        dp.include_router(admin.router)
-        dp.include_router(admin_callbacks.router)
-        dp.include_router(common.router)  # Последним, так как содержит общий обработчик
+        setup_dispatcher()
         
         # Запускаем бота
-        dp.startup.register(on_startup)
-        dp.shutdown.register(on_shutdown)
-        
-        logger.info("🔄 Начинаем polling...")
-        await dp.start_polling(bot)
+        if WORKERS > 1:
+            await run_sharded(bot, dp)
+        elif BOT_MODE == 'webhook':
+            logger.info("🔄 Запускаем приём обновлений через вебхук...")
+            await run_webhook(dp, bot)
+        else:
+            logger.info("🔄 Начинаем polling...")
+            # getUpdates не работает, пока установлен вебхук
+            await bot.delete_webhook()
+            # Обновления не запускаются отдельными задачами: при заполненных
+            # очередях чатов получение новых обновлений приостанавливается
+            await dp.start_polling(bot, handle_as_tasks=False)
         
     except Exception as e:
         logger.error(f"❌ Критическая ошибка: {e}")
@@ -34,4 +34,93 @@ DATABASE_PATH = 'data/support.db'
 
 # Настройки
 MAX_TICKET_TEXT_LENGTH = 1000
-TICKETS_PER_PAGE = 5
\ No newline at end of file
+TICKETS_PER_PAGE = 5
+
+# Автозакрытие обращений (0 - отключено)
+AUTO_CLOSE_RESOLVED_DAYS = 7    # Решённые обращения закрываются через N дней
+AUTO_CLOSE_WAITING_DAYS = 14    # Ожидающие ответа клиента - через N дней без ответа
+AUTO_CLOSE_BATCH_SIZE = 100     # Обращений за одну транзакцию
+AUTO_CLOSE_INTERVAL = 3600      # Периодичность проверки (секунды)
+
+# Рассылка уведомлений (лимит Telegram ~30 сообщений в секунду)
+NOTIFY_RATE_PER_SECOND = 25
+
+# Архив закрытых обращений
+ARCHIVE_DATABASE_PATH = 'data/archive.db'
+ARCHIVE_AFTER_DAYS = 180        # Закрытые обращения старше N дней уходят в архив (0 - отключено)
+ARCHIVE_BATCH_SIZE = 200        # Обращений за одну транзакцию
+ARCHIVE_INTERVAL = 6 * 3600     # Периодичность архивации (секунды)
+
+# Резервное копирование
+BACKUP_DIR = 'backups'
+BACKUP_INTERVAL = 24 * 3600     # Периодичность плановых копий (секунды, 0 - отключено)
+BACKUP_RETENTION = 7            # Сколько последних копий хранить
+
+# Экспорт данных
+EXPORT_CHUNK_SIZE = 500         # Строк за одно чтение из базы
+EXPORT_DELTA_CONSUMER = 'admin' # Потребитель выгрузки изменений из админ-панели
+
+# Хранилище состояний FSM
+FSM_FLUSH_INTERVAL = 1          # Как часто изменения состояний пишутся в базу (секунды)
+FSM_STATE_TTL = 7 * 24 * 3600   # Брошенные диалоги удаляются через N секунд без изменений
+FSM_CACHE_IDLE = 600            # Неактивные записи выгружаются из памяти через N секунд
+FSM_CLEANUP_INTERVAL = 3600     # Периодичность очистки (секунды)
+FSM_STORAGE = 'sqlite'          # 'sqlite' - состояния в базе, 'memory' - только в памяти
+FSM_MEMORY_MAX_KEYS = 100000    # Лимит состояний в памяти (самые давние вытесняются)
+FSM_MEMORY_IDLE_TTL = 24 * 3600 # Состояние в памяти удаляется через N секунд без обращений
+
+# Режим получения обновлений: 'polling' или 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')             # Публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')       # Проверяется в X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))
+WEBHOOK_DRAIN_TIMEOUT = 30      # Сколько ждать обработки принятых обновлений при остановке (секунды)
+
+# Параллельная обработка в нескольких процессах (1 - всё в одном процессе)
+WORKERS = int(os.getenv('WORKERS', '1'))
+WORKER_QUEUE_SIZE = 1000        # Очередь обновлений каждого процесса (при заполнении приём ждёт)
+WORKER_METRICS_INTERVAL = 60    # Периодичность вывода метрик процессов (секунды)
+DB_BUSY_TIMEOUT = 10            # Ожидание блокировки базы другим процессом (секунды)
+
+# Обработка обновлений: по порядку внутри чата, разные чаты параллельно
+MAX_CONCURRENT_UPDATES = 100    # Лимит принятых, но не обработанных обновлений (при достижении приём ждёт)
+UPDATES_DRAIN_TIMEOUT = 30      # Сколько ждать обработки очередей при остановке (секунды)
+SCHEDULER_METRICS_INTERVAL = 60 # Периодичность вывода метрик очередей (секунды)
+
+# Защита от повторной доставки обновлений
+DEDUP_RING_SIZE = 10000         # Сколько последних update_id помнить в памяти
+DEDUP_TTL = 2 * 24 * 3600       # Сколько хранить отметки в базе (Telegram хранит обновления до суток)
+DEDUP_FLUSH_INTERVAL = 1        # Как часто отметки об обработке пишутся в базу (секунды)
+DEDUP_CLEANUP_INTERVAL = 3600   # Периодичность очистки (секунды)
+
+# Ограничение частоты действий пользователя: группа -> (действий в секунду, запас)
+THROTTLE_LIMITS = {
+    'default': (2.0, 6),            # Любые кнопки и сообщения
+    'ticket_create': (0.2, 2),      # Начало создания обращения
+    'ticket_write': (0.5, 3),       # Запись описания обращения и сообщений
+    'export': (0.1, 1),             # Тяжёлые выгрузки и отчёты
+}
+THROTTLE_SWEEP_INTERVAL = 300   # Как часто удалять неактивные счётчики (секунды)
+
+# Кэш параметризованных клавиатур (вариантов на функцию)
+KEYBOARD_CACHE_SIZE = 1024
+
+# Кэш строк обращений и пользователей в Database
+ROW_CACHE_SIZE = 5000           # Строк в кэше каждой таблицы
+ROW_CACHE_BUCKETS = 4096        # Корзин версий (общих для процессов-обработчиков)
+ROW_CACHE_METRICS_INTERVAL = 300  # Периодичность вывода метрик кэша (секунды)
+
+# Сколько последних отрисовок сообщений помнить, чтобы не редактировать их впустую
+RENDER_CACHE_SIZE = 10000
+
+# Просмотр полной переписки по обращению
+TRANSCRIPT_PAGE_SIZE = 10       # Сообщений на странице
+TRANSCRIPT_MESSAGE_LIMIT = 300  # Символов сообщения на странице (полный текст - в выгрузке)
+
+# Часовой пояс дат в сообщениях, например 'Europe/Moscow' (пусто - пояс сервера).
+# В базе время хранится в unix time (UTC)
+DISPLAY_TIMEZONE = os.getenv('DISPLAY_TIMEZONE', '')
+# Сколько отформатированных дат помнить при выводе списков и карточек
+DATE_FORMAT_CACHE_SIZE = 4096
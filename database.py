@@ -1,19 +1,127 @@
 import aiosqlite
 import asyncio
-from datetime import datetime
-from typing import List, Optional, Dict, Any
-from config import DATABASE_PATH
+from typing import List, Optional, Dict, Any, AsyncIterator, Sequence
+from config import (
+    DATABASE_PATH, ARCHIVE_DATABASE_PATH, EXPORT_CHUNK_SIZE, DB_BUSY_TIMEOUT,
+    ROW_CACHE_SIZE, ROW_CACHE_BUCKETS
+)
+from models import User, Ticket, TicketMessage, select_list
+from utils.dates import days_ago, unix_now
+from utils.row_cache import RowCache
+
+# Колонки запросов в порядке полей записей
+USER_COLUMNS = select_list(User)
+TICKET_COLUMNS = select_list(Ticket)
+# Списки обращений читают только показываемые колонки (их покрывают индексы
+# idx_tickets_user_list и idx_tickets_queue), описание в списки не попадает
+_LIST_SKIP = ('category', 'assigned_admin', 'updated_at', 'message_count', 'description')
+TICKET_SUMMARY_COLUMNS = select_list(Ticket, skip=_LIST_SKIP + ('priority',))
+TICKET_LIST_COLUMNS = select_list(Ticket, 't', skip=_LIST_SKIP, first_name='u.first_name')
+MESSAGE_COLUMNS = select_list(
+    TicketMessage, 'tm', first_name='u.first_name', username='u.username'
+)
+
+# Версия схемы (PRAGMA user_version): 1 - время в unix time (см. utils/dates.py)
+SCHEMA_VERSION = 1
+# Колонки времени; в старых базах в них текст CURRENT_TIMESTAMP (UTC)
+_TIMESTAMP_COLUMNS = {
+    'users': ('created_at', 'updated_at'),
+    'tickets': ('created_at', 'updated_at'),
+    'ticket_messages': ('created_at',),
+    'export_watermarks': ('last_updated_at', 'updated_at'),
+}
+# Значение по умолчанию для колонок времени в новых базах
+_NOW_DEFAULT = "(CAST(strftime('%s', 'now') AS INTEGER))"
 
 
 class Database:
     def __init__(self):
         self.db_path = DATABASE_PATH
+        self.archive_path = ARCHIVE_DATABASE_PATH
+        # Кэш get_ticket/get_user, сбрасывается всеми методами записи
+        self.ticket_cache = RowCache('tickets', ROW_CACHE_SIZE, ROW_CACHE_BUCKETS)
+        self.user_cache = RowCache('users', ROW_CACHE_SIZE, ROW_CACHE_BUCKETS)
+    
+    def share_cache_versions(self, ticket_versions, user_versions):
+        """Подключить версии кэша, общие для процессов-обработчиков"""
+        self.ticket_cache.share_versions(ticket_versions)
+        self.user_cache.share_versions(user_versions)
+    
+    async def log_cache_stats(self):
+        """Вывести метрики кэшей строк в лог"""
+        await self.ticket_cache.log_stats()
+        await self.user_cache.log_stats()
+    
+    def _connect(self) -> aiosqlite.Connection:
+        """Открыть соединение с основной базой
+        
+        К базе могут одновременно писать несколько процессов-обработчиков,
+        поэтому занятая база ожидается до DB_BUSY_TIMEOUT, а не сразу
+        приводит к ошибке "database is locked".
+        """
+        return aiosqlite.connect(self.db_path, timeout=DB_BUSY_TIMEOUT)
+    
+    async def _attach_archive(self, db: aiosqlite.Connection):
+        """Подключить файл архива к соединению как схему archive"""
+        await db.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+    
+    async def _table_columns(self, db: aiosqlite.Connection, 
+                             schema: str, table: str) -> List[str]:
+        """Получить список колонок таблицы"""
+        cursor = await db.execute(f'PRAGMA {schema}.table_info({table})')
+        return [row[1] for row in await cursor.fetchall()]
+    
+    async def _add_column_if_missing(self, db: aiosqlite.Connection, 
+                                     table: str, column: str, definition: str) -> bool:
+        """Добавить колонку в существующую таблицу (миграция старых баз)"""
+        if column in await self._table_columns(db, 'main', table):
+            return False
+        await db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+    
+    async def _sync_archive_table(self, db: aiosqlite.Connection, table: str):
+        """Создать архивную копию таблицы и догнать её по колонкам"""
+        await db.execute(f'''
+            CREATE TABLE IF NOT EXISTS archive.{table} AS
+            SELECT * FROM main.{table} WHERE 0
+        ''')
+        main_columns = await self._table_columns(db, 'main', table)
+        archive_columns = set(await self._table_columns(db, 'archive', table))
+        for column in main_columns:
+            if column not in archive_columns:
+                await db.execute(f'ALTER TABLE archive.{table} ADD COLUMN {column}')
+    
+    async def _migrate_timestamps(self, db: aiosqlite.Connection, 
+                                  schema: str, tables: Sequence[str]):
+        """Перевести время из текста 'YYYY-MM-DD HH:MM:SS' в unix time
+        
+        Выполняется один раз для каждого файла базы (PRAGMA user_version).
+        """
+        cursor = await db.execute(f'PRAGMA {schema}.user_version')
+        if (await cursor.fetchone())[0] >= SCHEMA_VERSION:
+            return
+        for table in tables:
+            columns = await self._table_columns(db, schema, table)
+            for column in _TIMESTAMP_COLUMNS[table]:
+                if column in columns:
+                    await db.execute(f'''
+                        UPDATE {schema}.{table}
+                        SET {column} = CAST(strftime('%s', {column}) AS INTEGER)
+                        WHERE typeof({column}) = 'text' AND {column} <> ''
+                    ''')
+        await db.execute(f'PRAGMA {schema}.user_version = {SCHEMA_VERSION}')
     
     async def create_tables(self):
         """Создание таблиц в базе данных"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
+            # Освобождённое архивацией место возвращается постепенно
+            # (действует для новых баз)
+            await db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            # WAL: чтение не блокируется записью из других процессов
+            await db.execute('PRAGMA journal_mode = WAL')
+            
             # Таблица пользователей
-            await db.execute('''
+            await db.execute(f'''
                 CREATE TABLE IF NOT EXISTS users (
                     user_id INTEGER PRIMARY KEY,
                     username TEXT,
@@ -21,12 +129,13 @@ class Database:
                     last_name TEXT,
                     role TEXT DEFAULT 'client',
                     is_active BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    created_at INTEGER DEFAULT {_NOW_DEFAULT},
+                    updated_at INTEGER DEFAULT {_NOW_DEFAULT}
                 )
             ''')
             
             # Таблица обращений в поддержку
-            await db.execute('''
+            await db.execute(f'''
                 CREATE TABLE IF NOT EXISTS tickets (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id INTEGER,
@@ -36,54 +145,197 @@ class Database:
                     status TEXT DEFAULT 'new',
                     priority TEXT DEFAULT 'medium',
                     assigned_admin INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    created_at INTEGER DEFAULT {_NOW_DEFAULT},
+                    updated_at INTEGER DEFAULT {_NOW_DEFAULT},
+                    message_count INTEGER DEFAULT 0,
                     FOREIGN KEY (user_id) REFERENCES users (user_id),
                     FOREIGN KEY (assigned_admin) REFERENCES users (user_id)
                 )
             ''')
             
             # Таблица сообщений в обращениях
-            await db.execute('''
+            await db.execute(f'''
                 CREATE TABLE IF NOT EXISTS ticket_messages (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     ticket_id INTEGER,
                     user_id INTEGER,
                     message TEXT,
                     is_admin BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    created_at INTEGER DEFAULT {_NOW_DEFAULT},
                     FOREIGN KEY (ticket_id) REFERENCES tickets (id),
                     FOREIGN KEY (user_id) REFERENCES users (user_id)
                 )
             ''')
             
+            # Водяные знаки инкрементальных выгрузок по потребителям
+            await db.execute(f'''
+                CREATE TABLE IF NOT EXISTS export_watermarks (
+                    consumer TEXT,
+                    entity TEXT,
+                    last_updated_at INTEGER,
+                    last_id INTEGER,
+                    updated_at INTEGER DEFAULT {_NOW_DEFAULT},
+                    PRIMARY KEY (consumer, entity)
+                )
+            ''')
+            
+            # Состояния FSM (незавершённые диалоги переживают перезапуск)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS fsm_states (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT,
+                    updated_at REAL
+                )
+            ''')
+            
+            # Обработанные обновления Telegram (защита от повторной доставки)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS processed_updates (
+                    update_id INTEGER PRIMARY KEY,
+                    processed_at INTEGER
+                )
+            ''')
+            
+            # Миграции старых баз
+            if await self._add_column_if_missing(db, 'users', 'updated_at', 'INTEGER'):
+                await db.execute('UPDATE users SET updated_at = created_at')
+            await self._add_column_if_missing(db, 'tickets', 'idempotency_key', 'TEXT')
+            await self._add_column_if_missing(db, 'ticket_messages', 'idempotency_key', 'TEXT')
+            if await self._add_column_if_missing(db, 'tickets', 'message_count', 'INTEGER DEFAULT 0'):
+                await db.execute('''
+                    UPDATE tickets SET message_count = (
+                        SELECT COUNT(*) FROM ticket_messages tm WHERE tm.ticket_id = tickets.id
+                    )
+                ''')
+            await self._migrate_timestamps(db, 'main', list(_TIMESTAMP_COLUMNS))
+            
+            # Индексы для фоновых задач (выборки по статусу и давности)
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_tickets_status_updated
+                ON tickets (status, updated_at)
+            ''')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_ticket_messages_ticket
+                ON ticket_messages (ticket_id, created_at)
+            ''')
+            # Последние сообщения и постраничная история переписки
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_ticket_messages_ticket_id
+                ON ticket_messages (ticket_id, id)
+            ''')
+            
+            # Покрывающие индексы списков: строки таблицы при выводе не читаются
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_tickets_queue
+                ON tickets (status, created_at, user_id, priority, subject)
+            ''')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_tickets_user_list
+                ON tickets (user_id, created_at, status, subject)
+            ''')
+            
+            # Индексы для инкрементальных выгрузок
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_tickets_updated
+                ON tickets (updated_at, id)
+            ''')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_updated
+                ON users (updated_at, user_id)
+            ''')
+            
+            # Ключи идемпотентности: одно действие пользователя - одна запись
+            await db.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_tickets_idempotency
+                ON tickets (idempotency_key) WHERE idempotency_key IS NOT NULL
+            ''')
+            await db.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_ticket_messages_idempotency
+                ON ticket_messages (idempotency_key) WHERE idempotency_key IS NOT NULL
+            ''')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_processed_updates_time
+                ON processed_updates (processed_at)
+            ''')
+            
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_fsm_states_updated
+                ON fsm_states (updated_at)
+            ''')
+            
+            await db.commit()
+            
+            # Архив закрытых обращений в отдельном файле
+            await self._attach_archive(db)
+            await db.execute('PRAGMA archive.journal_mode = WAL')
+            await self._sync_archive_table(db, 'tickets')
+            await self._sync_archive_table(db, 'ticket_messages')
+            await db.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_archive_tickets_id
+                ON tickets (id)
+            ''')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS archive.idx_archive_tickets_user
+                ON tickets (user_id)
+            ''')
+            await db.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_archive_messages_id
+                ON ticket_messages (id)
+            ''')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS archive.idx_archive_messages_ticket
+                ON ticket_messages (ticket_id, created_at)
+            ''')
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS archive.idx_archive_messages_ticket_id
+                ON ticket_messages (ticket_id, id)
+            ''')
+            # Счётчик сообщений у обращений, заархивированных до его появления
+            await db.execute('''
+                UPDATE archive.tickets SET message_count = (
+                    SELECT COUNT(*) FROM archive.ticket_messages tm
+                    WHERE tm.ticket_id = archive.tickets.id
+                )
+                WHERE message_count IS NULL
+            ''')
+            await self._migrate_timestamps(db, 'archive', ('tickets', 'ticket_messages'))
             await db.commit()
     
     async def add_user(self, user_id: int, username: str = None, 
                       first_name: str = None, last_name: str = None):
         """Добавление пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute('''
                 INSERT OR REPLACE INTO users 
-                (user_id, username, first_name, last_name) 
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, username, first_name, last_name))
+                (user_id, username, first_name, last_name, created_at, updated_at) 
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, username, first_name, last_name, unix_now(), unix_now()))
             await db.commit()
+        self.user_cache.invalidate(user_id)
     
-    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+    async def get_user(self, user_id: int) -> Optional[User]:
         """Получение пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        found, user = self.user_cache.get(user_id)
+        if found:
+            return user
+        
+        version = self.user_cache.version(user_id)
+        async with self._connect() as db:
             cursor = await db.execute(
-                'SELECT * FROM users WHERE user_id = ?', (user_id,)
+                f'SELECT {USER_COLUMNS} FROM users WHERE user_id = ?', (user_id,)
             )
             row = await cursor.fetchone()
-            return dict(row) if row else None
+        if not row:
+            return None
+        user = User._make(row)
+        self.user_cache.put(user_id, user, version)
+        return user
     
     async def get_user_role(self, user_id: int) -> str:
         """Получение роли пользователя"""
         user = await self.get_user(user_id)
-        return user.get('role', 'client') if user else 'client'
+        return user.role if user else 'client'
     
     async def set_user_role(self, user_id: int, role: str):
         """Установка роли пользователя"""
@@ -91,12 +343,13 @@ class Database:
         if role not in valid_roles:
             raise ValueError(f"Invalid role. Must be one of: {valid_roles}")
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute(
-                'UPDATE users SET role = ? WHERE user_id = ?',
-                (role, user_id)
+                'UPDATE users SET role = ?, updated_at = ? WHERE user_id = ?',
+                (role, unix_now(), user_id)
             )
             await db.commit()
+        self.user_cache.invalidate(user_id)
     
     async def is_admin(self, user_id: int) -> bool:
         """Проверка является ли пользователь админом"""
@@ -118,121 +371,207 @@ class Database:
         role = 'admin' if is_admin else 'client'
         await self.set_user_role(user_id, role)
     
-    async def get_agents(self) -> List[Dict[str, Any]]:
+    async def get_agents(self) -> List[User]:
         """Получение списка агентов"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute(
-                "SELECT * FROM users WHERE role = 'agent' AND is_active = TRUE"
+                f"SELECT {USER_COLUMNS} FROM users WHERE role = 'agent' AND is_active = TRUE"
             )
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            return [User._make(row) for row in await cursor.fetchall()]
     
-    async def get_admins(self) -> List[Dict[str, Any]]:
+    async def get_admins(self) -> List[User]:
         """Получение списка администраторов"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connect() as db:
             cursor = await db.execute(
-                "SELECT * FROM users WHERE role = 'admin' AND is_active = TRUE"
+                f"SELECT {USER_COLUMNS} FROM users WHERE role = 'admin' AND is_active = TRUE"
             )
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            return [User._make(row) for row in await cursor.fetchall()]
     
     async def create_ticket(self, user_id: int, category: str, 
-                           subject: str, description: str) -> int:
-        """Создание нового обращения"""
-        async with aiosqlite.connect(self.db_path) as db:
+                           subject: str, description: str,
+                           idempotency_key: str = None) -> int:
+        """Создание нового обращения
+        
+        Повторный вызов с тем же idempotency_key не создаёт новое
+        обращение, а возвращает ID уже созданного.
+        """
+        now = unix_now()
+        async with self._connect() as db:
             cursor = await db.execute('''
-                INSERT INTO tickets (user_id, category, subject, description)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, category, subject, description))
+                INSERT INTO tickets (user_id, category, subject, description, 
+                                     idempotency_key, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+            ''', (user_id, category, subject, description, idempotency_key, now, now))
             await db.commit()
-            return cursor.lastrowid
+            if cursor.rowcount:
+                return cursor.lastrowid
+            
+            cursor = await db.execute(
+                'SELECT id FROM tickets WHERE idempotency_key = ?', (idempotency_key,)
+            )
+            return (await cursor.fetchone())[0]
     
     async def get_user_tickets(self, user_id: int, limit: int = 10, 
-                              offset: int = 0) -> List[Dict[str, Any]]:
-        """Получение обращений пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('''
-                SELECT * FROM tickets 
+                              offset: int = 0) -> List[Ticket]:
+        """Получение обращений пользователя (без описания)"""
+        async with self._connect() as db:
+            cursor = await db.execute(f'''
+                SELECT {TICKET_SUMMARY_COLUMNS} FROM tickets 
                 WHERE user_id = ? 
                 ORDER BY created_at DESC 
                 LIMIT ? OFFSET ?
             ''', (user_id, limit, offset))
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            return [Ticket._make(row) for row in await cursor.fetchall()]
     
-    async def get_ticket(self, ticket_id: int) -> Optional[Dict[str, Any]]:
-        """Получение обращения по ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+    async def count_user_tickets(self, user_id: int) -> int:
+        """Количество обращений пользователя"""
+        async with self._connect() as db:
+            cursor = await db.execute(
+                'SELECT COUNT(*) FROM tickets WHERE user_id = ?', (user_id,)
+            )
+            return (await cursor.fetchone())[0]
+    
+    async def get_ticket(self, ticket_id: int, 
+                         include_archived: bool = False) -> Optional[Ticket]:
+        """Получение обращения по ID
+        
+        С include_archived=True обращение ищется и в архиве,
+        у архивных обращений поле archived равно True.
+        """
+        found, ticket = self.ticket_cache.get(ticket_id)
+        if found:
+            if ticket.archived and not include_archived:
+                return None
+            return ticket
+        
+        version = self.ticket_cache.version(ticket_id)
+        async with self._connect() as db:
             cursor = await db.execute(
-                'SELECT * FROM tickets WHERE id = ?', (ticket_id,)
+                f'SELECT {TICKET_COLUMNS} FROM tickets WHERE id = ?', (ticket_id,)
             )
             row = await cursor.fetchone()
-            return dict(row) if row else None
+            if not row and include_archived:
+                await self._attach_archive(db)
+                cursor = await db.execute(f'''
+                    SELECT {select_list(Ticket, archived='TRUE')}
+                    FROM archive.tickets WHERE id = ?
+                ''', (ticket_id,))
+                row = await cursor.fetchone()
+        
+        if not row:
+            return None
+        ticket = Ticket._make(row)
+        self.ticket_cache.put(ticket_id, ticket, version)
+        return ticket
     
     async def update_ticket_status(self, ticket_id: int, status: str, 
                                   admin_id: int = None):
         """Обновление статуса обращения"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             if admin_id:
                 await db.execute('''
                     UPDATE tickets 
-                    SET status = ?, assigned_admin = ?, updated_at = CURRENT_TIMESTAMP
+                    SET status = ?, assigned_admin = ?, updated_at = ?
                     WHERE id = ?
-                ''', (status, admin_id, ticket_id))
+                ''', (status, admin_id, unix_now(), ticket_id))
             else:
                 await db.execute('''
                     UPDATE tickets 
-                    SET status = ?, updated_at = CURRENT_TIMESTAMP
+                    SET status = ?, updated_at = ?
                     WHERE id = ?
-                ''', (status, ticket_id))
+                ''', (status, unix_now(), ticket_id))
             await db.commit()
+        self.ticket_cache.invalidate(ticket_id)
     
     async def add_ticket_message(self, ticket_id: int, user_id: int, 
-                                message: str, is_admin: bool = False):
-        """Добавление сообщения к обращению"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                INSERT INTO ticket_messages (ticket_id, user_id, message, is_admin)
-                VALUES (?, ?, ?, ?)
-            ''', (ticket_id, user_id, message, is_admin))
+                                message: str, is_admin: bool = False,
+                                idempotency_key: str = None) -> bool:
+        """Добавление сообщения к обращению
+        
+        Возвращает False, если сообщение с таким idempotency_key уже есть.
+        """
+        async with self._connect() as db:
+            cursor = await db.execute('''
+                INSERT INTO ticket_messages (ticket_id, user_id, message, is_admin, 
+                                             idempotency_key, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+            ''', (ticket_id, user_id, message, is_admin, idempotency_key, unix_now()))
+            added = cursor.rowcount > 0
+            if added:
+                await db.execute(
+                    'UPDATE tickets SET message_count = message_count + 1 WHERE id = ?',
+                    (ticket_id,)
+                )
             await db.commit()
+        if added:
+            self.ticket_cache.invalidate(ticket_id)
+        return added
     
-    async def get_ticket_messages(self, ticket_id: int) -> List[Dict[str, Any]]:
-        """Получение сообщений обращения"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('''
-                SELECT tm.*, u.first_name, u.username
-                FROM ticket_messages tm
-                JOIN users u ON tm.user_id = u.user_id
-                WHERE tm.ticket_id = ?
-                ORDER BY tm.created_at ASC
-            ''', (ticket_id,))
+    async def get_ticket_messages(self, ticket_id: int, 
+                                  include_archived: bool = False,
+                                  last_n: int = None,
+                                  before_id: int = None,
+                                  after_id: int = None) -> List[TicketMessage]:
+        """Получение сообщений обращения в порядке отправки
+        
+        last_n - только последние N сообщений, before_id - только сообщения
+        старше указанного (предыдущая страница истории). С after_id
+        возвращаются первые N сообщений новее указанного (следующая страница).
+        """
+        conditions = 'tm.ticket_id = ?'
+        params = [ticket_id]
+        if before_id is not None:
+            conditions += ' AND tm.id < ?'
+            params.append(before_id)
+        if after_id is not None:
+            conditions += ' AND tm.id > ?'
+            params.append(after_id)
+        order = 'ASC' if after_id is not None else 'DESC'
+        limit = ''
+        if last_n is not None:
+            limit = 'LIMIT ?'
+            params.append(last_n)
+        
+        query = f'''
+            SELECT {MESSAGE_COLUMNS}
+            FROM {{schema}}ticket_messages tm
+            JOIN users u ON tm.user_id = u.user_id
+            WHERE {conditions}
+            ORDER BY tm.id {order}
+            {limit}
+        '''
+        async with self._connect() as db:
+            cursor = await db.execute(query.format(schema=''), params)
             rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            if not rows and include_archived:
+                await self._attach_archive(db)
+                cursor = await db.execute(query.format(schema='archive.'), params)
+                rows = await cursor.fetchall()
+        # Без after_id читаются с конца по индексу (ticket_id, id), отдаются по порядку
+        if order == 'DESC':
+            rows = reversed(rows)
+        return [TicketMessage._make(row) for row in rows]
     
-    async def get_pending_tickets(self, limit: int = 20) -> List[Dict[str, Any]]:
-        """Получение необработанных обращений для админов"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('''
-                SELECT t.*, u.first_name, u.username
+    async def get_pending_tickets(self, limit: int = 20,
+                                  statuses: Sequence[str] = ('new', 'in_progress')) -> List[Ticket]:
+        """Получение очереди обращений с заданными статусами (без описания)"""
+        placeholders = ','.join('?' * len(statuses))
+        async with self._connect() as db:
+            cursor = await db.execute(f'''
+                SELECT {TICKET_LIST_COLUMNS}
                 FROM tickets t
                 JOIN users u ON t.user_id = u.user_id
-                WHERE t.status IN ('new', 'in_progress')
+                WHERE t.status IN ({placeholders})
                 ORDER BY t.created_at DESC
                 LIMIT ?
-            ''', (limit,))
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            ''', (*statuses, limit))
+            return [Ticket._make(row) for row in await cursor.fetchall()]
     
     async def get_ticket_stats(self) -> Dict[str, int]:
         """Получение статистики обращений"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             stats = {}
             
             # Общее количество обращений
@@ -253,29 +592,28 @@ class Database:
     
     async def update_ticket_priority(self, ticket_id: int, priority: str):
         """Обновление приоритета обращения"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute('''
                 UPDATE tickets 
-                SET priority = ?, updated_at = CURRENT_TIMESTAMP
+                SET priority = ?, updated_at = ?
                 WHERE id = ?
-            ''', (priority, ticket_id))
+            ''', (priority, unix_now(), ticket_id))
             await db.commit()
+        self.ticket_cache.invalidate(ticket_id)
     
-    async def get_all_users(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+    async def get_all_users(self, limit: int = 100, offset: int = 0) -> List[User]:
         """Получение списка всех пользователей"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('''
-                SELECT * FROM users 
+        async with self._connect() as db:
+            cursor = await db.execute(f'''
+                SELECT {USER_COLUMNS} FROM users 
                 ORDER BY created_at DESC 
                 LIMIT ? OFFSET ?
             ''', (limit, offset))
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            return [User._make(row) for row in await cursor.fetchall()]
     
     async def count_users_by_role(self, role: str) -> int:
         """Подсчет пользователей по роли"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             cursor = await db.execute(
                 'SELECT COUNT(*) FROM users WHERE role = ? AND is_active = TRUE',
                 (role,)
@@ -284,50 +622,427 @@ class Database:
     
     async def count_total_users(self) -> int:
         """Подсчет общего количества пользователей"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             cursor = await db.execute('SELECT COUNT(*) FROM users WHERE is_active = TRUE')
             return (await cursor.fetchone())[0]
     
-    async def get_closed_tickets(self, limit: int = 20) -> List[Dict[str, Any]]:
-        """Получение закрытых обращений"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('''
-                SELECT t.*, u.first_name, u.username
+    async def get_closed_tickets(self, limit: int = 20) -> List[Ticket]:
+        """Получение закрытых обращений (без описания)"""
+        async with self._connect() as db:
+            cursor = await db.execute(f'''
+                SELECT {TICKET_LIST_COLUMNS}
                 FROM tickets t
                 JOIN users u ON t.user_id = u.user_id
                 WHERE t.status IN ('resolved', 'closed')
                 ORDER BY t.updated_at DESC
                 LIMIT ?
             ''', (limit,))
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            return [Ticket._make(row) for row in await cursor.fetchall()]
 
-    async def get_all_tickets(self, limit: int = 100) -> List[Dict[str, Any]]:
+    async def get_all_tickets(self, limit: int = 100, 
+                              include_archived: bool = False) -> List[Ticket]:
         """Получить все обращения для экспорта"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('''
-                SELECT t.*, u.username, u.first_name, u.last_name
-                FROM tickets t
+        async with self._connect() as db:
+            if include_archived:
+                await self._attach_archive(db)
+                columns = ', '.join(await self._table_columns(db, 'main', 'tickets'))
+                source = f'''(
+                    SELECT {columns}, FALSE AS archived FROM main.tickets
+                    UNION ALL
+                    SELECT {columns}, TRUE AS archived FROM archive.tickets
+                )'''
+            else:
+                source = 'tickets'
+            
+            archived = 't.archived' if include_archived else 'FALSE'
+            cursor = await db.execute(f'''
+                SELECT {select_list(Ticket, 't', first_name='u.first_name',
+                                    username='u.username', archived=archived)}
+                FROM {source} t
                 LEFT JOIN users u ON t.user_id = u.user_id
                 ORDER BY t.created_at DESC
                 LIMIT ?
             ''', (limit,))
+            return [Ticket._make(row) for row in await cursor.fetchall()]
+
+    async def _stream_rows(self, query: str, params: tuple = (),
+                           attach_archive: bool = False) -> AsyncIterator[List[tuple]]:
+        """Читать результат запроса пачками по EXPORT_CHUNK_SIZE строк"""
+        async with self._connect() as db:
+            if attach_archive:
+                await self._attach_archive(db)
+            async with db.execute(query, params) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(EXPORT_CHUNK_SIZE)
+                    if not rows:
+                        break
+                    yield rows
+
+    def stream_tickets(self, include_archived: bool = True) -> AsyncIterator[List[tuple]]:
+        """Все обращения для экспорта пачками кортежей
+        
+        Колонки: id, user_id, username, first_name, category, subject,
+        description, status, priority, assigned_admin, created_at,
+        updated_at, archived
+        """
+        columns = '''id, user_id, category, subject, description, status,
+                     priority, assigned_admin, created_at, updated_at'''
+        if include_archived:
+            source = f'''(
+                SELECT {columns}, FALSE AS archived FROM main.tickets
+                UNION ALL
+                SELECT {columns}, TRUE AS archived FROM archive.tickets
+            )'''
+        else:
+            source = f'(SELECT {columns}, FALSE AS archived FROM main.tickets)'
+        
+        return self._stream_rows(f'''
+            SELECT t.id, t.user_id, u.username, u.first_name, t.category, t.subject,
+                   t.description, t.status, t.priority, t.assigned_admin,
+                   t.created_at, t.updated_at, t.archived
+            FROM {source} t
+            LEFT JOIN users u ON t.user_id = u.user_id
+            ORDER BY t.id
+        ''', attach_archive=include_archived)
+
+    def stream_ticket_messages(self, include_archived: bool = True) -> AsyncIterator[List[tuple]]:
+        """Все сообщения обращений для экспорта пачками кортежей
+        
+        Колонки: id, ticket_id, user_id, is_admin, created_at, message, archived
+        """
+        columns = 'id, ticket_id, user_id, is_admin, created_at, message'
+        if include_archived:
+            query = f'''
+                SELECT {columns}, FALSE AS archived FROM main.ticket_messages
+                UNION ALL
+                SELECT {columns}, TRUE AS archived FROM archive.ticket_messages
+                ORDER BY id
+            '''
+        else:
+            query = f'SELECT {columns}, FALSE AS archived FROM ticket_messages ORDER BY id'
+        return self._stream_rows(query, attach_archive=include_archived)
+
+    def stream_ticket_transcript(self, ticket_id: int,
+                                 archived: bool = False) -> AsyncIterator[List[tuple]]:
+        """Переписка одного обращения пачками кортежей в порядке отправки
+        
+        Колонки: id, is_admin, created_at, message, first_name, username
+        """
+        schema = 'archive.' if archived else 'main.'
+        return self._stream_rows(f'''
+            SELECT tm.id, tm.is_admin, tm.created_at, tm.message, u.first_name, u.username
+            FROM {schema}ticket_messages tm
+            LEFT JOIN users u ON tm.user_id = u.user_id
+            WHERE tm.ticket_id = ?
+            ORDER BY tm.id
+        ''', (ticket_id,), attach_archive=archived)
+
+    def stream_users(self) -> AsyncIterator[List[tuple]]:
+        """Все пользователи для экспорта пачками кортежей
+        
+        Колонки: user_id, username, first_name, last_name, role, is_active,
+        created_at, updated_at
+        """
+        return self._stream_rows('''
+            SELECT user_id, username, first_name, last_name, role, is_active,
+                   created_at, updated_at
+            FROM users
+            ORDER BY user_id
+        ''')
+
+    def stream_tickets_since(self, since_updated_at: int, since_id: int,
+                             until: int) -> AsyncIterator[List[tuple]]:
+        """Обращения, изменённые после водяного знака (updated_at, id)
+        
+        Колонки как в stream_tickets, порядок по (updated_at, id).
+        """
+        return self._stream_rows('''
+            SELECT t.id, t.user_id, u.username, u.first_name, t.category, t.subject,
+                   t.description, t.status, t.priority, t.assigned_admin,
+                   t.created_at, t.updated_at, FALSE AS archived
+            FROM tickets t
+            LEFT JOIN users u ON t.user_id = u.user_id
+            WHERE (t.updated_at > ? OR (t.updated_at = ? AND t.id > ?))
+              AND t.updated_at <= ?
+            ORDER BY t.updated_at, t.id
+        ''', (since_updated_at, since_updated_at, since_id, until))
+
+    def stream_ticket_messages_since(self, since_id: int) -> AsyncIterator[List[tuple]]:
+        """Сообщения с id больше водяного знака (сообщения не изменяются)"""
+        return self._stream_rows('''
+            SELECT id, ticket_id, user_id, is_admin, created_at, message, FALSE AS archived
+            FROM ticket_messages
+            WHERE id > ?
+            ORDER BY id
+        ''', (since_id,))
+
+    def stream_users_since(self, since_updated_at: int, since_id: int,
+                           until: int) -> AsyncIterator[List[tuple]]:
+        """Пользователи, изменённые после водяного знака (updated_at, user_id)
+        
+        Колонки как в stream_users.
+        """
+        return self._stream_rows('''
+            SELECT user_id, username, first_name, last_name, role, is_active,
+                   created_at, updated_at
+            FROM users
+            WHERE (updated_at > ? OR (updated_at = ? AND user_id > ?))
+              AND updated_at <= ?
+            ORDER BY updated_at, user_id
+        ''', (since_updated_at, since_updated_at, since_id, until))
+
+    def get_delta_upper_bound(self) -> int:
+        """Верхняя граница выгрузки изменений
+        
+        Текущая секунда исключается: в ней ещё могут появиться записи
+        с тем же updated_at, которые иначе были бы пропущены.
+        """
+        return unix_now() - 1
+
+    async def get_export_watermark(self, consumer: str, entity: str) -> Dict[str, Any]:
+        """Получить водяной знак выгрузки для потребителя"""
+        async with self._connect() as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute('''
+                SELECT CAST(last_updated_at AS INTEGER) AS last_updated_at, last_id
+                FROM export_watermarks
+                WHERE consumer = ? AND entity = ?
+            ''', (consumer, entity))
+            row = await cursor.fetchone()
+            return dict(row) if row else {'last_updated_at': 0, 'last_id': 0}
+
+    async def set_export_watermark(self, consumer: str, entity: str,
+                                   last_updated_at: int, last_id: int):
+        """Сохранить водяной знак выгрузки для потребителя"""
+        async with self._connect() as db:
+            await db.execute('''
+                INSERT INTO export_watermarks (consumer, entity, last_updated_at, last_id, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (consumer, entity) DO UPDATE SET
+                    last_updated_at = excluded.last_updated_at,
+                    last_id = excluded.last_id,
+                    updated_at = excluded.updated_at
+            ''', (consumer, entity, last_updated_at, last_id, unix_now()))
+            await db.commit()
+
+    async def archive_closed_tickets(self, older_than_days: int, 
+                                     batch_size: int = 200) -> int:
+        """Перенести пачку давно закрытых обращений и их сообщений в архив
+        
+        Перенос идёт в две транзакции: сначала копия в архив, затем
+        удаление из основной базы. Одна транзакция на две подключённые
+        базы в режиме WAL не атомарна: при сбое строки могли бы удалиться
+        из основной базы, так и не сохранившись в архиве. После сбоя между
+        транзакциями повторный запуск просто заменит копию (INSERT OR REPLACE).
+        Удаляются только обращения, которые не изменились с момента копии,
+        копии остальных удаляются из архива в той же транзакции.
+        
+        Возвращает количество перенесённых обращений.
+        """
+        async with self._connect() as db:
+            await self._attach_archive(db)
+            ticket_columns = ', '.join(await self._table_columns(db, 'main', 'tickets'))
+            message_columns = ', '.join(
+                await self._table_columns(db, 'main', 'ticket_messages')
+            )
             
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            await db.execute('BEGIN IMMEDIATE')
+            cursor = await db.execute('''
+                SELECT id FROM main.tickets
+                WHERE status = 'closed'
+                  AND updated_at < ?
+                ORDER BY updated_at
+                LIMIT ?
+            ''', (days_ago(older_than_days), batch_size))
+            ticket_ids = [row[0] for row in await cursor.fetchall()]
+            if not ticket_ids:
+                await db.commit()
+                return 0
+            
+            placeholders = ','.join('?' * len(ticket_ids))
+            await db.execute(f'''
+                INSERT OR REPLACE INTO archive.tickets ({ticket_columns})
+                SELECT {ticket_columns} FROM main.tickets WHERE id IN ({placeholders})
+            ''', ticket_ids)
+            await db.execute(f'''
+                INSERT OR REPLACE INTO archive.ticket_messages ({message_columns})
+                SELECT {message_columns} FROM main.ticket_messages 
+                WHERE ticket_id IN ({placeholders})
+            ''', ticket_ids)
+            await db.commit()
+            
+            await db.execute('BEGIN IMMEDIATE')
+            # Между транзакциями обращение могли переоткрыть или дописать
+            cursor = await db.execute(f'''
+                SELECT t.id FROM main.tickets t
+                JOIN archive.tickets a ON a.id = t.id
+                WHERE t.id IN ({placeholders})
+                  AND t.status = 'closed'
+                  AND t.updated_at IS a.updated_at
+                  AND t.message_count IS a.message_count
+            ''', ticket_ids)
+            archived_ids = [row[0] for row in await cursor.fetchall()]
+            archived = set(archived_ids)
+            # Копии изменившихся обращений убираем, иначе выборки с архивом
+            # (UNION ALL) вернут такие обращения дважды
+            for schema, ids in (('main', archived_ids),
+                                ('archive', [i for i in ticket_ids if i not in archived])):
+                if not ids:
+                    continue
+                placeholders = ','.join('?' * len(ids))
+                await db.execute(
+                    f'DELETE FROM {schema}.ticket_messages WHERE ticket_id IN ({placeholders})',
+                    ids
+                )
+                await db.execute(
+                    f'DELETE FROM {schema}.tickets WHERE id IN ({placeholders})',
+                    ids
+                )
+            await db.commit()
+        self.ticket_cache.invalidate_many(ticket_ids)
+        return len(archived_ids)
+
+    async def get_fsm_record(self, key: str) -> Optional[Dict[str, Any]]:
+        """Получить сохранённое состояние FSM по ключу"""
+        async with self._connect() as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(
+                'SELECT state, data, updated_at FROM fsm_states WHERE key = ?', (key,)
+            )
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+    async def save_fsm_records(self, records: List[tuple], deleted: List[str]):
+        """Записать пачку состояний FSM одной транзакцией
+        
+        records - кортежи (key, state, data, updated_at), deleted - ключи
+        пустых состояний, которые больше не нужно хранить.
+        """
+        async with self._connect() as db:
+            if records:
+                await db.executemany('''
+                    INSERT INTO fsm_states (key, state, data, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        state = excluded.state,
+                        data = excluded.data,
+                        updated_at = excluded.updated_at
+                ''', records)
+            if deleted:
+                await db.executemany(
+                    'DELETE FROM fsm_states WHERE key = ?', [(key,) for key in deleted]
+                )
+            await db.commit()
+
+    async def delete_expired_fsm_records(self, older_than: float) -> int:
+        """Удалить состояния FSM, не менявшиеся с момента older_than (unix time)"""
+        async with self._connect() as db:
+            cursor = await db.execute(
+                'DELETE FROM fsm_states WHERE updated_at < ?', (older_than,)
+            )
+            await db.commit()
+            return cursor.rowcount
+
+    async def mark_updates_processed(self, update_ids: Sequence[int]):
+        """Отметить пачку обновлений как обработанные одной транзакцией"""
+        processed_at = unix_now()
+        async with self._connect() as db:
+            await db.executemany('''
+                INSERT OR IGNORE INTO processed_updates (update_id, processed_at)
+                VALUES (?, ?)
+            ''', [(update_id, processed_at) for update_id in update_ids])
+            await db.commit()
+    
+    async def get_recent_processed_updates(self, limit: int) -> List[int]:
+        """id последних обработанных обновлений, от старых к новым"""
+        async with self._connect() as db:
+            cursor = await db.execute(
+                'SELECT update_id FROM processed_updates ORDER BY update_id DESC LIMIT ?',
+                (limit,)
+            )
+            return [row[0] for row in reversed(await cursor.fetchall())]
+
+    async def delete_expired_processed_updates(self, older_than: int) -> int:
+        """Удалить отметки об обновлениях старше older_than (unix time)"""
+        async with self._connect() as db:
+            cursor = await db.execute(
+                'DELETE FROM processed_updates WHERE processed_at < ?', (older_than,)
+            )
+            await db.commit()
+            return cursor.rowcount
+
+    async def reclaim_free_pages(self, pages: int = 1000):
+        """Вернуть системе освободившиеся страницы основной базы"""
+        async with self._connect() as db:
+            await db.execute(f'PRAGMA incremental_vacuum({int(pages)})')
+            await db.commit()
+
+    async def close_stale_tickets(self, status: str, older_than_days: int,
+                                  batch_size: int = 100) -> List[Ticket]:
+        """Закрыть пачку обращений, которые находятся в статусе дольше срока
+        
+        Для 'waiting_response' закрываются только обращения, в которых
+        последнее сообщение - ответ поддержки старше срока (клиент на него
+        не ответил). updated_at для этого не годится: его сдвигают и
+        сообщение клиента, и любые правки сотрудников (приоритет, статус).
+        Возвращает закрытые обращения.
+        """
+        cutoff = days_ago(older_than_days)
+        params = [status, cutoff]
+        if status == 'waiting_response':
+            # Последнее сообщение читается по индексу (ticket_id, id)
+            no_reply_clause = '''
+                AND EXISTS (
+                    SELECT 1 FROM (
+                        SELECT tm.is_admin, tm.created_at FROM ticket_messages tm
+                        WHERE tm.ticket_id = t.id
+                        ORDER BY tm.id DESC
+                        LIMIT 1
+                    ) last_message
+                    WHERE last_message.is_admin AND last_message.created_at < ?
+                )
+            '''
+            params.append(cutoff)
+        else:
+            no_reply_clause = ''
+        params.append(batch_size)
+        
+        async with self._connect() as db:
+            # Блокируем запись сразу, чтобы выборка и обновление были атомарны
+            await db.execute('BEGIN IMMEDIATE')
+            cursor = await db.execute(f'''
+                SELECT {TICKET_SUMMARY_COLUMNS}
+                FROM tickets t
+                WHERE t.status = ?
+                  AND t.updated_at < ?
+                  {no_reply_clause}
+                ORDER BY t.updated_at
+                LIMIT ?
+            ''', params)
+            tickets = [Ticket._make(row) for row in await cursor.fetchall()]
+            
+            if tickets:
+                placeholders = ','.join('?' * len(tickets))
+                await db.execute(f'''
+                    UPDATE tickets 
+                    SET status = 'closed', updated_at = ?
+                    WHERE id IN ({placeholders})
+                ''', [unix_now(), *(ticket.id for ticket in tickets)])
+            await db.commit()
+        self.ticket_cache.invalidate_many(ticket.id for ticket in tickets)
+        return tickets
 
     async def block_user(self, user_id: int) -> bool:
         """Заблокировать пользователя"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._connect() as db:
                 await db.execute('''
                     UPDATE users 
-                    SET is_active = FALSE 
+                    SET is_active = FALSE, updated_at = ? 
                     WHERE user_id = ?
-                ''', (user_id,))
+                ''', (unix_now(), user_id))
                 await db.commit()
+            self.user_cache.invalidate(user_id)
             return True
         except Exception:
             return False
@@ -335,13 +1050,14 @@ class Database:
     async def unblock_user(self, user_id: int) -> bool:
         """Разблокировать пользователя"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._connect() as db:
                 await db.execute('''
                     UPDATE users 
-                    SET is_active = TRUE 
+                    SET is_active = TRUE, updated_at = ? 
                     WHERE user_id = ?
-                ''', (user_id,))
+                ''', (unix_now(), user_id))
                 await db.commit()
+            self.user_cache.invalidate(user_id)
             return True
         except Exception:
             return False
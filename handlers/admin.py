@@ -1,29 +1,43 @@
 """Обработчики для администраторов"""
 
 import math
-from datetime import datetime
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 
 from keyboards.admin import (
     get_admin_panel, get_admin_tickets_keyboard, get_admin_ticket_actions,
     get_admin_stats_keyboard, get_admin_manage_keyboard, get_admin_search_keyboard,
-    get_confirm_action_keyboard, get_admin_quick_responses
+    get_confirm_action_keyboard, get_admin_quick_responses,
+    get_archived_ticket_keyboard, get_transcript_keyboard
 )
 from keyboards.user import get_cancel_keyboard, get_main_menu
+from keyboards.callback_data import (
+    AdminTicketCallback, AdminRespondCallback, AdminStatusCallback, AdminPriorityCallback,
+    SearchTicketCallback, QuickResponseCallback, TranscriptCallback, TranscriptExportCallback
+)
 from keyboards.reply import (
     get_admin_main_keyboard, get_admin_user_management_keyboard,
     get_cancel_keyboard as get_reply_cancel_keyboard, get_confirmation_keyboard
 )
 from database import db
+from models import Ticket
 from utils.texts import (
     ADMIN_TICKETS_MESSAGE, TICKET_DETAILS_MESSAGE, TICKET_CATEGORIES,
-    TICKET_STATUSES, TICKET_RESPONSE_MESSAGE, ERROR_MESSAGE, PERMISSION_DENIED
+    TICKET_STATUSES, TICKET_RESPONSE_MESSAGE, ERROR_MESSAGE, PERMISSION_DENIED,
+    ADMIN_MESSAGE_PREVIEW, TICKET_FOUND_MESSAGE, TRANSCRIPT_HEADER,
+    TRANSCRIPT_ENTRY, AGENT_LIST_ENTRY, SUPPORT_RESPONSE_NOTIFICATION
 )
 from handlers.common import AdminStates
-from config import ADMINS, TICKETS_PER_PAGE
+from config import ADMINS, TICKETS_PER_PAGE, TRANSCRIPT_PAGE_SIZE, TRANSCRIPT_MESSAGE_LIMIT
+from utils.dedup import callback_key, message_key
+from utils.dates import format_timestamp, local_now
+from utils.render_cache import edit_message
+from utils.render import edit_long_message, truncate
+from utils.templates import Markup, escape
+from utils.ticket_list import get_priority_emoji, get_status_emoji, render_ticket_list
+from utils.transcript import format_message_date, message_sender, write_transcript
 
 
 # Импорт функции проверки прав агентов
@@ -142,7 +156,7 @@ async def handle_admin_menu_button(message: Message):
     
     from utils.texts import ADMIN_PANEL_MESSAGE
     await message.answer(
-        ADMIN_PANEL_MESSAGE.format(stats=stats_text),
+        ADMIN_PANEL_MESSAGE.render(stats=Markup(stats_text)),
         reply_markup=get_admin_main_keyboard(),
         parse_mode="HTML"
     )
@@ -202,7 +216,7 @@ async def process_admin_search(message: Message, state: FSMContext):
     
     try:
         ticket_id = int(message.text.strip())
-        ticket = await db.get_ticket(ticket_id)
+        ticket = await db.get_ticket(ticket_id, include_archived=True)
         
         if not ticket:
             user_role = await db.get_user_role(message.from_user.id)
@@ -228,31 +242,28 @@ async def process_admin_search(message: Message, state: FSMContext):
         )
 
 
-async def show_ticket_for_admin(message: Message, ticket: dict):
+async def show_ticket_for_admin(message: Message, ticket: Ticket):
     """Показать обращение админу"""
     try:
         # Получаем информацию о пользователе
-        user = await db.get_user(ticket['user_id'])
-        user_name = user['first_name'] if user else "Неизвестно"
-        
-        status_emoji = get_status_emoji(ticket['status'])
-        category_name = TICKET_CATEGORIES.get(ticket['category'], ticket['category'])
-        status_name = TICKET_STATUSES.get(ticket['status'], ticket['status'])
-        
-        created_at = datetime.fromisoformat(ticket['created_at']).strftime("%d.%m.%Y %H:%M")
-        
-        details_text = f"""
-🎫 <b>Найдено обращение #{ticket['id']}</b>
-
-👤 <b>Клиент:</b> {user_name}
-📋 <b>Тема:</b> {ticket['subject']}
-📂 <b>Категория:</b> {category_name}
-📊 <b>Статус:</b> {status_emoji} {status_name}
-⏰ <b>Создано:</b> {created_at}
-
-📝 <b>Описание:</b>
-{ticket['description'][:300]}...
-"""
+        user = await db.get_user(ticket.user_id)
+        user_name = user.first_name if user else "Неизвестно"
+        
+        status_emoji = get_status_emoji(ticket.status)
+        category_name = TICKET_CATEGORIES.get(ticket.category, ticket.category)
+        status_name = TICKET_STATUSES.get(ticket.status, ticket.status)
+        
+        created_at = format_timestamp(ticket.created_at)
+        
+        details_text = TICKET_FOUND_MESSAGE.render(
+            ticket=ticket,
+            user_name=user_name,
+            category=category_name,
+            status_emoji=status_emoji,
+            status=status_name,
+            created_at=created_at,
+            description=truncate(ticket.description, 300)
+        )
         
         await message.answer(
             details_text,
@@ -260,15 +271,20 @@ async def show_ticket_for_admin(message: Message, ticket: dict):
             parse_mode="HTML"
         )
         
+        # Архивные обращения доступны только для просмотра
+        if ticket.archived:
+            await message.answer("🗄 <i>Обращение находится в архиве.</i>", parse_mode="HTML")
+            return
+        
         # Показываем inline меню для действий с обращением
         from keyboards.admin import get_admin_ticket_actions
         user_role = await db.get_user_role(message.from_user.id)
         await message.answer(
             "🎯 <b>Действия с обращением:</b>",
             reply_markup=get_admin_ticket_actions(
-                ticket['id'], 
-                ticket['status'],
-                ticket.get('assigned_admin'),
+                ticket.id, 
+                ticket.status,
+                ticket.assigned_admin,
                 message.from_user.id,
                 user_role=user_role
             ),
@@ -296,12 +312,10 @@ async def show_admin_tickets(message: Message, ticket_type: str):
     """Показать обращения для админа"""
     try:
         if ticket_type == "new":
-            tickets = await db.get_pending_tickets(20)
-            tickets = [t for t in tickets if t['status'] == 'new']
+            tickets = await db.get_pending_tickets(20, statuses=('new',))
             title = "🆕 Новые обращения"
         elif ticket_type == "active":
-            tickets = await db.get_pending_tickets(20)
-            tickets = [t for t in tickets if t['status'] in ['in_progress', 'waiting_response']]
+            tickets = await db.get_pending_tickets(20, statuses=('in_progress', 'waiting_response'))
             title = "⏳ Активные обращения"
         else:  # closed
             tickets = []
@@ -311,17 +325,7 @@ async def show_admin_tickets(message: Message, ticket_type: str):
             message_text = f"<b>{title}</b>\n\n📭 Обращений не найдено."
             keyboard = get_admin_main_keyboard()
         else:
-            tickets_list = ""
-            for i, ticket in enumerate(tickets, 1):
-                status_emoji = get_status_emoji(ticket['status'])
-                priority_emoji = get_priority_emoji(ticket.get('priority', 'medium'))
-                user_name = ticket.get('first_name', 'Неизвестно')
-                created_date = datetime.fromisoformat(ticket['created_at']).strftime("%d.%m")
-                
-                tickets_list += f"{i}. {priority_emoji}{status_emoji} <b>#{ticket['id']}</b>\n"
-                tickets_list += f"   👤 {user_name} | 📅 {created_date}\n"
-                tickets_list += f"   📝 {ticket['subject'][:50]}...\n\n"
-            
+            tickets_list, ticket_buttons = render_ticket_list(tickets, staff=True)
             message_text = f"<b>{title}</b>\n\n{tickets_list}"
             keyboard = get_admin_main_keyboard()
         
@@ -337,7 +341,7 @@ async def show_admin_tickets(message: Message, ticket_type: str):
             user_role = await db.get_user_role(message.from_user.id)
             await message.answer(
                 "🎯 <b>Выберите обращение:</b>",
-                reply_markup=get_admin_tickets_keyboard(tickets, ticket_type, user_role),
+                reply_markup=get_admin_tickets_keyboard(ticket_buttons, ticket_type, user_role),
                 parse_mode="HTML"
             )
         
@@ -349,28 +353,6 @@ async def show_admin_tickets(message: Message, ticket_type: str):
         )
 
 
-def get_status_emoji(status: str) -> str:
-    """Получить эмодзи для статуса"""
-    emojis = {
-        'new': '🆕',
-        'in_progress': '⏳',
-        'waiting_response': '⏰',
-        'resolved': '✅',
-        'closed': '🔒'
-    }
-    return emojis.get(status, '❓')
-
-
-def get_priority_emoji(priority: str) -> str:
-    """Получить эмодзи для приоритета"""
-    emojis = {
-        'high': '🔴',
-        'medium': '🟡',
-        'low': '🟢'
-    }
-    return emojis.get(priority, '🟡')
-
-
 async def show_admin_stats_detailed(message: Message):
     """Показать детальную статистику для админа"""
     try:
@@ -392,7 +374,7 @@ async def show_admin_stats_detailed(message: Message):
 • Всего обращений: {stats.get('total', 0)}
 • Требуют внимания: {stats.get('status_new', 0) + stats.get('status_waiting_response', 0)}
 
-<i>Обновлено: {datetime.now().strftime('%d.%m.%Y %H:%M')}</i>
+<i>Обновлено: {local_now().strftime('%d.%m.%Y %H:%M')}</i>
 """
         
         await message.answer(
@@ -427,7 +409,7 @@ async def show_users_list(message: Message):
         for admin_id in ADMINS:
             user = await db.get_user(admin_id)
             if user:
-                name = user.get('first_name', 'Неизвестно')
+                name = user.first_name or 'Неизвестно'
                 users_text += f"• {name} (ID: {admin_id})\n"
         
         users_text += "\n<b>Агенты:</b>\n"
@@ -436,7 +418,7 @@ async def show_users_list(message: Message):
         agents = await db.get_agents()
         if agents:
             for agent in agents:
-                users_text += f"• {agent.get('first_name', 'Неизвестно')} (ID: {agent['user_id']})\n"
+                users_text += f"• {agent.first_name or 'Неизвестно'} (ID: {agent.user_id})\n"
         else:
             users_text += "• Агенты не назначены\n"
         
@@ -469,15 +451,16 @@ async def show_agents_list(message: Message):
 Используйте кнопку "➕ Добавить агента" для назначения.
 """
         else:
-            agents_text = "👨‍💼 <b>Список агентов</b>\n\n"
-            for i, agent in enumerate(agents, 1):
-                name = agent.get('first_name', 'Неизвестно')
-                username = f"@{agent['username']}" if agent.get('username') else "без username"
-                created = datetime.fromisoformat(agent['created_at']).strftime("%d.%m.%Y")
-                
-                agents_text += f"{i}. <b>{name}</b>\n"
-                agents_text += f"   ID: {agent['user_id']} | {username}\n"
-                agents_text += f"   Добавлен: {created}\n\n"
+            agents_text = "👨‍💼 <b>Список агентов</b>\n\n" + "".join(
+                AGENT_LIST_ENTRY.render(
+                    number=i,
+                    name=agent.first_name or 'Неизвестно',
+                    user_id=agent.user_id,
+                    username=f"@{agent.username}" if agent.username else "без username",
+                    created=format_timestamp(agent.created_at, "%d.%m.%Y")
+                )
+                for i, agent in enumerate(agents, 1)
+            )
         
         await message.answer(
             agents_text,
@@ -517,7 +500,7 @@ async def show_roles_statistics(message: Message):
 • Персонал поддержки: {admins_count + agents_count}
 • Активных пользователей: {total_users}
 
-<i>Последнее обновление: {datetime.now().strftime('%d.%m.%Y %H:%M')}</i>
+<i>Последнее обновление: {local_now().strftime('%d.%m.%Y %H:%M')}</i>
 """
         
         await message.answer(
@@ -575,12 +558,10 @@ async def show_admin_tickets(callback: CallbackQuery, ticket_type: str):
     """Показать обращения для админа"""
     try:
         if ticket_type == "new":
-            tickets = await db.get_pending_tickets(20)
-            tickets = [t for t in tickets if t['status'] == 'new']
+            tickets = await db.get_pending_tickets(20, statuses=('new',))
             title = "🆕 Новые обращения"
         elif ticket_type == "active":
-            tickets = await db.get_pending_tickets(20)
-            tickets = [t for t in tickets if t['status'] in ['in_progress', 'waiting_response']]
+            tickets = await db.get_pending_tickets(20, statuses=('in_progress', 'waiting_response'))
             title = "⏳ Активные обращения"
         else:  # closed
             tickets = await db.get_closed_tickets(20)
@@ -590,26 +571,12 @@ async def show_admin_tickets(callback: CallbackQuery, ticket_type: str):
             message_text = f"<b>{title}</b>\n\n📭 Обращений не найдено."
             keyboard = get_admin_panel()
         else:
-            tickets_list = ""
-            for i, ticket in enumerate(tickets, 1):
-                status_emoji = get_status_emoji(ticket['status'])
-                priority_emoji = get_priority_emoji(ticket.get('priority', 'medium'))
-                user_name = ticket.get('first_name', 'Неизвестно')
-                created_date = datetime.fromisoformat(ticket['created_at']).strftime("%d.%m")
-                
-                tickets_list += f"{i}. {priority_emoji}{status_emoji} <b>#{ticket['id']}</b>\n"
-                tickets_list += f"   👤 {user_name} | 📅 {created_date}\n"
-                tickets_list += f"   📝 {ticket['subject'][:50]}...\n\n"
-            
+            tickets_list, ticket_buttons = render_ticket_list(tickets, staff=True)
             message_text = f"<b>{title}</b>\n\n{tickets_list}"
             user_role = await db.get_user_role(callback.from_user.id)
-            keyboard = get_admin_tickets_keyboard(tickets, ticket_type, user_role)
+            keyboard = get_admin_tickets_keyboard(ticket_buttons, ticket_type, user_role)
         
-        await callback.message.edit_text(
-            message_text,
-            reply_markup=keyboard,
-            parse_mode="HTML"
-        )
+        await edit_message(callback.message, message_text, reply_markup=keyboard)
         await callback.answer()
         
     except Exception as e:
@@ -621,102 +588,195 @@ async def show_admin_tickets(callback: CallbackQuery, ticket_type: str):
         await callback.answer()
 
 
-@router.callback_query(F.data.startswith("admin_ticket_"))
-async def show_admin_ticket_details(callback: CallbackQuery):
+@router.callback_query(AdminTicketCallback.filter())
+async def show_admin_ticket_details(callback: CallbackQuery, callback_data: AdminTicketCallback):
     """Показать детали обращения для админа или агента"""
     if not await check_agent_or_admin(callback.from_user.id):
         await callback.answer(PERMISSION_DENIED, show_alert=True)
         return
     
     try:
-        ticket_id = int(callback.data.split("_")[-1])
-        ticket = await db.get_ticket(ticket_id)
-        
-        if not ticket:
+        if not await render_admin_ticket(callback, callback_data.ticket_id):
             await callback.answer("❌ Обращение не найдено", show_alert=True)
             return
-        
-        # Получаем информацию о пользователе
-        user = await db.get_user(ticket['user_id'])
-        user_name = user['first_name'] if user else "Неизвестно"
-        
-        # Получаем сообщения
-        messages = await db.get_ticket_messages(ticket_id)
-        
-        # Формируем информацию о сообщениях
-        messages_info = ""
-        if messages:
-            messages_info = f"\n<b>💬 История переписки:</b>\n"
-            for msg in messages[-5:]:  # Последние 5 сообщений
-                sender = "👨‍💼 Поддержка" if msg['is_admin'] else f"👤 {msg.get('first_name', 'Пользователь')}"
-                msg_date = datetime.fromisoformat(msg['created_at']).strftime("%d.%m %H:%M")
-                messages_info += f"• {sender} ({msg_date}):\n  {msg['message'][:150]}...\n\n"
-        
-        # Форматируем даты
-        created_at = datetime.fromisoformat(ticket['created_at']).strftime("%d.%m.%Y %H:%M")
-        updated_at = datetime.fromisoformat(ticket['updated_at']).strftime("%d.%m.%Y %H:%M")
-        
-        status_emoji = get_status_emoji(ticket['status'])
-        priority_emoji = get_priority_emoji(ticket.get('priority', 'medium'))
-        category_name = TICKET_CATEGORIES.get(ticket['category'], ticket['category'])
-        status_name = TICKET_STATUSES.get(ticket['status'], ticket['status'])
-        
-        details_text = f"""
-🎫 <b>Обращение #{ticket_id}</b> {priority_emoji}
-
-👤 <b>Пользователь:</b> {user_name} (ID: {ticket['user_id']})
-📋 <b>Тема:</b> {ticket['subject']}
+        await callback.answer()
+    except Exception as e:
+        await callback.answer("❌ Ошибка при загрузке обращения", show_alert=True)
+
+
+async def render_admin_ticket(callback: CallbackQuery, ticket_id: int) -> bool:
+    """Отрисовать карточку обращения в сообщении callback; False, если обращения нет"""
+    ticket = await db.get_ticket(ticket_id, include_archived=True)
+    if not ticket:
+        return False
+    
+    # Получаем информацию о пользователе
+    user = await db.get_user(ticket.user_id)
+    user_name = user.first_name if user else "Неизвестно"
+    
+    # Получаем сообщения
+    messages = await db.get_ticket_messages(ticket_id, include_archived=ticket.archived, last_n=5)
+    
+    # Формируем информацию о сообщениях
+    messages_info = ""
+    if messages:
+        messages_info = "\n<b>💬 История переписки:</b>\n" + "".join(
+            ADMIN_MESSAGE_PREVIEW.render(
+                sender="👨‍💼 Поддержка" if msg.is_admin else f"👤 {msg.first_name or 'Пользователь'}",
+                date=format_timestamp(msg.created_at, "%d.%m %H:%M"),
+                text=truncate(msg.message, 150)
+            )
+            for msg in messages  # Последние 5 сообщений
+        )
+    
+    # Форматируем даты
+    created_at = format_timestamp(ticket.created_at)
+    updated_at = format_timestamp(ticket.updated_at)
+    
+    status_emoji = get_status_emoji(ticket.status)
+    priority_emoji = get_priority_emoji(ticket.priority)
+    category_name = TICKET_CATEGORIES.get(ticket.category, ticket.category)
+    status_name = TICKET_STATUSES.get(ticket.status, ticket.status)
+    
+    # Карточку открывают на каждое нажатие кнопки: f-строка быстрее шаблона,
+    # экранируются только поля, которые ввёл пользователь
+    details_text = f"""
+🎫 <b>Обращение #{ticket.id}</b> {priority_emoji}
+
+👤 <b>Пользователь:</b> {escape(user_name)} (ID: {ticket.user_id})
+📋 <b>Тема:</b> {escape(ticket.subject)}
 📂 <b>Категория:</b> {category_name}
 📊 <b>Статус:</b> {status_emoji} {status_name}
 ⏰ <b>Создано:</b> {created_at}
 🔄 <b>Обновлено:</b> {updated_at}
 
 📝 <b>Описание:</b>
-{ticket['description']}
+{escape(ticket.description)}
 
 {messages_info}
 """
+    
+    user_role = await db.get_user_role(callback.from_user.id)
+    if ticket.archived:
+        # Архивные обращения доступны только для просмотра
+        details_text += "\n🗄 <i>Обращение находится в архиве.</i>"
+        keyboard = get_archived_ticket_keyboard(ticket_id, user_role)
+    else:
+        keyboard = get_admin_ticket_actions(
+            ticket_id, 
+            ticket.status, 
+            ticket.assigned_admin,
+            callback.from_user.id,
+            user_role=user_role
+        )
+    
+    await edit_long_message(callback.message, details_text, reply_markup=keyboard)
+    return True
+
+
+@router.callback_query(TranscriptCallback.filter())
+async def show_transcript(callback: CallbackQuery, callback_data: TranscriptCallback):
+    """Постраничный просмотр всей переписки по обращению"""
+    if not await check_agent_or_admin(callback.from_user.id):
+        await callback.answer(PERMISSION_DENIED, show_alert=True)
+        return
+    
+    try:
+        ticket_id = callback_data.ticket_id
+        ticket = await db.get_ticket(ticket_id, include_archived=True)
+        if not ticket:
+            await callback.answer("❌ Обращение не найдено", show_alert=True)
+            return
         
-        user_role = await db.get_user_role(callback.from_user.id)
-        await callback.message.edit_text(
-            details_text,
-            reply_markup=get_admin_ticket_actions(
-                ticket_id, 
-                ticket['status'], 
-                ticket.get('assigned_admin'),
-                callback.from_user.id,
-                user_role=user_role
-            ),
-            parse_mode="HTML"
+        # Лишнее сообщение сверх страницы показывает, есть ли что листать дальше
+        if callback_data.after is not None:
+            messages = await db.get_ticket_messages(
+                ticket_id, include_archived=ticket.archived,
+                last_n=TRANSCRIPT_PAGE_SIZE + 1, after_id=callback_data.after
+            )
+            has_newer = len(messages) > TRANSCRIPT_PAGE_SIZE
+            messages = messages[:TRANSCRIPT_PAGE_SIZE]
+            has_older = True
+        else:
+            messages = await db.get_ticket_messages(
+                ticket_id, include_archived=ticket.archived,
+                last_n=TRANSCRIPT_PAGE_SIZE + 1, before_id=callback_data.before
+            )
+            has_older = len(messages) > TRANSCRIPT_PAGE_SIZE
+            messages = messages[-TRANSCRIPT_PAGE_SIZE:]
+            has_newer = callback_data.before is not None
+        
+        text = TRANSCRIPT_HEADER.render(ticket=ticket) + "".join(
+            TRANSCRIPT_ENTRY.render(
+                sender=message_sender(msg.is_admin, msg.first_name, msg.username),
+                date=format_message_date(msg.created_at),
+                text=truncate(msg.message, TRANSCRIPT_MESSAGE_LIMIT)
+            )
+            for msg in messages
+        )
+        if not messages:
+            text += "📭 Сообщений нет."
+        
+        keyboard = get_transcript_keyboard(
+            ticket_id,
+            messages[0].id if messages and has_older else None,
+            messages[-1].id if messages and has_newer else None
         )
+        await edit_message(callback.message, text, reply_markup=keyboard)
         await callback.answer()
+    except Exception as e:
+        await callback.answer("❌ Ошибка при загрузке переписки", show_alert=True)
+
+
+@router.callback_query(TranscriptExportCallback.filter(), flags={"throttling_key": "export"})
+async def export_transcript(callback: CallbackQuery, callback_data: TranscriptExportCallback):
+    """Выгрузить всю переписку по обращению файлом"""
+    if not await check_agent_or_admin(callback.from_user.id):
+        await callback.answer(PERMISSION_DENIED, show_alert=True)
+        return
+    
+    try:
+        ticket = await db.get_ticket(callback_data.ticket_id, include_archived=True)
+        if not ticket:
+            await callback.answer("❌ Обращение не найдено", show_alert=True)
+            return
         
-    except ValueError:
-        await callback.answer("❌ Неверный ID обращения", show_alert=True)
+        await callback.answer("⏳ Готовлю файл...")
+        path, count = await write_transcript(ticket, callback_data.fmt)
+        try:
+            await callback.message.answer_document(
+                FSInputFile(path, filename=f"ticket_{ticket.id}.{callback_data.fmt}"),
+                caption=f"📜 <b>Переписка по обращению #{ticket.id}</b>\nСообщений: {count}",
+                parse_mode="HTML"
+            )
+        finally:
+            path.unlink(missing_ok=True)
     except Exception as e:
-        await callback.answer("❌ Ошибка при загрузке обращения", show_alert=True)
+        await callback.message.answer("❌ Ошибка при выгрузке переписки")
 
 
-@router.callback_query(F.data.startswith("admin_respond_"))
-async def start_admin_response(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(AdminRespondCallback.filter())
+async def start_admin_response(callback: CallbackQuery, callback_data: AdminRespondCallback,
+                               state: FSMContext):
     """Начать ответ администратора или агента"""
     if not await check_agent_or_admin(callback.from_user.id):
         await callback.answer(PERMISSION_DENIED, show_alert=True)
         return
     
-    ticket_id = int(callback.data.split("_")[-1])
+    ticket_id = callback_data.ticket_id
     
     await state.update_data(admin_responding_ticket_id=ticket_id)
     await callback.message.edit_text(
-        TICKET_RESPONSE_MESSAGE.format(ticket_id=ticket_id),
+        TICKET_RESPONSE_MESSAGE.render(ticket_id=ticket_id),
         reply_markup=get_admin_quick_responses(),
         parse_mode="HTML"
     )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("quick_"))
-async def quick_response(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(QuickResponseCallback.filter())
+async def quick_response(callback: CallbackQuery, callback_data: QuickResponseCallback,
+                         state: FSMContext):
     """Быстрый ответ администратора или агента"""
     if not await check_agent_or_admin(callback.from_user.id):
         await callback.answer(PERMISSION_DENIED, show_alert=True)
@@ -729,7 +789,7 @@ async def quick_response(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Ошибка: не найдено обращение", show_alert=True)
         return
     
-    quick_type = callback.data.split("_", 1)[1]
+    quick_type = callback_data.kind
     
     # Словарь быстрых ответов
     quick_responses = {
@@ -792,7 +852,13 @@ async def send_admin_response(callback: CallbackQuery, state: FSMContext, ticket
     """Отправить ответ администратора (из callback)"""
     try:
         # Добавляем сообщение в базу
-        await db.add_ticket_message(ticket_id, callback.from_user.id, response_text, True)
+        if not await db.add_ticket_message(
+            ticket_id, callback.from_user.id, response_text, True,
+            idempotency_key=callback_key(callback)
+        ):
+            # Повторное нажатие уже обработано
+            await callback.answer()
+            return
         
         # Обновляем статус в зависимости от типа быстрого ответа
         if action_type == "resolved":
@@ -805,7 +871,7 @@ async def send_admin_response(callback: CallbackQuery, state: FSMContext, ticket
         # Отправляем ответ пользователю
         ticket = await db.get_ticket(ticket_id)
         if ticket:
-            await notify_user_response(ticket['user_id'], ticket_id, response_text)
+            await notify_user_response(ticket.user_id, ticket_id, response_text)
         
         await state.clear()
         
@@ -830,7 +896,17 @@ async def send_admin_response_message(message: Message, state: FSMContext, ticke
     """Отправить ответ администратора (из сообщения)"""
     try:
         # Добавляем сообщение в базу
-        await db.add_ticket_message(ticket_id, message.from_user.id, response_text, True)
+        if not await db.add_ticket_message(
+            ticket_id, message.from_user.id, response_text, True,
+            idempotency_key=message_key(message)
+        ):
+            # Этот ответ уже отправлен: выходим из режима ответа
+            await state.clear()
+            await message.answer(
+                f"ℹ️ Этот ответ уже отправлен по обращению #{ticket_id}",
+                reply_markup=get_admin_panel()
+            )
+            return
         
         # Обновляем статус
         await db.update_ticket_status(ticket_id, 'in_progress', message.from_user.id)
@@ -838,7 +914,7 @@ async def send_admin_response_message(message: Message, state: FSMContext, ticke
         # Отправляем ответ пользователю
         ticket = await db.get_ticket(ticket_id)
         if ticket:
-            await notify_user_response(ticket['user_id'], ticket_id, response_text)
+            await notify_user_response(ticket.user_id, ticket_id, response_text)
         
         await state.clear()
         
@@ -857,17 +933,16 @@ async def send_admin_response_message(message: Message, state: FSMContext, ticke
         )
 
 
-@router.callback_query(F.data.startswith("admin_status_"))
-async def change_ticket_status(callback: CallbackQuery):
+@router.callback_query(AdminStatusCallback.filter())
+async def change_ticket_status(callback: CallbackQuery, callback_data: AdminStatusCallback):
     """Изменить статус обращения"""
     if not await check_agent_or_admin(callback.from_user.id):
         await callback.answer(PERMISSION_DENIED, show_alert=True)
         return
     
     try:
-        parts = callback.data.split("_")
-        ticket_id = int(parts[2])
-        new_status = parts[3]
+        ticket_id = callback_data.ticket_id
+        new_status = callback_data.status.name
         
         await db.update_ticket_status(ticket_id, new_status, callback.from_user.id)
         
@@ -876,28 +951,27 @@ async def change_ticket_status(callback: CallbackQuery):
         await callback.answer(f"✅ Статус изменен на: {status_name}")
         
         # Обновляем отображение обращения
-        await show_admin_ticket_details(callback)
+        await render_admin_ticket(callback, ticket_id)
         
         # Уведомляем пользователя об изменении статуса
         ticket = await db.get_ticket(ticket_id)
         if ticket:
-            await notify_user_status_change(ticket['user_id'], ticket_id, new_status)
+            await notify_user_status_change(ticket.user_id, ticket_id, new_status)
         
     except Exception as e:
         await callback.answer("❌ Ошибка при изменении статуса", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("admin_priority_"))
-async def change_ticket_priority(callback: CallbackQuery):
+@router.callback_query(AdminPriorityCallback.filter())
+async def change_ticket_priority(callback: CallbackQuery, callback_data: AdminPriorityCallback):
     """Изменить приоритет обращения"""
     if not await check_agent_or_admin(callback.from_user.id):
         await callback.answer(PERMISSION_DENIED, show_alert=True)
         return
     
     try:
-        parts = callback.data.split("_")
-        ticket_id = int(parts[2])
-        priority = parts[3]
+        ticket_id = callback_data.ticket_id
+        priority = callback_data.priority.name
         
         # Обновляем приоритет
         await db.update_ticket_priority(ticket_id, priority)
@@ -908,34 +982,23 @@ async def change_ticket_priority(callback: CallbackQuery):
         await callback.answer(f"✅ Приоритет изменен на: {priority_name}")
         
         # Обновляем отображение обращения
-        await show_admin_ticket_details(callback)
+        await render_admin_ticket(callback, ticket_id)
         
     except Exception as e:
         await callback.answer("❌ Ошибка при изменении приоритета", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("search_ticket_"))
-async def quick_search_ticket(callback: CallbackQuery):
+@router.callback_query(SearchTicketCallback.filter())
+async def quick_search_ticket(callback: CallbackQuery, callback_data: SearchTicketCallback):
     """Быстрый поиск и показ обращения по ID из уведомления"""
     if not await check_agent_or_admin(callback.from_user.id):
         await callback.answer(PERMISSION_DENIED, show_alert=True)
         return
     
-    try:
-        ticket_id = int(callback.data.split("_")[-1])
-        ticket = await db.get_ticket(ticket_id)
-        
-        if not ticket:
-            await callback.answer("❌ Обращение не найдено", show_alert=True)
-            return
-        
-        # Переходим к показу обращения для любого из ролей
-        await show_admin_ticket_details(callback)
-        
-    except ValueError:
-        await callback.answer("❌ Неверный ID обращения", show_alert=True)
-    except Exception as e:
-        await callback.answer("❌ Ошибка при поиске обращения", show_alert=True)
+    # Переходим к показу обращения для любого из ролей
+    await show_admin_ticket_details(
+        callback, AdminTicketCallback(ticket_id=callback_data.ticket_id)
+    )
 
 
 @router.callback_query(F.data == "admin_stats")
@@ -965,11 +1028,7 @@ async def show_admin_stats(callback: CallbackQuery):
 • Требуют внимания: {stats.get('status_new', 0) + stats.get('status_waiting_response', 0)}
 """
         
-        await callback.message.edit_text(
-            stats_text,
-            reply_markup=get_admin_stats_keyboard(stats),
-            parse_mode="HTML"
-        )
+        await edit_message(callback.message, stats_text, reply_markup=get_admin_stats_keyboard(stats))
         await callback.answer()
         
     except Exception as e:
@@ -988,9 +1047,7 @@ async def notify_user_response(user_id: int, ticket_id: int, response_text: str)
     try:
         await bot.send_message(
             user_id,
-            f"💬 <b>Новый ответ на обращение #{ticket_id}</b>\n\n"
-            f"<b>Ответ поддержки:</b>\n{response_text}\n\n"
-            f"Вы можете ответить, перейдя к обращению в разделе \"Мои обращения\".",
+            SUPPORT_RESPONSE_NOTIFICATION.render(ticket_id=ticket_id, response=response_text),
             parse_mode="HTML"
         )
     except:
@@ -1013,26 +1070,4 @@ async def notify_user_status_change(user_id: int, ticket_id: int, new_status: st
             parse_mode="HTML"
         )
     except:
-        pass
-
-
-def get_status_emoji(status: str) -> str:
-    """Получить эмодзи для статуса"""
-    emojis = {
-        'new': '🆕',
-        'in_progress': '⏳',
-        'waiting_response': '⏰',
-        'resolved': '✅',
-        'closed': '🔒'
-    }
-    return emojis.get(status, '❓')
-
-
-def get_priority_emoji(priority: str) -> str:
-    """Получить эмодзи для приоритета"""
-    emojis = {
-        'high': '🔴',
-        'medium': '🟡',
-        'low': '🟢'
-    }
-    return emojis.get(priority, '🟡')
\ No newline at end of file
+        pass
\ No newline at end of file
@@ -1,12 +1,11 @@
 """Дополнительные callback обработчики для админов"""
 
 import asyncio
-import json
 import csv
 import io
 from datetime import datetime, timedelta
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, BufferedInputFile
+from aiogram.types import CallbackQuery, BufferedInputFile, FSInputFile
 from aiogram.fsm.context import FSMContext
 
 from database import db
@@ -14,7 +13,14 @@ from keyboards.admin import (
     get_admin_manage_keyboard, get_admin_settings_keyboard, 
     get_admin_export_keyboard, get_admin_panel
 )
+from config import EXPORT_DELTA_CONSUMER
 from utils.texts import PERMISSION_DENIED
+from utils.backup import create_backup as make_backup
+from utils.dates import local_now
+from utils.export import EXPORTS, commit_watermark, export_delta, export_entity
+
+# Максимальный размер файла, который бот может отправить
+TELEGRAM_UPLOAD_LIMIT_MB = 50
 
 router = Router()
 
@@ -56,10 +62,10 @@ async def list_users(callback: CallbackQuery):
         text = f"👥 <b>Пользователи системы</b> (показано {len(users)} из {total_users})\n\n"
         
         for user in users:
-            role_emoji = {"admin": "👑", "agent": "🛡️", "client": "👤"}.get(user['role'], "❓")
-            status = "🟢" if user['is_active'] else "🔴"
-            text += f"{role_emoji} {status} <b>{user.get('first_name', 'N/A')}</b> (@{user.get('username', 'N/A')})\n"
-            text += f"   ID: <code>{user['user_id']}</code> | Роль: {user['role']}\n\n"
+            role_emoji = {"admin": "👑", "agent": "🛡️", "client": "👤"}.get(user.role, "❓")
+            status = "🟢" if user.is_active else "🔴"
+            text += f"{role_emoji} {status} <b>{user.first_name or 'N/A'}</b> (@{user.username or 'N/A'})\n"
+            text += f"   ID: <code>{user.user_id}</code> | Роль: {user.role}\n\n"
         
         await callback.message.edit_text(
             text,
@@ -135,47 +141,42 @@ async def show_admin_settings(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "admin_backup")
+@router.callback_query(F.data == "admin_backup", flags={"throttling_key": "export"})
 async def create_backup(callback: CallbackQuery):
     """Создать резервную копию"""
     if not await check_admin(callback.from_user.id):
         await callback.answer(PERMISSION_DENIED, show_alert=True)
         return
     
+    await callback.answer("⏳ Создаём резервную копию...")
+    
     try:
-        # Получаем все данные
-        users = await db.get_all_users(limit=1000)
-        tickets = await db.get_all_tickets(limit=1000)
-        stats = await db.get_ticket_stats()
-        
-        backup_data = {
-            "created_at": datetime.now().isoformat(),
-            "users": users,
-            "tickets": tickets,
-            "stats": stats,
-            "version": "1.0"
-        }
-        
-        # Создаем JSON файл
-        backup_json = json.dumps(backup_data, ensure_ascii=False, indent=2)
+        # Полная копия баз через online backup API, сохраняется в BACKUP_DIR
+        backup_path = await make_backup()
+        size_mb = backup_path.stat().st_size / (1024 * 1024)
+        
+        caption = (
+            f"💾 <b>Резервная копия создана</b>\n\n"
+            f"📅 Дата: {local_now().strftime('%d.%m.%Y %H:%M')}\n"
+            f"📦 Размер: {size_mb:.1f} МБ"
+        )
         
-        # Отправляем файл
-        filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        file = BufferedInputFile(backup_json.encode('utf-8'), filename=filename)
+        if size_mb > TELEGRAM_UPLOAD_LIMIT_MB:
+            await callback.message.answer(
+                caption + f"\n\n⚠️ Файл слишком большой для отправки, "
+                          f"он сохранён на сервере:\n<code>{backup_path}</code>",
+                parse_mode="HTML"
+            )
+            return
         
         await callback.message.answer_document(
-            file,
-            caption=f"💾 <b>Резервная копия создана</b>\n\n"
-                   f"📅 Дата: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n"
-                   f"👥 Пользователей: {len(users)}\n"
-                   f"📋 Обращений: {len(tickets)}",
+            FSInputFile(backup_path),
+            caption=caption,
             parse_mode="HTML"
         )
         
-        await callback.answer("✅ Резервная копия создана")
-        
     except Exception as e:
-        await callback.answer("❌ Ошибка при создании резервной копии", show_alert=True)
+        await callback.message.answer("❌ Ошибка при создании резервной копии")
 
 
 # ===== ЭКСПОРТ =====
@@ -196,7 +197,7 @@ async def show_export_menu(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "admin_export_stats")
+@router.callback_query(F.data == "admin_export_stats", flags={"throttling_key": "export"})
 async def export_stats(callback: CallbackQuery):
     """Экспорт статистики"""
     if not await check_admin(callback.from_user.id):
@@ -238,101 +239,118 @@ async def export_stats(callback: CallbackQuery):
         await callback.answer("❌ Ошибка при экспорте статистики", show_alert=True)
 
 
-@router.callback_query(F.data == "admin_export_tickets")
+async def send_export(callback: CallbackQuery, entity: str, fmt: str, caption: str):
+    """Сформировать потоковый экспорт и отправить его файлом"""
+    path, count = await export_entity(entity, fmt)
+    try:
+        filename = f"{entity}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}.gz"
+        await callback.message.answer_document(
+            FSInputFile(path, filename=filename),
+            caption=caption.format(count=count),
+            parse_mode="HTML"
+        )
+    finally:
+        path.unlink(missing_ok=True)
+
+
+@router.callback_query(F.data == "admin_export_tickets", flags={"throttling_key": "export"})
 async def export_tickets(callback: CallbackQuery):
     """Экспорт обращений в CSV"""
     if not await check_admin(callback.from_user.id):
         await callback.answer(PERMISSION_DENIED, show_alert=True)
         return
     
+    await callback.answer("⏳ Готовим экспорт...")
     try:
-        tickets = await db.get_all_tickets(limit=1000)
-        
-        csv_data = io.StringIO()
-        writer = csv.writer(csv_data)
-        
-        # Заголовки
-        writer.writerow([
-            'ID', 'User ID', 'Username', 'Category', 'Subject', 
-            'Status', 'Priority', 'Created', 'Updated'
-        ])
-        
-        # Данные
-        for ticket in tickets:
-            writer.writerow([
-                ticket.get('id', ''),
-                ticket.get('user_id', ''),
-                ticket.get('username', ''),
-                ticket.get('category', ''),
-                ticket.get('subject', ''),
-                ticket.get('status', ''),
-                ticket.get('priority', ''),
-                ticket.get('created_at', ''),
-                ticket.get('updated_at', '')
-            ])
-        
-        filename = f"tickets_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        file = BufferedInputFile(csv_data.getvalue().encode('utf-8'), filename=filename)
-        
-        await callback.message.answer_document(
-            file,
-            caption=f"📋 <b>Обращения экспортированы</b>\n\nВсего: {len(tickets)} обращений",
-            parse_mode="HTML"
+        await send_export(
+            callback, 'tickets', 'csv',
+            "📋 <b>Обращения экспортированы</b>\n\nВсего: {count} обращений"
         )
-        
-        await callback.answer("✅ Обращения экспортированы")
-        
     except Exception as e:
-        await callback.answer("❌ Ошибка при экспорте обращений", show_alert=True)
+        await callback.message.answer("❌ Ошибка при экспорте обращений")
 
 
-@router.callback_query(F.data == "admin_export_users")
+@router.callback_query(F.data == "admin_export_users", flags={"throttling_key": "export"})
 async def export_users(callback: CallbackQuery):
     """Экспорт пользователей в CSV"""
     if not await check_admin(callback.from_user.id):
         await callback.answer(PERMISSION_DENIED, show_alert=True)
         return
     
+    await callback.answer("⏳ Готовим экспорт...")
     try:
-        users = await db.get_all_users(limit=1000)
-        
-        csv_data = io.StringIO()
-        writer = csv.writer(csv_data)
-        
-        # Заголовки
-        writer.writerow([
-            'User ID', 'Username', 'First Name', 'Last Name', 
-            'Role', 'Active', 'Created'
-        ])
-        
-        # Данные
-        for user in users:
-            writer.writerow([
-                user.get('user_id', ''),
-                user.get('username', ''),
-                user.get('first_name', ''),
-                user.get('last_name', ''),
-                user.get('role', ''),
-                'Да' if user.get('is_active') else 'Нет',
-                user.get('created_at', '')
-            ])
-        
-        filename = f"users_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        file = BufferedInputFile(csv_data.getvalue().encode('utf-8'), filename=filename)
-        
-        await callback.message.answer_document(
-            file,
-            caption=f"👥 <b>Пользователи экспортированы</b>\n\nВсего: {len(users)} пользователей",
-            parse_mode="HTML"
+        await send_export(
+            callback, 'users', 'csv',
+            "👥 <b>Пользователи экспортированы</b>\n\nВсего: {count} пользователей"
+        )
+    except Exception as e:
+        await callback.message.answer("❌ Ошибка при экспорте пользователей")
+
+
+@router.callback_query(F.data == "admin_export_messages", flags={"throttling_key": "export"})
+async def export_messages(callback: CallbackQuery):
+    """Экспорт переписки по обращениям в CSV"""
+    if not await check_admin(callback.from_user.id):
+        await callback.answer(PERMISSION_DENIED, show_alert=True)
+        return
+    
+    await callback.answer("⏳ Готовим экспорт...")
+    try:
+        await send_export(
+            callback, 'messages', 'csv',
+            "💬 <b>Сообщения экспортированы</b>\n\nВсего: {count} сообщений"
         )
-        
-        await callback.answer("✅ Пользователи экспортированы")
-        
     except Exception as e:
-        await callback.answer("❌ Ошибка при экспорте пользователей", show_alert=True)
+        await callback.message.answer("❌ Ошибка при экспорте сообщений")
 
 
-@router.callback_query(F.data == "admin_export_report")
+@router.callback_query(F.data == "admin_export_jsonl", flags={"throttling_key": "export"})
+async def export_all_jsonl(callback: CallbackQuery):
+    """Экспорт всех таблиц в JSONL"""
+    if not await check_admin(callback.from_user.id):
+        await callback.answer(PERMISSION_DENIED, show_alert=True)
+        return
+    
+    await callback.answer("⏳ Готовим экспорт...")
+    try:
+        for entity in EXPORTS:
+            await send_export(
+                callback, entity, 'jsonl',
+                f"🧾 <b>{entity}.jsonl</b>\n\nЗаписей: {{count}}"
+            )
+    except Exception as e:
+        await callback.message.answer("❌ Ошибка при экспорте данных")
+
+
+@router.callback_query(F.data == "admin_export_delta", flags={"throttling_key": "export"})
+async def export_changes(callback: CallbackQuery):
+    """Экспорт изменений с прошлой выгрузки в JSONL"""
+    if not await check_admin(callback.from_user.id):
+        await callback.answer(PERMISSION_DENIED, show_alert=True)
+        return
+    
+    await callback.answer("⏳ Готовим экспорт...")
+    try:
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        for entity in EXPORTS:
+            path, count, mark = await export_delta(EXPORT_DELTA_CONSUMER, entity)
+            try:
+                if count:
+                    await callback.message.answer_document(
+                        FSInputFile(path, filename=f"{entity}_delta_{stamp}.jsonl.gz"),
+                        caption=f"🔄 <b>{entity}: изменения</b>\n\nЗаписей: {count}",
+                        parse_mode="HTML"
+                    )
+                    await commit_watermark(EXPORT_DELTA_CONSUMER, entity, mark)
+                else:
+                    await callback.message.answer(f"🔄 {entity}: изменений нет")
+            finally:
+                path.unlink(missing_ok=True)
+    except Exception as e:
+        await callback.message.answer("❌ Ошибка при экспорте изменений")
+
+
+@router.callback_query(F.data == "admin_export_report", flags={"throttling_key": "export"})
 async def export_detailed_report(callback: CallbackQuery):
     """Экспорт подробного отчёта"""
     if not await check_admin(callback.from_user.id):
@@ -341,16 +359,19 @@ async def export_detailed_report(callback: CallbackQuery):
     
     try:
         # Получаем данные за последние 30 дней
-        end_date = datetime.now()
+        end_date = local_now()
         start_date = end_date - timedelta(days=30)
         
         stats = await db.get_ticket_stats()
-        users = await db.get_all_users()
+        admin_count = await db.count_users_by_role('admin')
+        agent_count = await db.count_users_by_role('agent')
+        client_count = await db.count_users_by_role('client')
+        total_users = await db.count_total_users()
         
         report = f"""
 ОТЧЁТ ПО РАБОТЕ СЛУЖБЫ ПОДДЕРЖКИ
 Период: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}
-Создан: {datetime.now().strftime('%d.%m.%Y %H:%M')}
+Создан: {local_now().strftime('%d.%m.%Y %H:%M')}
 
 === ОБЩАЯ СТАТИСТИКА ===
 Всего обращений: {stats.get('total', 0)}
@@ -361,10 +382,10 @@ async def export_detailed_report(callback: CallbackQuery):
 Закрыто: {stats.get('status_closed', 0)}
 
 === ПОЛЬЗОВАТЕЛИ ===
-Всего пользователей: {len(users)}
-Администраторы: {len([u for u in users if u['role'] == 'admin'])}
-Агенты: {len([u for u in users if u['role'] == 'agent'])}
-Клиенты: {len([u for u in users if u['role'] == 'client'])}
+Всего пользователей: {total_users}
+Администраторы: {admin_count}
+Агенты: {agent_count}
+Клиенты: {client_count}
 
 === ЭФФЕКТИВНОСТЬ ===
 Решено обращений: {stats.get('status_resolved', 0)}
@@ -1,7 +1,6 @@
 """Обработчики для агентов поддержки"""
 
 import math
-from datetime import datetime
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import StateFilter
@@ -15,12 +14,16 @@ from keyboards.reply import (
     get_client_main_keyboard
 )
 from database import db
+from models import Ticket
 from utils.texts import (
     TICKET_DETAILS_MESSAGE, TICKET_CATEGORIES, TICKET_STATUSES,
-    ERROR_MESSAGE, PERMISSION_DENIED, TICKET_RESPONSE_MESSAGE
+    ERROR_MESSAGE, PERMISSION_DENIED, TICKET_RESPONSE_MESSAGE, TICKET_FOUND_MESSAGE
 )
 from handlers.common import AdminStates
 from config import TICKETS_PER_PAGE
+from utils.dates import format_timestamp
+from utils.render import truncate
+from utils.ticket_list import get_status_emoji, render_ticket_list
 
 
 router = Router()
@@ -89,9 +92,8 @@ async def handle_agent_stats_button(message: Message):
 async def show_agent_tickets(message: Message, status_filter: list, title: str):
     """Показать обращения для агента"""
     try:
-        # Получаем все обращения с нужными статусами
-        all_tickets = await db.get_pending_tickets(50)
-        tickets = [t for t in all_tickets if t['status'] in status_filter]
+        # Получаем обращения с нужными статусами
+        tickets = await db.get_pending_tickets(50, statuses=status_filter)
         
         if not tickets:
             await message.answer(
@@ -102,16 +104,8 @@ async def show_agent_tickets(message: Message, status_filter: list, title: str):
             return
         
         # Формируем список обращений
-        tickets_list = ""
-        for i, ticket in enumerate(tickets[:10], 1):  # Показываем первые 10
-            status_emoji = get_status_emoji(ticket['status'])
-            priority_emoji = get_priority_emoji(ticket.get('priority', 'medium'))
-            user_name = ticket.get('first_name', 'Неизвестно')
-            created_date = datetime.fromisoformat(ticket['created_at']).strftime("%d.%m")
-            
-            tickets_list += f"{i}. {priority_emoji}{status_emoji} <b>#{ticket['id']}</b>\n"
-            tickets_list += f"   👤 {user_name} | 📅 {created_date}\n"
-            tickets_list += f"   📝 {ticket['subject'][:50]}...\n\n"
+        # Показываем первые 10
+        tickets_list, ticket_buttons = render_ticket_list(tickets[:10], staff=True)
         
         message_text = f"<b>{title}</b>\n\n{tickets_list}"
         
@@ -126,7 +120,7 @@ async def show_agent_tickets(message: Message, status_filter: list, title: str):
         
         # Отправляем inline меню для выбора обращения
         from keyboards.admin import get_admin_tickets_keyboard
-        inline_keyboard = get_admin_tickets_keyboard(tickets[:10], "agent", user_role="agent")
+        inline_keyboard = get_admin_tickets_keyboard(ticket_buttons, "agent", user_role="agent")
         
         await message.answer(
             "🎯 <b>Выберите обращение для обработки:</b>",
@@ -218,7 +212,7 @@ async def process_agent_search(message: Message, state: FSMContext):
     
     try:
         ticket_id = int(message.text.strip())
-        ticket = await db.get_ticket(ticket_id)
+        ticket = await db.get_ticket(ticket_id, include_archived=True)
         
         if not ticket:
             await message.answer(
@@ -239,31 +233,28 @@ async def process_agent_search(message: Message, state: FSMContext):
         )
 
 
-async def show_ticket_for_agent(message: Message, ticket: dict):
+async def show_ticket_for_agent(message: Message, ticket: Ticket):
     """Показать обращение агенту"""
     try:
         # Получаем информацию о пользователе
-        user = await db.get_user(ticket['user_id'])
-        user_name = user['first_name'] if user else "Неизвестно"
+        user = await db.get_user(ticket.user_id)
+        user_name = user.first_name if user else "Неизвестно"
         
-        status_emoji = get_status_emoji(ticket['status'])
-        category_name = TICKET_CATEGORIES.get(ticket['category'], ticket['category'])
-        status_name = TICKET_STATUSES.get(ticket['status'], ticket['status'])
+        status_emoji = get_status_emoji(ticket.status)
+        category_name = TICKET_CATEGORIES.get(ticket.category, ticket.category)
+        status_name = TICKET_STATUSES.get(ticket.status, ticket.status)
         
-        created_at = datetime.fromisoformat(ticket['created_at']).strftime("%d.%m.%Y %H:%M")
+        created_at = format_timestamp(ticket.created_at)
         
-        details_text = f"""
-🎫 <b>Найдено обращение #{ticket['id']}</b>
-
-👤 <b>Клиент:</b> {user_name}
-📋 <b>Тема:</b> {ticket['subject']}
-📂 <b>Категория:</b> {category_name}
-📊 <b>Статус:</b> {status_emoji} {status_name}
-⏰ <b>Создано:</b> {created_at}
-
-📝 <b>Описание:</b>
-{ticket['description'][:200]}...
-"""
+        details_text = TICKET_FOUND_MESSAGE.render(
+            ticket=ticket,
+            user_name=user_name,
+            category=category_name,
+            status_emoji=status_emoji,
+            status=status_name,
+            created_at=created_at,
+            description=truncate(ticket.description, 200)
+        )
         
         await message.answer(
             details_text,
@@ -272,14 +263,14 @@ async def show_ticket_for_agent(message: Message, ticket: dict):
         )
         
         # Если обращение можно обработать, показываем действия
-        if ticket['status'] in ['new', 'in_progress', 'waiting_response']:
+        if ticket.status in ['new', 'in_progress', 'waiting_response']:
             from keyboards.admin import get_admin_ticket_actions
             await message.answer(
                 "🎯 <b>Доступные действия:</b>",
                 reply_markup=get_admin_ticket_actions(
-                    ticket['id'], 
-                    ticket['status'],
-                    ticket.get('assigned_admin'),
+                    ticket.id, 
+                    ticket.status,
+                    ticket.assigned_admin,
                     message.from_user.id,
                     user_role='agent'
                 ),
@@ -292,26 +283,3 @@ async def show_ticket_for_agent(message: Message, ticket: dict):
             reply_markup=get_agent_main_keyboard()
         )
 
-
-# ===== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ =====
-
-def get_status_emoji(status: str) -> str:
-    """Получить эмодзи для статуса"""
-    emojis = {
-        'new': '🆕',
-        'in_progress': '⏳',
-        'waiting_response': '⏰',
-        'resolved': '✅',
-        'closed': '🔒'
-    }
-    return emojis.get(status, '❓')
-
-
-def get_priority_emoji(priority: str) -> str:
-    """Получить эмодзи для приоритета"""
-    emojis = {
-        'high': '🔴',
-        'medium': '🟡',
-        'low': '🟢'
-    }
-    return emojis.get(priority, '🟡')
\ No newline at end of file
@@ -15,6 +15,8 @@ from keyboards.reply import (
 from database import db
 from utils.texts import START_MESSAGE, CONTACTS_MESSAGE, CANCEL_MESSAGE
 from config import ADMINS, AGENTS, USER_ROLES
+from utils.render_cache import edit_message
+from utils.templates import Markup
 
 
 router = Router()
@@ -148,7 +150,7 @@ async def show_admin_panel(callback: CallbackQuery, state: FSMContext):
     
     from utils.texts import ADMIN_PANEL_MESSAGE
     await callback.message.edit_text(
-        ADMIN_PANEL_MESSAGE.format(stats=stats_text),
+        ADMIN_PANEL_MESSAGE.render(stats=Markup(stats_text)),
         reply_markup=get_admin_panel(),
         parse_mode="HTML"
     )
@@ -181,11 +183,7 @@ async def cancel_action(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "refresh")
 async def refresh_menu(callback: CallbackQuery):
     """Обновить главное меню"""
-    await callback.message.edit_text(
-        START_MESSAGE,
-        reply_markup=get_main_menu(),
-        parse_mode="HTML"
-    )
+    await edit_message(callback.message, START_MESSAGE, reply_markup=get_main_menu())
     await callback.answer("🔄 Обновлено!")
 
 
@@ -245,7 +243,7 @@ async def cmd_admin(message: Message):
     
     from utils.texts import ADMIN_PANEL_MESSAGE
     await message.answer(
-        ADMIN_PANEL_MESSAGE.format(stats=stats_text),
+        ADMIN_PANEL_MESSAGE.render(stats=Markup(stats_text)),
         reply_markup=get_admin_panel(),
         parse_mode="HTML"
     )
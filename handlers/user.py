@@ -1,7 +1,6 @@
 """Обработчики для пользователей"""
 
 import math
-from datetime import datetime
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import StateFilter
@@ -12,6 +11,10 @@ from keyboards.user import (
     get_my_tickets_keyboard, get_ticket_details_keyboard,
     get_faq_keyboard, get_faq_item_keyboard, get_ticket_created_keyboard
 )
+from keyboards.callback_data import (
+    CategoryCallback, TicketCallback, TicketsPageCallback, RespondTicketCallback,
+    CloseTicketCallback, FaqCallback
+)
 from keyboards.reply import (
     get_client_main_keyboard, get_ticket_categories_keyboard,
     get_cancel_keyboard as get_reply_cancel_keyboard
@@ -22,10 +25,17 @@ from utils.texts import (
     TICKET_DESCRIPTION_MESSAGE, TICKET_CREATED_MESSAGE, MY_TICKETS_MESSAGE,
     NO_TICKETS_MESSAGE, TICKET_DETAILS_MESSAGE, TICKET_STATUSES,
     FAQ_MESSAGE, FAQ_ITEMS, PLEASE_WAIT, ERROR_MESSAGE, TICKET_NOT_FOUND,
-    CONTACTS_MESSAGE, CANCEL_MESSAGE
+    CONTACTS_MESSAGE, CANCEL_MESSAGE, MESSAGE_PREVIEW,
+    NEW_TICKET_NOTIFICATION, TICKET_UPDATE_NOTIFICATION
 )
 from handlers.common import TicketStates
 from config import MAX_TICKET_TEXT_LENGTH, TICKETS_PER_PAGE
+from utils.dedup import message_key
+from utils.dates import format_timestamp, local_now
+from utils.render_cache import edit_message
+from utils.render import edit_long_message, truncate
+from utils.templates import Markup
+from utils.ticket_list import get_status_emoji, render_ticket_list
 
 
 router = Router()
@@ -33,7 +43,7 @@ router = Router()
 
 # ===== ОБРАБОТЧИКИ REPLY КНОПОК КЛИЕНТА =====
 
-@router.message(F.text == "📝 Создать обращение", StateFilter(None))
+@router.message(F.text == "📝 Создать обращение", StateFilter(None), flags={"throttling_key": "ticket_create"})
 async def handle_new_ticket_button(message: Message, state: FSMContext):
     """Обработка кнопки создания обращения"""
     await start_new_ticket_process(message, state)
@@ -129,18 +139,12 @@ async def show_user_tickets_process(message: Message, page: int = 0):
             return
         
         # Подсчитываем общее количество страниц
-        total_tickets = len(await db.get_user_tickets(message.from_user.id, limit=1000))
+        total_tickets = await db.count_user_tickets(message.from_user.id)
         total_pages = math.ceil(total_tickets / TICKETS_PER_PAGE)
         
-        # Формируем список обращений
-        tickets_list = ""
-        for i, ticket in enumerate(tickets, 1):
-            status_emoji = "🆕" if ticket['status'] == 'new' else "⏳" if ticket['status'] == 'in_progress' else "✅"
-            created_date = datetime.fromisoformat(ticket['created_at']).strftime("%d.%m.%Y")
-            tickets_list += f"{i + page * TICKETS_PER_PAGE}. {status_emoji} <b>#{ticket['id']}</b> - {ticket['subject'][:40]}...\n"
-            tickets_list += f"   📅 {created_date} | {TICKET_STATUSES.get(ticket['status'], ticket['status'])}\n\n"
-        
-        message_text = MY_TICKETS_MESSAGE.format(tickets_list=tickets_list)
+        # Формируем список обращений и кнопки
+        tickets_list, ticket_buttons = render_ticket_list(tickets, start=page * TICKETS_PER_PAGE + 1)
+        message_text = MY_TICKETS_MESSAGE.render(tickets_list=tickets_list)
         
         await message.answer(
             message_text,
@@ -151,7 +155,7 @@ async def show_user_tickets_process(message: Message, page: int = 0):
         # Отправляем inline меню для выбора обращения
         await message.answer(
             "🎯 <b>Выберите обращение:</b>",
-            reply_markup=get_my_tickets_keyboard(tickets, page, total_pages),
+            reply_markup=get_my_tickets_keyboard(ticket_buttons, page, total_pages),
             parse_mode="HTML"
         )
         
@@ -163,7 +167,7 @@ async def show_user_tickets_process(message: Message, page: int = 0):
         )
 
 
-@router.callback_query(F.data == "new_ticket")
+@router.callback_query(F.data == "new_ticket", flags={"throttling_key": "ticket_create"})
 async def start_new_ticket(callback: CallbackQuery, state: FSMContext):
     """Начать создание нового обращения"""
     await callback.message.edit_text(
@@ -175,10 +179,11 @@ async def start_new_ticket(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("category_"), TicketStates.waiting_category)
-async def select_category(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(CategoryCallback.filter(), TicketStates.waiting_category)
+async def select_category(callback: CallbackQuery, callback_data: CategoryCallback,
+                          state: FSMContext):
     """Выбор категории обращения"""
-    category = callback.data.split("_", 1)[1]
+    category = callback_data.category
     
     if category not in TICKET_CATEGORIES:
         await callback.answer("❌ Неверная категория", show_alert=True)
@@ -282,7 +287,7 @@ async def input_subject(message: Message, state: FSMContext):
     await state.set_state(TicketStates.waiting_description)
 
 
-@router.message(TicketStates.waiting_description)
+@router.message(TicketStates.waiting_description, flags={"throttling_key": "ticket_write"})
 async def input_description(message: Message, state: FSMContext):
     """Ввод описания обращения"""
     if message.text == "❌ Отмена":
@@ -323,7 +328,8 @@ async def input_description(message: Message, state: FSMContext):
             user_id=message.from_user.id,
             category=category,
             subject=subject,
-            description=description
+            description=description,
+            idempotency_key=message_key(message)
         )
         
         # Очищаем состояние
@@ -331,7 +337,7 @@ async def input_description(message: Message, state: FSMContext):
         
         # Отправляем подтверждение с Reply клавиатурой
         category_name = TICKET_CATEGORIES.get(category, category)
-        success_message = TICKET_CREATED_MESSAGE.format(
+        success_message = TICKET_CREATED_MESSAGE.render(
             ticket_id=ticket_id,
             category=category_name,
             subject=subject
@@ -392,11 +398,10 @@ async def show_my_tickets(callback: CallbackQuery):
     await show_user_tickets_page(callback, 0)
 
 
-@router.callback_query(F.data.startswith("tickets_page_"))
-async def show_tickets_page(callback: CallbackQuery):
+@router.callback_query(TicketsPageCallback.filter())
+async def show_tickets_page(callback: CallbackQuery, callback_data: TicketsPageCallback):
     """Показать страницу обращений"""
-    page = int(callback.data.split("_")[-1])
-    await show_user_tickets_page(callback, page)
+    await show_user_tickets_page(callback, callback_data.page)
 
 
 async def show_user_tickets_page(callback: CallbackQuery, page: int = 0):
@@ -418,23 +423,17 @@ async def show_user_tickets_page(callback: CallbackQuery, page: int = 0):
             return
         
         # Подсчитываем общее количество страниц
-        total_tickets = len(await db.get_user_tickets(callback.from_user.id, limit=1000))
+        total_tickets = await db.count_user_tickets(callback.from_user.id)
         total_pages = math.ceil(total_tickets / TICKETS_PER_PAGE)
         
-        # Формируем список обращений
-        tickets_list = ""
-        for i, ticket in enumerate(tickets, 1):
-            status_emoji = "🆕" if ticket['status'] == 'new' else "⏳" if ticket['status'] == 'in_progress' else "✅"
-            created_date = datetime.fromisoformat(ticket['created_at']).strftime("%d.%m.%Y")
-            tickets_list += f"{i + page * TICKETS_PER_PAGE}. {status_emoji} <b>#{ticket['id']}</b> - {ticket['subject'][:40]}...\n"
-            tickets_list += f"   📅 {created_date} | {TICKET_STATUSES.get(ticket['status'], ticket['status'])}\n\n"
-        
-        message_text = MY_TICKETS_MESSAGE.format(tickets_list=tickets_list)
+        # Формируем список обращений и кнопки
+        tickets_list, ticket_buttons = render_ticket_list(tickets, start=page * TICKETS_PER_PAGE + 1)
+        message_text = MY_TICKETS_MESSAGE.render(tickets_list=tickets_list)
         
-        await callback.message.edit_text(
+        await edit_message(
+            callback.message,
             message_text,
-            reply_markup=get_my_tickets_keyboard(tickets, page, total_pages),
-            parse_mode="HTML"
+            reply_markup=get_my_tickets_keyboard(ticket_buttons, page, total_pages)
         )
         await callback.answer()
         
@@ -447,68 +446,70 @@ async def show_user_tickets_page(callback: CallbackQuery, page: int = 0):
         await callback.answer()
 
 
-@router.callback_query(F.data.startswith("ticket_"))
-async def show_ticket_details(callback: CallbackQuery):
+@router.callback_query(TicketCallback.filter())
+async def show_ticket_details(callback: CallbackQuery, callback_data: TicketCallback):
     """Показать детали обращения"""
     try:
-        ticket_id = int(callback.data.split("_")[1])
-        ticket = await db.get_ticket(ticket_id)
+        ticket_id = callback_data.ticket_id
+        ticket = await db.get_ticket(ticket_id, include_archived=True)
         
-        if not ticket or ticket['user_id'] != callback.from_user.id:
+        if not ticket or ticket.user_id != callback.from_user.id:
             await callback.answer(TICKET_NOT_FOUND, show_alert=True)
             return
         
         # Получаем сообщения обращения
-        messages = await db.get_ticket_messages(ticket_id)
+        messages = await db.get_ticket_messages(ticket_id, include_archived=ticket.archived, last_n=3)
         
         # Формируем информацию о сообщениях
         messages_info = ""
         if messages:
-            messages_info = f"\n<b>💬 Сообщения ({len(messages)}):</b>\n"
-            for msg in messages[-3:]:  # Показываем последние 3 сообщения
-                sender = "👨‍💼 Поддержка" if msg['is_admin'] else "👤 Вы"
-                msg_date = datetime.fromisoformat(msg['created_at']).strftime("%d.%m %H:%M")
-                messages_info += f"• {sender} ({msg_date}): {msg['message'][:100]}...\n"
+            messages_info = f"\n<b>💬 Сообщения ({ticket.message_count}):</b>\n" + "".join(
+                MESSAGE_PREVIEW.render(
+                    sender="👨‍💼 Поддержка" if msg.is_admin else "👤 Вы",
+                    date=format_timestamp(msg.created_at, "%d.%m %H:%M"),
+                    text=truncate(msg.message, 100)
+                )
+                for msg in messages  # Последние 3 сообщения
+            )
         
         # Форматируем даты
-        created_at = datetime.fromisoformat(ticket['created_at']).strftime("%d.%m.%Y %H:%M")
-        updated_at = datetime.fromisoformat(ticket['updated_at']).strftime("%d.%m.%Y %H:%M")
+        created_at = format_timestamp(ticket.created_at)
+        updated_at = format_timestamp(ticket.updated_at)
         
-        status_emoji = "🆕" if ticket['status'] == 'new' else "⏳" if ticket['status'] == 'in_progress' else "✅"
-        category_name = TICKET_CATEGORIES.get(ticket['category'], ticket['category'])
-        status_name = TICKET_STATUSES.get(ticket['status'], ticket['status'])
+        status_emoji = get_status_emoji(ticket.status)
+        category_name = TICKET_CATEGORIES.get(ticket.category, ticket.category)
+        status_name = TICKET_STATUSES.get(ticket.status, ticket.status)
         
-        details_text = TICKET_DETAILS_MESSAGE.format(
+        details_text = TICKET_DETAILS_MESSAGE.render(
             ticket_id=ticket_id,
-            subject=ticket['subject'],
+            subject=ticket.subject,
             category=category_name,
             status_emoji=status_emoji,
             status=status_name,
             created_at=created_at,
             updated_at=updated_at,
-            description=ticket['description'],
-            messages_info=messages_info
+            description=ticket.description,
+            messages_info=Markup(messages_info)
         )
         
-        user_can_respond = ticket['status'] in ['new', 'in_progress', 'waiting_response']
+        user_can_respond = ticket.status in ['new', 'in_progress', 'waiting_response']
         
-        await callback.message.edit_text(
+        await edit_long_message(
+            callback.message,
             details_text,
-            reply_markup=get_ticket_details_keyboard(ticket_id, ticket['status'], user_can_respond),
-            parse_mode="HTML"
+            reply_markup=get_ticket_details_keyboard(ticket_id, ticket.status, user_can_respond)
         )
         await callback.answer()
         
-    except ValueError:
-        await callback.answer("❌ Неверный ID обращения", show_alert=True)
     except Exception as e:
         await callback.answer("❌ Ошибка при загрузке обращения", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("respond_ticket_"))
-async def start_ticket_response(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(RespondTicketCallback.filter())
+async def start_ticket_response(callback: CallbackQuery, callback_data: RespondTicketCallback,
+                                state: FSMContext):
     """Начать ответ на обращение"""
-    ticket_id = int(callback.data.split("_")[-1])
+    ticket_id = callback_data.ticket_id
     
     await state.update_data(responding_ticket_id=ticket_id)
     await state.set_state(TicketStates.waiting_response)
@@ -522,7 +523,7 @@ async def start_ticket_response(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.message(TicketStates.waiting_response)
+@router.message(TicketStates.waiting_response, flags={"throttling_key": "ticket_write"})
 async def add_ticket_response(message: Message, state: FSMContext):
     """Добавить ответ к обращению"""
     data = await state.get_data()
@@ -551,16 +552,28 @@ async def add_ticket_response(message: Message, state: FSMContext):
     
     try:
         # Добавляем сообщение
-        await db.add_ticket_message(ticket_id, message.from_user.id, response_text, False)
+        if not await db.add_ticket_message(
+            ticket_id, message.from_user.id, response_text, False,
+            idempotency_key=message_key(message)
+        ):
+            # Это сообщение уже добавлено: всё равно выходим из режима ответа,
+            # иначе следующее сообщение тоже попадёт в обращение
+            await state.clear()
+            ticket = await db.get_ticket(ticket_id)
+            await message.answer(
+                f"ℹ️ Это сообщение уже добавлено к обращению #{ticket_id}",
+                reply_markup=get_ticket_details_keyboard(ticket_id, ticket.status if ticket else 'new')
+            )
+            return
         
         # Обновляем статус обращения
         ticket = await db.get_ticket(ticket_id)
         if ticket:
             # Если обращение в работе или новое, переводим в ожидание ответа
-            if ticket['status'] in ['in_progress', 'new']:
+            if ticket.status in ['in_progress', 'new']:
                 await db.update_ticket_status(ticket_id, 'waiting_response')
             # Если было закрыто, переоткрываем
-            elif ticket['status'] in ['resolved', 'closed']:
+            elif ticket.status in ['resolved', 'closed']:
                 await db.update_ticket_status(ticket_id, 'waiting_response')
         
         await state.clear()
@@ -568,7 +581,7 @@ async def add_ticket_response(message: Message, state: FSMContext):
         await message.answer(
             f"✅ <b>Сообщение добавлено к обращению #{ticket_id}</b>\n\n"
             "Специалист поддержки получит уведомление и ответит в ближайшее время.",
-            reply_markup=get_ticket_details_keyboard(ticket_id, ticket['status'] if ticket else 'new'),
+            reply_markup=get_ticket_details_keyboard(ticket_id, ticket.status if ticket else 'new'),
             parse_mode="HTML"
         )
         
@@ -584,19 +597,19 @@ async def add_ticket_response(message: Message, state: FSMContext):
         await state.clear()
 
 
-@router.callback_query(F.data.startswith("close_ticket_"))
-async def close_ticket(callback: CallbackQuery):
+@router.callback_query(CloseTicketCallback.filter())
+async def close_ticket(callback: CallbackQuery, callback_data: CloseTicketCallback):
     """Закрыть обращение пользователем"""
-    ticket_id = int(callback.data.split("_")[-1])
+    ticket_id = callback_data.ticket_id
     
     try:
         ticket = await db.get_ticket(ticket_id)
         
-        if not ticket or ticket['user_id'] != callback.from_user.id:
+        if not ticket or ticket.user_id != callback.from_user.id:
             await callback.answer(TICKET_NOT_FOUND, show_alert=True)
             return
         
-        if ticket['status'] != 'resolved':
+        if ticket.status != 'resolved':
             await callback.answer("❌ Можно закрыть только решенные обращения", show_alert=True)
             return
         
@@ -645,22 +658,16 @@ async def show_my_tickets_inline(callback: CallbackQuery):
             return
         
         # Подсчитываем общее количество страниц
-        total_tickets = len(await db.get_user_tickets(callback.from_user.id, limit=1000))
+        total_tickets = await db.count_user_tickets(callback.from_user.id)
         total_pages = math.ceil(total_tickets / TICKETS_PER_PAGE)
         
-        # Формируем список обращений
-        tickets_list = ""
-        for i, ticket in enumerate(tickets, 1):
-            status_emoji = "🆕" if ticket['status'] == 'new' else "⏳" if ticket['status'] == 'in_progress' else "✅"
-            created_date = datetime.fromisoformat(ticket['created_at']).strftime("%d.%m.%Y")
-            tickets_list += f"{i}. {status_emoji} <b>#{ticket['id']}</b> - {ticket['subject'][:40]}...\n"
-            tickets_list += f"   📅 {created_date} | {TICKET_STATUSES.get(ticket['status'], ticket['status'])}\n\n"
-        
-        message_text = MY_TICKETS_MESSAGE.format(tickets_list=tickets_list)
+        # Формируем список обращений и кнопки
+        tickets_list, ticket_buttons = render_ticket_list(tickets, start=1)
+        message_text = MY_TICKETS_MESSAGE.render(tickets_list=tickets_list)
         
         await callback.message.edit_text(
             message_text,
-            reply_markup=get_my_tickets_keyboard(tickets, 0, total_pages),
+            reply_markup=get_my_tickets_keyboard(ticket_buttons, 0, total_pages),
             parse_mode="HTML"
         )
         await callback.answer()
@@ -674,10 +681,10 @@ async def show_my_tickets_inline(callback: CallbackQuery):
         await callback.answer()
 
 
-@router.callback_query(F.data.startswith("faq_"))
-async def show_faq_item(callback: CallbackQuery):
+@router.callback_query(FaqCallback.filter())
+async def show_faq_item(callback: CallbackQuery, callback_data: FaqCallback):
     """Показать элемент FAQ"""
-    faq_id = callback.data.split("_", 1)[1]
+    faq_id = callback_data.item
     
     if faq_id not in FAQ_ITEMS:
         await callback.answer("❌ FAQ не найден", show_alert=True)
@@ -703,18 +710,15 @@ async def notify_support_new_ticket(ticket_id: int, user_name: str):
     if not ticket:
         return
     
-    category_name = TICKET_CATEGORIES.get(ticket['category'], ticket['category'])
+    category_name = TICKET_CATEGORIES.get(ticket.category, ticket.category)
     
-    notification_text = f"""
-🆕 <b>Новое обращение #{ticket_id}</b>
-
-👤 <b>От:</b> {user_name}
-📂 <b>Категория:</b> {category_name}
-📝 <b>Тема:</b> {ticket['subject'][:50]}...
-⏰ <b>Время:</b> {datetime.now().strftime('%d.%m.%Y %H:%M')}
-
-Требует обработки.
-"""
+    notification_text = NEW_TICKET_NOTIFICATION.render(
+        ticket=ticket,
+        user_name=user_name,
+        category=category_name,
+        subject=truncate(ticket.subject, 50),
+        time=local_now().strftime('%d.%m.%Y %H:%M')
+    )
     
     # Создаем inline клавиатуру для быстрых действий
     from keyboards.admin import get_quick_ticket_actions
@@ -756,16 +760,13 @@ async def notify_support_ticket_update(ticket_id: int, user_name: str):
     if not ticket:
         return
     
-    notification_text = f"""
-💬 <b>Новое сообщение в обращении #{ticket_id}</b>
-
-👤 <b>От:</b> {user_name}
-📝 <b>Тема:</b> {ticket['subject'][:40]}...
-📊 <b>Статус:</b> {TICKET_STATUSES.get(ticket['status'], ticket['status'])}
-⏰ <b>Время:</b> {datetime.now().strftime('%d.%m.%Y %H:%M')}
-
-Требует ответа.
-"""
+    notification_text = TICKET_UPDATE_NOTIFICATION.render(
+        ticket=ticket,
+        user_name=user_name,
+        subject=truncate(ticket.subject, 40),
+        status=TICKET_STATUSES.get(ticket.status, ticket.status),
+        time=local_now().strftime('%d.%m.%Y %H:%M')
+    )
     
     # Создаем inline клавиатуру для быстрых действий
     quick_actions = get_quick_ticket_actions(ticket_id, "notification")
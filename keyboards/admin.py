@@ -2,10 +2,17 @@
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from typing import List, Dict, Any
+from typing import List, Dict
 from utils.texts import TICKET_STATUSES
+from keyboards.cache import static_markup, memoized_markup
+from keyboards.callback_data import (
+    AdminTicketCallback, AdminRespondCallback, AdminStatusCallback, AdminPriorityCallback,
+    AdminAssignCallback, SearchTicketCallback, QuickResponseCallback, StatusCode, PriorityCode,
+    TranscriptCallback, TranscriptExportCallback
+)
 
 
+@static_markup
 def get_admin_panel() -> InlineKeyboardMarkup:
     """Главная панель администратора"""
     keyboard = InlineKeyboardBuilder()
@@ -29,6 +36,7 @@ def get_admin_panel() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@static_markup
 def get_agent_panel() -> InlineKeyboardMarkup:
     """Главная панель агента поддержки (упрощённая)"""
     keyboard = InlineKeyboardBuilder()
@@ -48,6 +56,7 @@ def get_agent_panel() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@memoized_markup
 def get_quick_ticket_actions(ticket_id: int, context: str = "default") -> InlineKeyboardMarkup:
     """Быстрые действия для обращения в уведомлениях"""
     keyboard = InlineKeyboardBuilder()
@@ -55,45 +64,39 @@ def get_quick_ticket_actions(ticket_id: int, context: str = "default") -> Inline
     keyboard.row(
         InlineKeyboardButton(
             text="👁 Посмотреть", 
-            callback_data=f"admin_ticket_{ticket_id}"
+            callback_data=AdminTicketCallback(ticket_id=ticket_id).pack()
         ),
         InlineKeyboardButton(
             text="💬 Ответить", 
-            callback_data=f"admin_respond_{ticket_id}"
+            callback_data=AdminRespondCallback(ticket_id=ticket_id).pack()
         )
     )
     keyboard.row(
         InlineKeyboardButton(
             text="✅ Взять в работу", 
-            callback_data=f"admin_status_{ticket_id}_in_progress"
+            callback_data=AdminStatusCallback(ticket_id=ticket_id, status=StatusCode.in_progress).pack()
         ),
         InlineKeyboardButton(
             text="🔍 Найти по ID", 
-            callback_data=f"search_ticket_{ticket_id}"
+            callback_data=SearchTicketCallback(ticket_id=ticket_id).pack()
         )
     )
     
     return keyboard.as_markup()
 
 
-def get_admin_tickets_keyboard(tickets: List[Dict[str, Any]], 
+def get_admin_tickets_keyboard(ticket_buttons: List[InlineKeyboardButton], 
                               ticket_type: str = "new",
                               user_role: str = "admin") -> InlineKeyboardMarkup:
-    """Клавиатура для просмотра обращений (для админов и агентов)"""
+    """Клавиатура для просмотра обращений (для админов и агентов)
+    
+    ticket_buttons - кнопки обращений из utils.ticket_list.render_ticket_list
+    """
     keyboard = InlineKeyboardBuilder()
     
     # Кнопки обращений
-    for ticket in tickets:
-        priority_emoji = "🔴" if ticket.get('priority') == 'high' else "🟡" if ticket.get('priority') == 'medium' else "🟢"
-        user_name = ticket.get('first_name', 'Пользователь')
-        button_text = f"{priority_emoji} #{ticket['id']} - {user_name} - {ticket['subject'][:25]}..."
-        
-        keyboard.row(
-            InlineKeyboardButton(
-                text=button_text,
-                callback_data=f"admin_ticket_{ticket['id']}"
-            )
-        )
+    for button in ticket_buttons:
+        keyboard.row(button)
     
     # Навигация
     navigation_buttons = []
@@ -131,6 +134,7 @@ def get_admin_tickets_keyboard(tickets: List[Dict[str, Any]],
     return keyboard.as_markup()
 
 
+@memoized_markup
 def get_admin_ticket_actions(ticket_id: int, current_status: str, 
                            assigned_admin: int = None, 
                            current_admin: int = None,
@@ -142,7 +146,7 @@ def get_admin_ticket_actions(ticket_id: int, current_status: str,
     keyboard.row(
         InlineKeyboardButton(
             text="💬 Отправить ответ", 
-            callback_data=f"admin_respond_{ticket_id}"
+            callback_data=AdminRespondCallback(ticket_id=ticket_id).pack()
         )
     )
     
@@ -150,22 +154,22 @@ def get_admin_ticket_actions(ticket_id: int, current_status: str,
     status_buttons = []
     if current_status == 'new':
         status_buttons.extend([
-            InlineKeyboardButton(text="🔄 Взять в работу", callback_data=f"admin_status_{ticket_id}_in_progress"),
-            InlineKeyboardButton(text="✅ Решить", callback_data=f"admin_status_{ticket_id}_resolved")
+            InlineKeyboardButton(text="🔄 Взять в работу", callback_data=AdminStatusCallback(ticket_id=ticket_id, status=StatusCode.in_progress).pack()),
+            InlineKeyboardButton(text="✅ Решить", callback_data=AdminStatusCallback(ticket_id=ticket_id, status=StatusCode.resolved).pack())
         ])
     elif current_status == 'in_progress':
         status_buttons.extend([
-            InlineKeyboardButton(text="⏰ Ожидает ответа", callback_data=f"admin_status_{ticket_id}_waiting_response"),
-            InlineKeyboardButton(text="✅ Решить", callback_data=f"admin_status_{ticket_id}_resolved")
+            InlineKeyboardButton(text="⏰ Ожидает ответа", callback_data=AdminStatusCallback(ticket_id=ticket_id, status=StatusCode.waiting_response).pack()),
+            InlineKeyboardButton(text="✅ Решить", callback_data=AdminStatusCallback(ticket_id=ticket_id, status=StatusCode.resolved).pack())
         ])
     elif current_status == 'waiting_response':
         status_buttons.extend([
-            InlineKeyboardButton(text="🔄 Вернуть в работу", callback_data=f"admin_status_{ticket_id}_in_progress"),
-            InlineKeyboardButton(text="✅ Решить", callback_data=f"admin_status_{ticket_id}_resolved")
+            InlineKeyboardButton(text="🔄 Вернуть в работу", callback_data=AdminStatusCallback(ticket_id=ticket_id, status=StatusCode.in_progress).pack()),
+            InlineKeyboardButton(text="✅ Решить", callback_data=AdminStatusCallback(ticket_id=ticket_id, status=StatusCode.resolved).pack())
         ])
     elif current_status == 'resolved':
         status_buttons.append(
-            InlineKeyboardButton(text="🔒 Закрыть", callback_data=f"admin_status_{ticket_id}_closed")
+            InlineKeyboardButton(text="🔒 Закрыть", callback_data=AdminStatusCallback(ticket_id=ticket_id, status=StatusCode.closed).pack())
         )
     
     if status_buttons:
@@ -176,9 +180,9 @@ def get_admin_ticket_actions(ticket_id: int, current_status: str,
     
     # Кнопки приоритета
     keyboard.row(
-        InlineKeyboardButton(text="🔴 Высокий", callback_data=f"admin_priority_{ticket_id}_high"),
-        InlineKeyboardButton(text="🟡 Средний", callback_data=f"admin_priority_{ticket_id}_medium"),
-        InlineKeyboardButton(text="🟢 Низкий", callback_data=f"admin_priority_{ticket_id}_low")
+        InlineKeyboardButton(text="🔴 Высокий", callback_data=AdminPriorityCallback(ticket_id=ticket_id, priority=PriorityCode.high).pack()),
+        InlineKeyboardButton(text="🟡 Средний", callback_data=AdminPriorityCallback(ticket_id=ticket_id, priority=PriorityCode.medium).pack()),
+        InlineKeyboardButton(text="🟢 Низкий", callback_data=AdminPriorityCallback(ticket_id=ticket_id, priority=PriorityCode.low).pack())
     )
     
     # Кнопка назначения админа (ТОЛЬКО для админов)
@@ -186,10 +190,17 @@ def get_admin_ticket_actions(ticket_id: int, current_status: str,
         keyboard.row(
             InlineKeyboardButton(
                 text="👤 Назначить админа", 
-                callback_data=f"admin_assign_{ticket_id}"
+                callback_data=AdminAssignCallback(ticket_id=ticket_id).pack()
             )
         )
     
+    keyboard.row(
+        InlineKeyboardButton(
+            text="📜 Вся переписка",
+            callback_data=TranscriptCallback(ticket_id=ticket_id).pack()
+        )
+    )
+    
     # Навигация (разная для ролей)
     if user_role == 'admin':
         keyboard.row(
@@ -205,6 +216,68 @@ def get_admin_ticket_actions(ticket_id: int, current_status: str,
     return keyboard.as_markup()
 
 
+@memoized_markup
+def get_archived_ticket_keyboard(ticket_id: int, user_role: str = 'admin') -> InlineKeyboardMarkup:
+    """Клавиатура архивного обращения (только просмотр)"""
+    keyboard = InlineKeyboardBuilder()
+    
+    keyboard.row(
+        InlineKeyboardButton(
+            text="📜 Вся переписка",
+            callback_data=TranscriptCallback(ticket_id=ticket_id).pack()
+        )
+    )
+    keyboard.attach(InlineKeyboardBuilder.from_markup(
+        get_admin_tickets_keyboard([], "closed", user_role)
+    ))
+    
+    return keyboard.as_markup()
+
+
+@memoized_markup
+def get_transcript_keyboard(ticket_id: int, older_than: int = None,
+                            newer_than: int = None) -> InlineKeyboardMarkup:
+    """Листание переписки и выгрузка её файлом
+    
+    older_than/newer_than - id крайних сообщений страницы, если в эту
+    сторону ещё есть сообщения.
+    """
+    keyboard = InlineKeyboardBuilder()
+    
+    pages = []
+    if older_than is not None:
+        pages.append(InlineKeyboardButton(
+            text="⬅️ Раньше",
+            callback_data=TranscriptCallback(ticket_id=ticket_id, before=older_than).pack()
+        ))
+    if newer_than is not None:
+        pages.append(InlineKeyboardButton(
+            text="Позже ➡️",
+            callback_data=TranscriptCallback(ticket_id=ticket_id, after=newer_than).pack()
+        ))
+    if pages:
+        keyboard.row(*pages)
+    
+    keyboard.row(
+        InlineKeyboardButton(
+            text="📄 Скачать TXT",
+            callback_data=TranscriptExportCallback(ticket_id=ticket_id, fmt='txt').pack()
+        ),
+        InlineKeyboardButton(
+            text="🌐 Скачать HTML",
+            callback_data=TranscriptExportCallback(ticket_id=ticket_id, fmt='html').pack()
+        )
+    )
+    keyboard.row(
+        InlineKeyboardButton(
+            text="◀️ К обращению",
+            callback_data=AdminTicketCallback(ticket_id=ticket_id).pack()
+        )
+    )
+    
+    return keyboard.as_markup()
+
+
 def get_admin_stats_keyboard(stats: Dict[str, int]) -> InlineKeyboardMarkup:
     """Клавиатура статистики для админа"""
     keyboard = InlineKeyboardBuilder()
@@ -239,6 +312,7 @@ def get_admin_stats_keyboard(stats: Dict[str, int]) -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@static_markup
 def get_admin_manage_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура управления пользователями"""
     keyboard = InlineKeyboardBuilder()
@@ -258,6 +332,7 @@ def get_admin_manage_keyboard() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@static_markup
 def get_admin_settings_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура настроек системы"""
     keyboard = InlineKeyboardBuilder()
@@ -277,6 +352,7 @@ def get_admin_settings_keyboard() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@static_markup
 def get_admin_export_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура экспорта данных"""
     keyboard = InlineKeyboardBuilder()
@@ -287,8 +363,15 @@ def get_admin_export_keyboard() -> InlineKeyboardMarkup:
     )
     keyboard.row(
         InlineKeyboardButton(text="👥 Пользователи", callback_data="admin_export_users"),
+        InlineKeyboardButton(text="💬 Сообщения", callback_data="admin_export_messages")
+    )
+    keyboard.row(
+        InlineKeyboardButton(text="🧾 Всё в JSONL", callback_data="admin_export_jsonl"),
         InlineKeyboardButton(text="📈 Отчёт", callback_data="admin_export_report")
     )
+    keyboard.row(
+        InlineKeyboardButton(text="🔄 Изменения с прошлой выгрузки", callback_data="admin_export_delta")
+    )
     keyboard.row(
         InlineKeyboardButton(text="🔙 Назад", callback_data="admin_panel")
     )
@@ -296,24 +379,26 @@ def get_admin_export_keyboard() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@memoized_markup
 def get_priority_keyboard_admin(ticket_id: int) -> InlineKeyboardMarkup:
     """Клавиатура выбора приоритета администратором"""
     keyboard = InlineKeyboardBuilder()
     
     keyboard.row(
-        InlineKeyboardButton(text="🔴 Высокий", callback_data=f"admin_priority_{ticket_id}_high"),
-        InlineKeyboardButton(text="🟡 Средний", callback_data=f"admin_priority_{ticket_id}_medium")
+        InlineKeyboardButton(text="🔴 Высокий", callback_data=AdminPriorityCallback(ticket_id=ticket_id, priority=PriorityCode.high).pack()),
+        InlineKeyboardButton(text="🟡 Средний", callback_data=AdminPriorityCallback(ticket_id=ticket_id, priority=PriorityCode.medium).pack())
     )
     keyboard.row(
-        InlineKeyboardButton(text="🟢 Низкий", callback_data=f"admin_priority_{ticket_id}_low")
+        InlineKeyboardButton(text="🟢 Низкий", callback_data=AdminPriorityCallback(ticket_id=ticket_id, priority=PriorityCode.low).pack())
     )
     keyboard.row(
-        InlineKeyboardButton(text="❌ Отмена", callback_data=f"admin_ticket_{ticket_id}")
+        InlineKeyboardButton(text="❌ Отмена", callback_data=AdminTicketCallback(ticket_id=ticket_id).pack())
     )
     
     return keyboard.as_markup()
 
 
+@memoized_markup
 def get_confirm_action_keyboard(action: str, ticket_id: int = None, 
                                user_id: int = None) -> InlineKeyboardMarkup:
     """Клавиатура подтверждения действия администратором"""
@@ -324,7 +409,7 @@ def get_confirm_action_keyboard(action: str, ticket_id: int = None,
     
     if ticket_id:
         confirm_data += f"_{ticket_id}"
-        cancel_data = f"admin_ticket_{ticket_id}"
+        cancel_data = AdminTicketCallback(ticket_id=ticket_id).pack()
     elif user_id:
         confirm_data += f"_{user_id}"
     
@@ -336,6 +421,7 @@ def get_confirm_action_keyboard(action: str, ticket_id: int = None,
     return keyboard.as_markup()
 
 
+@static_markup
 def get_admin_search_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура поиска для администратора"""
     keyboard = InlineKeyboardBuilder()
@@ -355,16 +441,17 @@ def get_admin_search_keyboard() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@static_markup
 def get_admin_quick_responses() -> InlineKeyboardMarkup:
     """Клавиатура быстрых ответов для администратора"""
     keyboard = InlineKeyboardBuilder()
     
     quick_responses = [
-        ("✅ Проблема решена", "quick_resolved"),
-        ("⏳ Работаем над проблемой", "quick_in_progress"),
-        ("❓ Нужна дополнительная информация", "quick_need_info"),
-        ("📋 Переадресовано в другой отдел", "quick_forwarded"),
-        ("🔧 Проблема на стороне разработчиков", "quick_dev_issue")
+        ("✅ Проблема решена", QuickResponseCallback(kind="resolved").pack()),
+        ("⏳ Работаем над проблемой", QuickResponseCallback(kind="in_progress").pack()),
+        ("❓ Нужна дополнительная информация", QuickResponseCallback(kind="need_info").pack()),
+        ("📋 Переадресовано в другой отдел", QuickResponseCallback(kind="forwarded").pack()),
+        ("🔧 Проблема на стороне разработчиков", QuickResponseCallback(kind="dev_issue").pack())
     ]
     
     for text, callback_data in quick_responses:
@@ -379,6 +466,7 @@ def get_admin_quick_responses() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@memoized_markup
 def get_ticket_status_keyboard(ticket_id: int, current_status: str) -> InlineKeyboardMarkup:
     """Клавиатура изменения статуса обращения"""
     keyboard = InlineKeyboardBuilder()
@@ -399,12 +487,12 @@ def get_ticket_status_keyboard(ticket_id: int, current_status: str) -> InlineKey
         keyboard.row(
             InlineKeyboardButton(
                 text=TICKET_STATUSES[status],
-                callback_data=f"admin_status_{ticket_id}_{status}"
+                callback_data=AdminStatusCallback(ticket_id=ticket_id, status=StatusCode[status]).pack()
             )
         )
     
     keyboard.row(
-        InlineKeyboardButton(text="❌ Отмена", callback_data=f"admin_ticket_{ticket_id}")
+        InlineKeyboardButton(text="❌ Отмена", callback_data=AdminTicketCallback(ticket_id=ticket_id).pack())
     )
     
     return keyboard.as_markup()
\ No newline at end of file
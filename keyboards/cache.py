@@ -0,0 +1,31 @@
+"""Кэш готовых клавиатур
+
+Статические клавиатуры собираются один раз при импорте модуля,
+параметризованные - один раз на набор аргументов. Возвращаемые
+разметки общие для всех вызовов, изменять их нельзя.
+"""
+
+from functools import lru_cache, wraps
+from typing import Callable, TypeVar
+
+from config import KEYBOARD_CACHE_SIZE
+
+Markup = TypeVar('Markup')
+
+
+def static_markup(build: Callable[[], Markup]) -> Callable[[], Markup]:
+    """Собрать клавиатуру без параметров сразу и дальше отдавать готовую"""
+    markup = build()
+    
+    @wraps(build)
+    def get() -> Markup:
+        return markup
+    return get
+
+
+def memoized_markup(build: Callable[..., Markup]) -> Callable[..., Markup]:
+    """Запоминать клавиатуру для каждого набора аргументов
+    
+    Аргументы должны быть хешируемыми (числа, строки, флаги).
+    """
+    return lru_cache(maxsize=KEYBOARD_CACHE_SIZE)(build)
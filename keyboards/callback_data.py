@@ -0,0 +1,103 @@
+"""Типизированные callback-данные inline-кнопок
+
+Вместо строк вида admin_status_{id}_waiting_response и разбора через
+split("_") кнопки упаковываются классами CallbackData с короткими
+префиксами, а статусы и приоритеты - однобуквенными кодами. Данные
+разбираются и проверяются фильтром Class.filter() за один проход,
+обработчик получает готовый объект в аргументе callback_data.
+Telegram ограничивает callback_data 64 байтами, pack() проверяет
+это при создании кнопки.
+"""
+
+from enum import Enum
+from typing import Optional
+
+from aiogram.filters.callback_data import CallbackData
+
+
+class StatusCode(str, Enum):
+    """Короткие коды статусов, имя элемента совпадает со статусом в БД"""
+    new = 'n'
+    in_progress = 'p'
+    waiting_response = 'w'
+    resolved = 'r'
+    closed = 'c'
+
+
+class PriorityCode(str, Enum):
+    """Короткие коды приоритетов, имя элемента совпадает с приоритетом в БД"""
+    high = 'h'
+    medium = 'm'
+    low = 'l'
+
+
+# Пользовательские кнопки
+
+class CategoryCallback(CallbackData, prefix='cat'):
+    category: str
+
+
+class TicketCallback(CallbackData, prefix='t'):
+    ticket_id: int
+
+
+class TicketsPageCallback(CallbackData, prefix='tp'):
+    page: int
+    # Резерв под курсор постраничного вывода (id последнего обращения)
+    cursor: Optional[int] = None
+
+
+class RespondTicketCallback(CallbackData, prefix='rt'):
+    ticket_id: int
+
+
+class CloseTicketCallback(CallbackData, prefix='ct'):
+    ticket_id: int
+
+
+class FaqCallback(CallbackData, prefix='fq'):
+    item: str
+
+
+# Кнопки администраторов и агентов
+
+class AdminTicketCallback(CallbackData, prefix='at'):
+    ticket_id: int
+
+
+class AdminRespondCallback(CallbackData, prefix='ar'):
+    ticket_id: int
+
+
+class AdminStatusCallback(CallbackData, prefix='as'):
+    ticket_id: int
+    status: StatusCode
+
+
+class AdminPriorityCallback(CallbackData, prefix='ap'):
+    ticket_id: int
+    priority: PriorityCode
+
+
+class AdminAssignCallback(CallbackData, prefix='aa'):
+    ticket_id: int
+
+
+class SearchTicketCallback(CallbackData, prefix='st'):
+    ticket_id: int
+
+
+class QuickResponseCallback(CallbackData, prefix='qr'):
+    kind: str
+
+
+class TranscriptCallback(CallbackData, prefix='tr'):
+    ticket_id: int
+    # Курсоры страниц: сообщения старше before или новее after
+    before: Optional[int] = None
+    after: Optional[int] = None
+
+
+class TranscriptExportCallback(CallbackData, prefix='tx'):
+    ticket_id: int
+    fmt: str
@@ -2,11 +2,13 @@
 
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
+from keyboards.cache import static_markup, memoized_markup
 
 
 # УБРАЛИ СЛОЖНУЮ ЛОГИКУ - упростили интерфейсы
 
 
+@memoized_markup
 def get_client_main_keyboard(show_admin_return: bool = False, show_agent_return: bool = False) -> ReplyKeyboardMarkup:
     """Основная клавиатура для клиентов"""
     keyboard = ReplyKeyboardBuilder()
@@ -36,6 +38,7 @@ def get_client_main_keyboard(show_admin_return: bool = False, show_agent_return:
     )
 
 
+@memoized_markup
 def get_agent_main_keyboard(show_admin_return: bool = False) -> ReplyKeyboardMarkup:
     """Упрощённая клавиатура для агентов поддержки"""
     keyboard = ReplyKeyboardBuilder()
@@ -53,6 +56,7 @@ def get_agent_main_keyboard(show_admin_return: bool = False) -> ReplyKeyboardMar
     )
 
 
+@static_markup
 def get_admin_main_keyboard() -> ReplyKeyboardMarkup:
     """Основная клавиатура для администраторов"""
     keyboard = ReplyKeyboardBuilder()
@@ -84,6 +88,7 @@ def get_admin_main_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
+@static_markup
 def get_ticket_categories_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура для выбора категории обращения"""
     keyboard = ReplyKeyboardBuilder()
@@ -111,6 +116,7 @@ def get_ticket_categories_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
+@static_markup
 def get_agent_actions_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура действий агента с обращением"""
     keyboard = ReplyKeyboardBuilder()
@@ -135,6 +141,7 @@ def get_agent_actions_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
+@static_markup
 def get_admin_user_management_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура управления пользователями для админа"""
     keyboard = ReplyKeyboardBuilder()
@@ -162,6 +169,7 @@ def get_admin_user_management_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
+@static_markup
 def get_priority_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура выбора приоритета"""
     keyboard = ReplyKeyboardBuilder()
@@ -182,6 +190,7 @@ def get_priority_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
+@static_markup
 def get_quick_responses_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура быстрых ответов"""
     keyboard = ReplyKeyboardBuilder()
@@ -206,6 +215,7 @@ def get_quick_responses_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
+@static_markup
 def get_search_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура для поиска"""
     keyboard = ReplyKeyboardBuilder()
@@ -229,6 +239,7 @@ def get_search_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
+@memoized_markup
 def get_confirmation_keyboard(action_text: str = "действие") -> ReplyKeyboardMarkup:
     """Клавиатура подтверждения действия"""
     keyboard = ReplyKeyboardBuilder()
@@ -245,6 +256,7 @@ def get_confirmation_keyboard(action_text: str = "действие") -> ReplyKey
     )
 
 
+@static_markup
 def get_cancel_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура только с кнопкой отмены"""
     keyboard = ReplyKeyboardBuilder()
@@ -260,11 +272,13 @@ def get_cancel_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
+@static_markup
 def remove_keyboard() -> ReplyKeyboardRemove:
     """Удаление клавиатуры"""
     return ReplyKeyboardRemove()
 
 
+@memoized_markup
 def get_role_switch_keyboard(current_role: str) -> ReplyKeyboardMarkup:
     """Клавиатура переключения ролей"""
     keyboard = ReplyKeyboardBuilder()
@@ -2,10 +2,16 @@
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from typing import List, Dict, Any
+from typing import List
 from utils.texts import TICKET_CATEGORIES, TICKET_STATUSES, FAQ_ITEMS
+from keyboards.cache import static_markup, memoized_markup
+from keyboards.callback_data import (
+    CategoryCallback, TicketCallback, TicketsPageCallback, RespondTicketCallback,
+    CloseTicketCallback, FaqCallback
+)
 
 
+@static_markup
 def get_main_menu() -> InlineKeyboardMarkup:
     """Главное меню пользователя"""
     keyboard = InlineKeyboardBuilder()
@@ -25,6 +31,7 @@ def get_main_menu() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@static_markup
 def get_ticket_categories() -> InlineKeyboardMarkup:
     """Клавиатура выбора категории обращения"""
     keyboard = InlineKeyboardBuilder()
@@ -33,7 +40,7 @@ def get_ticket_categories() -> InlineKeyboardMarkup:
         keyboard.row(
             InlineKeyboardButton(
                 text=category_name, 
-                callback_data=f"category_{category_id}"
+                callback_data=CategoryCallback(category=category_id).pack()
             )
         )
     
@@ -44,6 +51,7 @@ def get_ticket_categories() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@static_markup
 def get_cancel_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура с кнопкой отмены"""
     keyboard = InlineKeyboardBuilder()
@@ -53,32 +61,28 @@ def get_cancel_keyboard() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
-def get_my_tickets_keyboard(tickets: List[Dict[str, Any]], page: int = 0, 
+def get_my_tickets_keyboard(ticket_buttons: List[InlineKeyboardButton], page: int = 0, 
                            total_pages: int = 1) -> InlineKeyboardMarkup:
-    """Клавиатура для просмотра обращений пользователя"""
+    """Клавиатура для просмотра обращений пользователя
+    
+    ticket_buttons - кнопки обращений из utils.ticket_list.render_ticket_list
+    """
     keyboard = InlineKeyboardBuilder()
     
     # Кнопки обращений
-    for ticket in tickets:
-        status_emoji = "🆕" if ticket['status'] == 'new' else "⏳" if ticket['status'] == 'in_progress' else "✅"
-        button_text = f"{status_emoji} #{ticket['id']} - {ticket['subject'][:30]}..."
-        keyboard.row(
-            InlineKeyboardButton(
-                text=button_text,
-                callback_data=f"ticket_{ticket['id']}"
-            )
-        )
+    for button in ticket_buttons:
+        keyboard.row(button)
     
     # Навигация по страницам
     if total_pages > 1:
         nav_buttons = []
         if page > 0:
             nav_buttons.append(
-                InlineKeyboardButton(text="⬅️ Назад", callback_data=f"tickets_page_{page-1}")
+                InlineKeyboardButton(text="⬅️ Назад", callback_data=TicketsPageCallback(page=page - 1).pack())
             )
         if page < total_pages - 1:
             nav_buttons.append(
-                InlineKeyboardButton(text="Вперед ➡️", callback_data=f"tickets_page_{page+1}")
+                InlineKeyboardButton(text="Вперед ➡️", callback_data=TicketsPageCallback(page=page + 1).pack())
             )
         if nav_buttons:
             keyboard.row(*nav_buttons)
@@ -94,6 +98,7 @@ def get_my_tickets_keyboard(tickets: List[Dict[str, Any]], page: int = 0,
     return keyboard.as_markup()
 
 
+@memoized_markup
 def get_ticket_details_keyboard(ticket_id: int, status: str, 
                                user_can_respond: bool = True) -> InlineKeyboardMarkup:
     """Клавиатура для детального просмотра обращения"""
@@ -104,7 +109,7 @@ def get_ticket_details_keyboard(ticket_id: int, status: str,
         keyboard.row(
             InlineKeyboardButton(
                 text="💬 Добавить сообщение", 
-                callback_data=f"respond_ticket_{ticket_id}"
+                callback_data=RespondTicketCallback(ticket_id=ticket_id).pack()
             )
         )
     
@@ -113,7 +118,7 @@ def get_ticket_details_keyboard(ticket_id: int, status: str,
         keyboard.row(
             InlineKeyboardButton(
                 text="✅ Закрыть обращение", 
-                callback_data=f"close_ticket_{ticket_id}"
+                callback_data=CloseTicketCallback(ticket_id=ticket_id).pack()
             )
         )
     
@@ -125,6 +130,7 @@ def get_ticket_details_keyboard(ticket_id: int, status: str,
     return keyboard.as_markup()
 
 
+@static_markup
 def get_faq_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура FAQ"""
     keyboard = InlineKeyboardBuilder()
@@ -133,7 +139,7 @@ def get_faq_keyboard() -> InlineKeyboardMarkup:
         keyboard.row(
             InlineKeyboardButton(
                 text=faq_data['question'],
-                callback_data=f"faq_{faq_id}"
+                callback_data=FaqCallback(item=faq_id).pack()
             )
         )
     
@@ -144,6 +150,7 @@ def get_faq_keyboard() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@static_markup
 def get_faq_item_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для отдельного FAQ элемента"""
     keyboard = InlineKeyboardBuilder()
@@ -159,6 +166,7 @@ def get_faq_item_keyboard() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@static_markup
 def get_contacts_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для страницы контактов"""
     keyboard = InlineKeyboardBuilder()
@@ -173,6 +181,7 @@ def get_contacts_keyboard() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@memoized_markup
 def get_ticket_created_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
     """Клавиатура после создания обращения"""
     keyboard = InlineKeyboardBuilder()
@@ -180,7 +189,7 @@ def get_ticket_created_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
     keyboard.row(
         InlineKeyboardButton(
             text="👁️ Посмотреть обращение", 
-            callback_data=f"ticket_{ticket_id}"
+            callback_data=TicketCallback(ticket_id=ticket_id).pack()
         )
     )
     keyboard.row(
@@ -191,6 +200,7 @@ def get_ticket_created_keyboard(ticket_id: int) -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@static_markup
 def get_priority_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора приоритета (опционально)"""
     keyboard = InlineKeyboardBuilder()
@@ -209,6 +219,7 @@ def get_priority_keyboard() -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@memoized_markup
 def get_confirmation_keyboard(action: str, item_id: int = None) -> InlineKeyboardMarkup:
     """Клавиатура подтверждения действия"""
     keyboard = InlineKeyboardBuilder()
@@ -228,6 +239,7 @@ def get_confirmation_keyboard(action: str, item_id: int = None) -> InlineKeyboar
 
 
 # Клавиатура быстрых ответов для часто задаваемых вопросов
+@static_markup
 def get_quick_reply_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура быстрых ответов"""
     keyboard = ReplyKeyboardMarkup(
@@ -247,6 +259,7 @@ def get_quick_reply_keyboard() -> ReplyKeyboardMarkup:
     return keyboard
 
 
+@static_markup
 def get_remove_keyboard() -> ReplyKeyboardMarkup:
     """Удаление клавиатуры"""
     return ReplyKeyboardMarkup(keyboard=[[]], resize_keyboard=True)
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""Записи, которые возвращает Database
+
+Строки базы превращаются в неизменяемые именованные кортежи прямо из
+кортежей курсора, без промежуточного словаря на каждую строку. Поля
+читаются как атрибуты: ticket.status, user.first_name.
+
+Запросы выбирают колонки в порядке полей записи (см. select_list).
+Колонки, которые конкретному экрану не нужны (например, description
+в списках), заменяются на NULL и не читаются из таблицы.
+
+Поля *_at - время в unix time (UTC), в текст его переводит
+utils.dates.format_timestamp при показе.
+"""
+
+from typing import Dict, NamedTuple, Optional
+
+
+class User(NamedTuple):
+    user_id: int
+    username: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    role: str = 'client'
+    is_active: bool = True
+    created_at: Optional[int] = None
+    updated_at: Optional[int] = None
+
+
+class Ticket(NamedTuple):
+    id: int
+    user_id: int
+    category: str
+    subject: str
+    status: str
+    priority: str = 'medium'
+    assigned_admin: Optional[int] = None
+    created_at: Optional[int] = None
+    updated_at: Optional[int] = None
+    message_count: int = 0
+    description: Optional[str] = None
+    # Заполняются только запросами с JOIN users / из архива
+    first_name: Optional[str] = None
+    username: Optional[str] = None
+    archived: bool = False
+
+
+class TicketMessage(NamedTuple):
+    id: int
+    ticket_id: int
+    user_id: int
+    message: str
+    is_admin: bool = False
+    created_at: Optional[int] = None
+    first_name: Optional[str] = None
+    username: Optional[str] = None
+
+
+# Поля, которых нет в самой таблице: по умолчанию не выбираются
+_COMPUTED = {
+    User: {},
+    Ticket: {'first_name': 'NULL', 'username': 'NULL', 'archived': 'FALSE'},
+    TicketMessage: {'first_name': 'NULL', 'username': 'NULL'},
+}
+
+
+def select_list(record: type, alias: str = '', skip=(), **expressions: str) -> str:
+    """Список колонок для SELECT в порядке полей записи
+
+    alias - псевдоним таблицы, skip - поля, которые не нужно читать
+    (вместо них NULL), expressions - SQL-выражения для отдельных полей.
+    """
+    prefix = f'{alias}.' if alias else ''
+    computed: Dict[str, str] = _COMPUTED[record]
+    columns = []
+    for field in record._fields:
+        if field in expressions:
+            columns.append(expressions[field])
+        elif field in skip:
+            columns.append('NULL')
+        elif field in computed:
+            columns.append(computed[field])
+        else:
+            columns.append(f'{prefix}{field}')
+    return ', '.join(columns)
@@ -0,0 +1,58 @@
+"""Перенос закрытых обращений в архив (Database.archive_closed_tickets)"""
+
+import asyncio
+import sqlite3
+from unittest.mock import patch
+
+import aiosqlite
+
+from database import Database
+from utils.dates import days_ago
+
+
+def _database(tmp_path) -> Database:
+    database = Database()
+    database.db_path = str(tmp_path / 'support.db')
+    database.archive_path = str(tmp_path / 'archive.db')
+    return database
+
+
+async def _collect(stream) -> list:
+    return [row async for rows in stream for row in rows]
+
+
+def test_ticket_changed_between_transactions_stays_only_in_main(tmp_path):
+    database = _database(tmp_path)
+    commit = aiosqlite.Connection.commit
+    commits = []
+
+    async def commit_then_reply(self):
+        await commit(self)
+        commits.append(self)
+        if len(commits) == 1:
+            # Копия в архиве уже сохранена, а обращение 2 в это время дописали
+            with sqlite3.connect(database.db_path) as other:
+                other.execute(
+                    'UPDATE tickets SET message_count = message_count + 1, updated_at = ? '
+                    'WHERE id = 2', (days_ago(0),)
+                )
+
+    async def scenario():
+        await database.create_tables()
+        await database.add_user(1, 'user', 'User')
+        for number in (1, 2):
+            ticket_id = await database.create_ticket(1, 'other', f'Тема {number}', 'Текст')
+            await database.add_ticket_message(ticket_id, 1, 'Сообщение')
+        with sqlite3.connect(database.db_path) as other:
+            other.execute("UPDATE tickets SET status = 'closed', updated_at = ?", (days_ago(60),))
+
+        with patch.object(aiosqlite.Connection, 'commit', commit_then_reply):
+            assert await database.archive_closed_tickets(30) == 1
+
+        tickets = await _collect(database.stream_tickets(include_archived=True))
+        messages = await _collect(database.stream_ticket_messages(include_archived=True))
+        return tickets, messages
+
+    tickets, messages = asyncio.run(scenario())
+    assert sorted((row[0], row[-1]) for row in tickets) == [(1, True), (2, False)]
+    assert sorted((row[1], row[-1]) for row in messages) == [(1, True), (2, False)]
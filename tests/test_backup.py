@@ -0,0 +1,68 @@
+"""Резервные копии и восстановление (utils/backup.py)"""
+
+import asyncio
+import sqlite3
+
+from utils import backup
+
+
+def _use_paths(monkeypatch, tmp_path):
+    database_path = str(tmp_path / 'support.db')
+    archive_path = str(tmp_path / 'archive.db')
+    monkeypatch.setattr(backup, 'DATABASE_PATH', database_path)
+    monkeypatch.setattr(backup, 'ARCHIVE_DATABASE_PATH', archive_path)
+    monkeypatch.setattr(backup, 'BACKUP_SOURCES', {
+        'support.db': database_path,
+        'archive.db': archive_path,
+    })
+    return database_path
+
+
+def _create(path: str, rows: int):
+    with sqlite3.connect(path) as conn:
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY)')
+        conn.executemany('INSERT INTO items DEFAULT VALUES', [()] * rows)
+
+
+def _count(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_every_backup_applies_retention(monkeypatch, tmp_path):
+    database_path = _use_paths(monkeypatch, tmp_path)
+    monkeypatch.setattr(backup, 'BACKUP_RETENTION', 2)
+    _create(database_path, 1)
+    backups = tmp_path / 'backups'
+    backups.mkdir()
+    for day in range(1, 4):
+        (backups / f'backup_2024010{day}_120000.tar.gz').write_bytes(b'')
+
+    # Так создаёт копию кнопка в админ-панели
+    created = asyncio.run(backup.create_backup(str(backups)))
+
+    remaining = sorted(path.name for path in backups.iterdir())
+    assert remaining == ['backup_20240103_120000.tar.gz', created.name]
+
+
+def test_safety_copy_includes_wal(monkeypatch, tmp_path):
+    database_path = _use_paths(monkeypatch, tmp_path)
+    _create(database_path, 3)
+    archive = asyncio.run(backup.create_backup(str(tmp_path / 'backups')))
+
+    _create(database_path, 5)
+    # Открытое соединение не даёт перенести -wal в файл базы при закрытии
+    reader = sqlite3.connect(database_path)
+    reader.execute('BEGIN')
+    reader.execute('SELECT COUNT(*) FROM items').fetchone()
+    try:
+        backup.restore_backup(str(archive))
+    finally:
+        reader.close()
+
+    assert _count(database_path) == 3
+    assert _count(f'{database_path}.before_restore') == 8
@@ -0,0 +1,106 @@
+"""Длинные сообщения из нескольких частей (utils/render.py)"""
+
+import asyncio
+from unittest.mock import patch
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from utils import render, render_cache
+
+MESSAGE_JSON = {
+    'message_id': 10,
+    'date': 1714558500,
+    'chat': {'id': 42, 'type': 'private'},
+    'text': 'Старый текст',
+}
+
+
+def _message(**changes) -> Message:
+    return Message.model_validate({**MESSAGE_JSON, **changes})
+
+
+def _long_text(parts: int, line: str = 'строка') -> str:
+    # Каждая часть - одна строка почти на весь лимит
+    body = line * (render.MESSAGE_TEXT_LIMIT // len(line) - 1)
+    return '\n'.join(body for _ in range(parts))
+
+
+def test_edit_long_message_refresh_from_keyboard_message():
+    render_cache._rendered.clear()
+    render._message_groups.clear()
+    markup = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text='🔄 Обновить', callback_data='refresh')]
+    ])
+    calls = []
+    next_id = iter(range(11, 100))
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        calls.append(('edit', self.message_id, reply_markup is not None))
+        return _message(message_id=self.message_id, text=text, edit_date=1714558700)
+
+    async def answer(self, text, reply_markup=None, **kwargs):
+        message_id = next(next_id)
+        calls.append(('answer', message_id, reply_markup is not None))
+        return _message(message_id=message_id, text=text)
+
+    async def delete(self, **kwargs):
+        calls.append(('delete', self.message_id, False))
+        return True
+
+    async def scenario():
+        with patch.object(Message, 'edit_text', edit_text), \
+                patch.object(Message, 'answer', answer), \
+                patch.object(Message, 'delete', delete):
+            assert await render.edit_long_message(_message(), _long_text(3), reply_markup=markup)
+            assert calls == [('edit', 10, False), ('answer', 11, False), ('answer', 12, True)]
+
+            # «Обновить» нажимают в последней части - в ней клавиатура
+            calls.clear()
+            pressed = _message(message_id=12, text='…')
+            assert not await render.edit_long_message(pressed, _long_text(3), reply_markup=markup)
+            assert calls == []
+
+            # Текст изменился: редактируются те же сообщения, новых нет
+            assert await render.edit_long_message(pressed, _long_text(3, 'другая'), reply_markup=markup)
+            assert calls == [('edit', 10, False), ('edit', 11, False), ('edit', 12, True)]
+
+            # Текст стал короче: клавиатура переезжает, лишняя часть удаляется
+            calls.clear()
+            pressed = _message(message_id=12, text='…', edit_date=1714558700)
+            assert await render.edit_long_message(pressed, _long_text(2), reply_markup=markup)
+            assert calls == [('edit', 10, False), ('edit', 11, True), ('delete', 12, False)]
+
+            # Следующее нажатие приходит из сообщения 11
+            calls.clear()
+            pressed = _message(message_id=11, text='…', edit_date=1714558700)
+            assert not await render.edit_long_message(pressed, _long_text(2), reply_markup=markup)
+            assert calls == []
+
+    asyncio.run(scenario())
+
+
+def test_edit_long_message_unknown_group_not_resent():
+    render_cache._rendered.clear()
+    render._message_groups.clear()
+    calls = []
+
+    async def edit_text(self, text, **kwargs):
+        calls.append('edit')
+        return _message(text=text, edit_date=1714558700)
+
+    async def answer(self, text, **kwargs):
+        calls.append('answer')
+        return _message(message_id=11, text=text)
+
+    async def scenario():
+        with patch.object(Message, 'edit_text', edit_text), \
+                patch.object(Message, 'answer', answer):
+            assert await render.edit_long_message(_message(), _long_text(2))
+            # Группа забыта (перезапуск), первая часть не изменилась
+            render._message_groups.clear()
+            calls.clear()
+            shown = _message(edit_date=1714558700)
+            assert not await render.edit_long_message(shown, _long_text(2))
+
+    asyncio.run(scenario())
+    assert calls == []
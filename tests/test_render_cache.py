@@ -0,0 +1,49 @@
+"""Пропуск повторных редактирований (utils/render_cache.py)"""
+
+import asyncio
+from unittest.mock import patch
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from utils import render_cache
+
+MESSAGE_JSON = {
+    'message_id': 10,
+    'date': 1714558500,
+    'edit_date': 1714558600,
+    'chat': {'id': 42, 'type': 'private'},
+    'text': 'Старый текст',
+}
+
+
+def _message(**changes) -> Message:
+    return Message.model_validate({**MESSAGE_JSON, **changes})
+
+
+def test_edit_date_from_telegram_json_is_int():
+    assert render_cache._edit_date(_message()) == 1714558600
+    assert render_cache._edit_date(_message(edit_date=None)) is None
+
+
+def test_edit_message_skips_unchanged_content():
+    render_cache._rendered.clear()
+    markup = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text='🔄 Обновить', callback_data='refresh')]
+    ])
+    calls = []
+
+    async def edit_text(self, text, **kwargs):
+        calls.append(text)
+        # Ответ Telegram на редактирование: сообщение с новым edit_date
+        return _message(text=text, edit_date=1714558700)
+
+    async def scenario():
+        with patch.object(Message, 'edit_text', edit_text):
+            assert await render_cache.edit_message(_message(), 'Текст', reply_markup=markup)
+            # Повторная отрисовка того же сообщения (уже отредактированного)
+            edited = _message(text='Текст', edit_date=1714558700)
+            assert not await render_cache.edit_message(edited, 'Текст', reply_markup=markup)
+            assert await render_cache.edit_message(edited, 'Новый текст', reply_markup=markup)
+
+    asyncio.run(scenario())
+    assert calls == ['Текст', 'Новый текст']
@@ -0,0 +1,171 @@
+"""Индекс обработчиков выбирает те же обработчики, что и aiogram (utils/routing.py)"""
+
+import asyncio
+from typing import List
+
+import pytest
+from aiogram import BaseMiddleware, Bot, Dispatcher, F, Router
+from aiogram.dispatcher.event.bases import UNHANDLED, SkipHandler
+from aiogram.filters import Command, StateFilter
+from aiogram.types import Update
+
+from handlers.common import TicketStates
+from keyboards.callback_data import CategoryCallback, TicketCallback, TicketsPageCallback
+from utils.routing import IndexedDispatchMiddleware, install_dispatch_index
+
+CHAT_ID = 42
+
+
+class _Flagged(BaseMiddleware):
+    """Внутренний middleware диспетчера, как ThrottlingMiddleware: видит флаги"""
+
+    def __init__(self, calls: List[str]):
+        self.calls = calls
+
+    async def __call__(self, handler, event, data):
+        flags = data['handler'].flags
+        if flags.get('throttling_key'):
+            self.calls.append(f"flag:{flags['throttling_key']}")
+        return await handler(event, data)
+
+
+def _build(indexed: bool):
+    """Дерево роутеров с теми же видами фильтров, что в handlers/"""
+    calls: List[str] = []
+
+    def handler(name: str):
+        async def handle(event, **kwargs):
+            calls.append(name)
+            return name
+        return handle
+
+    async def skipping(event, **kwargs):
+        calls.append('skipping')
+        raise SkipHandler()
+
+    user = Router()
+    user.message(F.text == "📝 Создать обращение", StateFilter(None),
+                 flags={"throttling_key": "ticket_create"})(handler('new_ticket_button'))
+    user.message(F.text == "📋 Мои обращения", StateFilter(None))(handler('my_tickets_button'))
+    user.message(F.text.in_(["🔧 Техподдержка", "💳 Оплата"]),
+                 TicketStates.waiting_category)(handler('category_reply'))
+    user.message(F.text == "❌ Отмена", TicketStates.waiting_category)(handler('cancel_category'))
+    user.message(TicketStates.waiting_subject)(handler('subject'))
+    user.callback_query(F.data == "new_ticket")(handler('new_ticket'))
+    user.callback_query(CategoryCallback.filter(), TicketStates.waiting_category)(handler('category'))
+    user.callback_query(TicketsPageCallback.filter())(handler('tickets_page'))
+    user.callback_query(TicketCallback.filter(F.ticket_id > 100))(handler('ticket_big'))
+    user.callback_query(TicketCallback.filter())(handler('ticket'))
+
+    admin = Router()
+    admin.message(Command("admin"))(handler('admin_command'))
+    admin.message(F.text == "📋 Мои обращения")(handler('admin_my_tickets'))
+    admin.callback_query(F.data.startswith("admin_"))(skipping)
+    admin.callback_query(F.data.startswith(("admin_", "adm:")))(handler('admin_prefix'))
+
+    nested = Router()
+    nested.message(F.text == "📝 Создать обращение")(handler('nested_button'))
+    nested.callback_query(F.data == "admin_panel")(handler('nested_panel'))
+    admin.include_router(nested)
+
+    common = Router()
+    common.message(Command("start"))(handler('start'))
+    common.message(F.text)(handler('any_text'))
+    common.callback_query()(handler('any_callback'))
+
+    dp = Dispatcher()
+    dp.message.middleware(_Flagged(calls))
+    dp.callback_query.middleware(_Flagged(calls))
+    dp.include_routers(user, admin, common)
+    if indexed:
+        install_dispatch_index(dp)
+    return dp, calls
+
+
+def _message(update_id: int, text: str = None, **extra) -> Update:
+    message = {
+        'message_id': update_id,
+        'date': 1714558500,
+        'chat': {'id': CHAT_ID, 'type': 'private'},
+        'from': {'id': CHAT_ID, 'is_bot': False, 'first_name': 'User'},
+        **extra,
+    }
+    if text is not None:
+        message['text'] = text
+    return Update.model_validate({'update_id': update_id, 'message': message})
+
+
+def _callback(update_id: int, data: str) -> Update:
+    return Update.model_validate({'update_id': update_id, 'callback_query': {
+        'id': str(update_id),
+        'chat_instance': '1',
+        'from': {'id': CHAT_ID, 'is_bot': False, 'first_name': 'User'},
+        'data': data,
+    }})
+
+
+CASES = [
+    # Текстовые кнопки без состояния и в чужом состоянии
+    (None, _message(1, "📝 Создать обращение")),
+    (None, _message(2, "📋 Мои обращения")),
+    (TicketStates.waiting_subject, _message(3, "📋 Мои обращения")),
+    (TicketStates.waiting_subject, _message(4, "Тема обращения")),
+    # F.text.in_ и состояние
+    (TicketStates.waiting_category, _message(5, "💳 Оплата")),
+    (None, _message(6, "💳 Оплата")),
+    (TicketStates.waiting_category, _message(7, "❌ Отмена")),
+    # Команды не индексируются
+    (None, _message(8, "/start")),
+    (None, _message(9, "/admin")),
+    # Не текст и неизвестный текст
+    (None, _message(10, sticker={'file_id': 'x', 'file_unique_id': 'x', 'width': 1,
+                                 'height': 1, 'is_animated': False, 'is_video': False,
+                                 'type': 'regular'})),
+    (None, _message(11, "что-то своё")),
+    # Точные данные кнопок, префиксы и фильтры CallbackData
+    (None, _callback(12, "new_ticket")),
+    (TicketStates.waiting_category, _callback(13, CategoryCallback(category='payment').pack())),
+    (None, _callback(14, CategoryCallback(category='payment').pack())),
+    (None, _callback(15, TicketsPageCallback(page=2).pack())),
+    (None, _callback(16, TicketCallback(ticket_id=7).pack())),
+    (None, _callback(17, TicketCallback(ticket_id=700).pack())),
+    (None, _callback(18, "t:не число")),
+    # SkipHandler и вложенный роутер
+    (None, _callback(19, "admin_panel")),
+    (None, _callback(20, "admin_stats")),
+    (None, _callback(21, "adm:1")),
+    (None, _callback(22, "неизвестно")),
+]
+
+
+@pytest.mark.parametrize('state, update', CASES)
+def test_index_routes_like_aiogram(state, update):
+    bot = Bot('42:TEST')
+
+    async def route(indexed: bool):
+        dp, calls = _build(indexed)
+        if state is not None:
+            await dp.fsm.get_context(bot, CHAT_ID, CHAT_ID).set_state(state)
+        result = await dp.feed_update(bot, update)
+        if indexed:
+            # Индекс действительно использовался, а не отключился
+            middleware, = (m for m in dp.observers[update.event_type].outer_middleware
+                           if isinstance(m, IndexedDispatchMiddleware))
+            assert middleware._enabled
+        return result, calls
+
+    expected = asyncio.run(route(False))
+    actual = asyncio.run(route(True))
+    assert actual == expected
+
+
+def test_unmatched_update_is_unhandled_with_index():
+    bot = Bot('42:TEST')
+    dp = Dispatcher()
+    router = Router()
+    router.callback_query(F.data == "faq")(lambda callback: None)
+    dp.include_router(router)
+    install_dispatch_index(dp)
+
+    result = asyncio.run(dp.feed_update(bot, _callback(1, "нет такой кнопки")))
+    assert result is UNHANDLED
@@ -0,0 +1,29 @@
+"""Перенос давно закрытых обращений в архив"""
+
+import asyncio
+import logging
+
+from database import db
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+async def archive_old_tickets() -> int:
+    """Перенести закрытые обращения старше ARCHIVE_AFTER_DAYS в архивную базу"""
+    if not ARCHIVE_AFTER_DAYS:
+        return 0
+    
+    archived_total = 0
+    while True:
+        archived = await db.archive_closed_tickets(ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE)
+        archived_total += archived
+        if archived < ARCHIVE_BATCH_SIZE:
+            break
+        # Даём обработчикам обновлений доступ к базе между пачками
+        await asyncio.sleep(0)
+    
+    if archived_total:
+        await db.reclaim_free_pages()
+        logger.info(f"🗄 Перенесено в архив обращений: {archived_total}")
+    return archived_total
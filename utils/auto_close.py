@@ -0,0 +1,52 @@
+"""Автоматическое закрытие устаревших обращений"""
+
+import asyncio
+import logging
+
+from aiogram import Bot
+
+from database import db
+from config import (
+    AUTO_CLOSE_RESOLVED_DAYS, AUTO_CLOSE_WAITING_DAYS, AUTO_CLOSE_BATCH_SIZE
+)
+from utils.sender import send_message_limited
+from utils.texts import AUTO_CLOSED_MESSAGE, AUTO_CLOSE_REASONS
+
+logger = logging.getLogger(__name__)
+
+
+async def auto_close_tickets(bot: Bot) -> int:
+    """Закрыть обращения, которые слишком долго решены или ждут ответа клиента"""
+    rules = (
+        ('resolved', AUTO_CLOSE_RESOLVED_DAYS),
+        ('waiting_response', AUTO_CLOSE_WAITING_DAYS),
+    )
+    closed_total = 0
+    
+    for status, days in rules:
+        if not days:
+            continue
+        
+        while True:
+            closed = await db.close_stale_tickets(status, days, AUTO_CLOSE_BATCH_SIZE)
+            
+            for ticket in closed:
+                await send_message_limited(
+                    bot,
+                    ticket.user_id,
+                    AUTO_CLOSED_MESSAGE.render(
+                        ticket_id=ticket.id,
+                        reason=AUTO_CLOSE_REASONS[status]
+                    ),
+                    parse_mode="HTML"
+                )
+            
+            closed_total += len(closed)
+            if len(closed) < AUTO_CLOSE_BATCH_SIZE:
+                break
+            # Даём обработчикам обновлений доступ к базе между пачками
+            await asyncio.sleep(0)
+    
+    if closed_total:
+        logger.info(f"🔒 Автоматически закрыто обращений: {closed_total}")
+    return closed_total
@@ -0,0 +1,189 @@
+"""Резервное копирование базы данных
+
+Обе базы (основная и архив) копируются через online backup API SQLite
+из одного соединения внутри одной транзакции чтения. В режиме WAL она
+не мешает записи, а копия получается согласованной: поэтапный backup
+начинался бы заново после каждой записи в базу и на нагруженном боте
+мог не закончиться, а базы, снятые по очереди, могли разойтись
+(обращение, перенесённое в архив между снимками, пропало бы из копии).
+
+Восстановление (бот должен быть остановлен):
+    python -m utils.backup verify backups/backup_20240101_120000.tar.gz
+    python -m utils.backup restore backups/backup_20240101_120000.tar.gz
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+import tarfile
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import (
+    DATABASE_PATH, ARCHIVE_DATABASE_PATH, BACKUP_DIR, BACKUP_RETENTION, DB_BUSY_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# Имя файла внутри резервной копии -> путь к рабочей базе
+BACKUP_SOURCES: Dict[str, str] = {
+    'support.db': DATABASE_PATH,
+    'archive.db': ARCHIVE_DATABASE_PATH,
+}
+
+
+def _snapshot_databases(tmp_dir: str) -> Dict[str, str]:
+    """Скопировать существующие базы в tmp_dir из одного снимка
+    
+    Возвращает имена баз с путями к копиям.
+    """
+    if not os.path.exists(DATABASE_PATH):
+        return {}
+    
+    # Имя файла в копии -> схема в соединении с основной базой
+    schemas = {'support.db': 'main'}
+    source = sqlite3.connect(DATABASE_PATH, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
+    try:
+        if os.path.exists(ARCHIVE_DATABASE_PATH):
+            source.execute('ATTACH DATABASE ? AS archive', (ARCHIVE_DATABASE_PATH,))
+            schemas['archive.db'] = 'archive'
+        
+        source.execute('BEGIN')
+        # Снимок каждой базы фиксируется первым чтением. Основная читается
+        # первой: архив пишется раньше, чем обращения удаляются из основной,
+        # поэтому перенесённое обращение окажется в копии хотя бы в одной базе
+        for schema in schemas.values():
+            source.execute(f'SELECT COUNT(*) FROM {schema}.sqlite_master').fetchone()
+        
+        copies = {}
+        for name, schema in schemas.items():
+            copy_path = os.path.join(tmp_dir, name)
+            target = sqlite3.connect(copy_path)
+            try:
+                source.backup(target, name=schema)
+            finally:
+                target.close()
+            copies[name] = copy_path
+        source.execute('COMMIT')
+    finally:
+        source.close()
+    return copies
+
+
+def _pack(files: Dict[str, str], archive_path: str):
+    """Упаковать файлы в tar.gz"""
+    with tarfile.open(archive_path, 'w:gz') as tar:
+        for name, path in files.items():
+            tar.add(path, arcname=name)
+
+
+async def create_backup(target_dir: Optional[str] = None) -> Path:
+    """Создать сжатую резервную копию всех баз и вернуть путь к ней
+    
+    Старые копии удаляются сразу: и для плановых, и для созданных кнопкой.
+    """
+    target_dir = Path(target_dir or BACKUP_DIR)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    archive_path = target_dir / f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.tar.gz"
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Копирование и сжатие выполняем в отдельном потоке, чтобы не останавливать бота
+        copies = await asyncio.to_thread(_snapshot_databases, tmp_dir)
+        await asyncio.to_thread(_pack, copies, str(archive_path))
+    
+    logger.info(f"💾 Резервная копия создана: {archive_path}")
+    removed = prune_backups(str(target_dir), BACKUP_RETENTION)
+    if removed:
+        logger.info(f"🗑 Удалено старых резервных копий: {len(removed)}")
+    return archive_path
+
+
+def prune_backups(target_dir: Optional[str] = None, keep: int = BACKUP_RETENTION) -> List[Path]:
+    """Удалить старые резервные копии, оставив keep последних"""
+    backups = sorted(Path(target_dir or BACKUP_DIR).glob('backup_*.tar.gz'))
+    removed = backups[:-keep] if keep > 0 else []
+    for path in removed:
+        path.unlink()
+    return removed
+
+
+async def scheduled_backup():
+    """Плановая резервная копия с ротацией"""
+    await create_backup()
+
+
+def verify_backup(archive_path: str, extract_dir: str) -> Dict[str, str]:
+    """Распаковать резервную копию и проверить целостность каждой базы
+    
+    Возвращает имена баз с путями к распакованным файлам.
+    Бросает ValueError, если копия повреждена.
+    """
+    with tarfile.open(archive_path, 'r:gz') as tar:
+        members = [m for m in tar.getmembers() if m.name in BACKUP_SOURCES and m.isfile()]
+        if not members:
+            raise ValueError("В архиве нет файлов базы данных")
+        tar.extractall(extract_dir, members=members)
+    
+    extracted = {}
+    for member in members:
+        path = os.path.join(extract_dir, member.name)
+        with sqlite3.connect(path) as conn:
+            result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            raise ValueError(f"{member.name}: {result}")
+        extracted[member.name] = path
+    return extracted
+
+
+def _copy_database(source_path: str, target_path: str):
+    """Скопировать базу целиком через online backup API"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def restore_backup(archive_path: str):
+    """Восстановить базы из резервной копии после проверки целостности"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        extracted = verify_backup(archive_path, tmp_dir)
+        for name, path in extracted.items():
+            target_path = BACKUP_SOURCES[name]
+            os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+            # Текущую базу сохраняем рядом на случай ошибки. Через backup API,
+            # а не копированием файла: страницы из -wal в файле базы ещё нет
+            if os.path.exists(target_path):
+                _copy_database(target_path, f"{target_path}.before_restore")
+            _copy_database(path, target_path)
+            print(f"✅ {name} восстановлена в {target_path}")
+
+
+def main(argv: List[str]):
+    """Точка входа командной строки"""
+    if len(argv) != 2 or argv[0] not in ('verify', 'restore'):
+        print("Использование: python -m utils.backup verify|restore <backup.tar.gz>")
+        return 2
+    
+    command, archive_path = argv
+    try:
+        if command == 'verify':
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                for name in verify_backup(archive_path, tmp_dir):
+                    print(f"✅ {name}: ok")
+        else:
+            restore_backup(archive_path)
+    except (ValueError, tarfile.TarError, sqlite3.DatabaseError) as e:
+        print(f"❌ Резервная копия повреждена: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,193 @@
+"""Микробенчмарки отрисовки сообщений
+
+Запуск из командной строки:
+
+    python -m utils.bench templates --number 100000
+    python -m utils.bench ticket-list --number 20
+    python -m utils.bench dates --number 20
+"""
+
+import argparse
+import html
+import sys
+import timeit
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from aiogram.types import InlineKeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from keyboards.admin import get_admin_tickets_keyboard
+from keyboards.callback_data import AdminTicketCallback
+from models import Ticket
+from utils.dates import format_timestamp, format_utc
+from utils.render import truncate
+from utils.templates import Markup
+from utils.texts import TICKET_DETAILS_MESSAGE
+from utils.ticket_list import render_ticket_list
+
+
+def _sample_ticket() -> Ticket:
+    return Ticket(
+        id=12345, user_id=987654321, category='technical',
+        subject='Не приходит код подтверждения <важно> & срочно',
+        status='in_progress', priority='high',
+        created_at=1714558500, updated_at=1714636800,
+        message_count=3, description='Пытаюсь войти, код не приходит уже час. ' * 10,
+    )
+
+
+def _report(title: str, cases: Dict[str, Callable[[], str]], number: int):
+    print(f"{title} ({number} отрисовок)")
+    baseline = None
+    for name, render in cases.items():
+        seconds = min(timeit.repeat(render, number=number, repeat=3))
+        per_call = seconds / number * 1e6
+        baseline = baseline or per_call
+        print(f"  {name:<28} {per_call:8.2f} мкс  x{baseline / per_call:.2f}")
+
+
+def bench_templates(number: int):
+    """Скомпилированный шаблон против str.format"""
+    ticket = _sample_ticket()
+    messages_info = "\n<b>💬 История переписки:</b>\n• 👤 Иван (01.05 10:20):\n  Жду ответа\n\n"
+    details_source = TICKET_DETAILS_MESSAGE.source
+
+    def format_details():
+        return details_source.format(
+            ticket_id=ticket.id, subject=html.escape(ticket.subject, quote=False),
+            category='Техническая проблема', status_emoji='⏳', status='В работе',
+            created_at='01.05.2024 10:15', updated_at='02.05.2024 08:00',
+            description=html.escape(ticket.description, quote=False),
+            messages_info=messages_info
+        )
+
+    def template_details():
+        return TICKET_DETAILS_MESSAGE.render(
+            ticket_id=ticket.id, subject=ticket.subject,
+            category='Техническая проблема', status_emoji='⏳', status='В работе',
+            created_at='01.05.2024 10:15', updated_at='02.05.2024 08:00',
+            description=ticket.description, messages_info=Markup(messages_info)
+        )
+
+    assert format_details() == template_details()
+    _report("Карточка пользователя", {
+        'str.format + html.escape': format_details,
+        'Template.render': template_details,
+    }, number)
+
+
+def _sample_tickets(count: int) -> List[Ticket]:
+    start = int(datetime(2024, 5, 1, 9, 0).timestamp())
+    statuses = ('new', 'in_progress', 'waiting_response')
+    priorities = ('high', 'medium', 'low')
+    return [
+        Ticket(
+            id=i, user_id=1000 + i % 50, category='technical',
+            subject=f'Обращение {i}: не работает оплата <картой> & не приходит чек',
+            status=statuses[i % 3], priority=priorities[i % 3],
+            # Несколько обращений в час: даты в списке повторяются
+            created_at=start + 17 * 60 * i,
+            first_name=f'Клиент {i % 50}',
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def _legacy_ticket_list(tickets: List[Ticket]):
+    """Список в том виде, как его строили обработчики до общего рендерера"""
+    def get_status_emoji(status: str) -> str:
+        emojis = {'new': '🆕', 'in_progress': '⏳', 'waiting_response': '⏰',
+                  'resolved': '✅', 'closed': '🔒'}
+        return emojis.get(status, '❓')
+
+    def get_priority_emoji(priority: str) -> str:
+        emojis = {'high': '🔴', 'medium': '🟡', 'low': '🟢'}
+        return emojis.get(priority, '🟡')
+
+    tickets_list = ""
+    for i, ticket in enumerate(tickets, 1):
+        status_emoji = get_status_emoji(ticket.status)
+        priority_emoji = get_priority_emoji(ticket.priority)
+        user_name = ticket.first_name or 'Неизвестно'
+        created_date = datetime.fromisoformat(ticket.created_at).strftime("%d.%m")
+        tickets_list += f"{i}. {priority_emoji}{status_emoji} <b>#{ticket.id}</b>\n"
+        tickets_list += f"   👤 {user_name} | 📅 {created_date}\n"
+        tickets_list += f"   📝 {truncate(ticket.subject, 50)}\n\n"
+
+    keyboard = InlineKeyboardBuilder()
+    for ticket in tickets:
+        priority_emoji = "🔴" if ticket.priority == 'high' else "🟡" if ticket.priority == 'medium' else "🟢"
+        user_name = ticket.first_name or 'Пользователь'
+        keyboard.row(InlineKeyboardButton(
+            text=f"{priority_emoji} #{ticket.id} - {user_name} - {ticket.subject[:25]}...",
+            callback_data=AdminTicketCallback(ticket_id=ticket.id).pack()
+        ))
+    return tickets_list, keyboard.as_markup()
+
+
+def bench_ticket_list(number: int):
+    """Общий рендерер списка обращений на странице из 1000 обращений"""
+    tickets = _sample_tickets(1000)
+    # До перехода на unix time даты приходили из базы текстом
+    iso_tickets = [ticket._replace(created_at=format_utc(ticket.created_at)) for ticket in tickets]
+
+    def legacy():
+        return _legacy_ticket_list(iso_tickets)
+
+    def shared():
+        tickets_list, ticket_buttons = render_ticket_list(tickets, staff=True)
+        return tickets_list, get_admin_tickets_keyboard(ticket_buttons, "new", "admin")
+
+    def shared_text():
+        return render_ticket_list(tickets, staff=True)[0]
+
+    _report("Список из 1000 обращений", {
+        'обработчики до рендерера': legacy,
+        'render_ticket_list': shared,
+        '  из них текст': shared_text,
+    }, number)
+
+
+def bench_dates(number: int):
+    """Показ 1000 дат: разбор текста из базы против unix time"""
+    timestamps = [ticket.created_at for ticket in _sample_tickets(1000)]
+    texts = [format_utc(timestamp) for timestamp in timestamps]
+
+    def parse_text():
+        return [datetime.fromisoformat(text).strftime("%d.%m.%Y %H:%M") for text in texts]
+
+    def from_timestamp():
+        format_timestamp.cache_clear()
+        return [format_timestamp(timestamp) for timestamp in timestamps]
+
+    def cached():
+        return [format_timestamp(timestamp) for timestamp in timestamps]
+
+    _report("1000 дат", {
+        'fromisoformat + strftime': parse_text,
+        'format_timestamp': from_timestamp,
+        'format_timestamp (кэш)': cached,
+    }, number)
+
+
+BENCHMARKS: Dict[str, Callable[[int], None]] = {
+    'templates': bench_templates,
+    'ticket-list': bench_ticket_list,
+    'dates': bench_dates,
+}
+
+
+def main(argv: List[str]):
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(prog='python -m utils.bench')
+    parser.add_argument('benchmark', choices=list(BENCHMARKS))
+    parser.add_argument('--number', type=int, default=100000, help='число отрисовок')
+    args = parser.parse_args(argv)
+
+    BENCHMARKS[args.benchmark](args.number)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
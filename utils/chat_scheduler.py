@@ -0,0 +1,152 @@
+"""Упорядоченная обработка обновлений по чатам
+
+Обновления одного чата выполняются строго по очереди (два быстрых
+сообщения клиента в waiting_description не обгонят друг друга), разные
+чаты обрабатываются параллельно. Общее число принятых, но ещё не
+обработанных обновлений ограничено: при достижении лимита приём новых
+обновлений ждёт освобождения места.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from config import MAX_CONCURRENT_UPDATES, UPDATES_DRAIN_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+# Вызывается после выполнения задачи: (успешно ли, длительность в секундах)
+DoneCallback = Callable[[bool, float], None]
+
+
+def update_chat_id(update: Update) -> int:
+    """Определить чат, к которому относится обновление"""
+    event = update.event
+    chat = getattr(event, 'chat', None) or getattr(getattr(event, 'message', None), 'chat', None)
+    if chat:
+        return chat.id
+    user = getattr(event, 'from_user', None) or getattr(event, 'user', None)
+    return user.id if user else 0
+
+
+class ChatScheduler:
+    """Очереди задач по чатам с общим лимитом"""
+    
+    def __init__(self, max_in_flight: int = MAX_CONCURRENT_UPDATES):
+        self.max_in_flight = max_in_flight
+        self._capacity = asyncio.Semaphore(max_in_flight)
+        self._queues: Dict[int, Deque[Tuple[Job, Optional[DoneCallback]]]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.backpressure_waits = 0
+        self.max_queue_depth = 0
+    
+    async def submit(self, chat_id: int, job: Job, on_done: DoneCallback = None):
+        """Поставить задачу в очередь чата
+        
+        Возвращает управление сразу после постановки в очередь; ждёт
+        только если достигнут общий лимит. on_done вызывается, когда
+        задача выполнена (или завершилась ошибкой).
+        """
+        if self._capacity.locked():
+            self.backpressure_waits += 1
+        await self._capacity.acquire()
+        self.in_flight += 1
+        
+        chat_queue = self._queues.get(chat_id)
+        if chat_queue is None:
+            chat_queue = self._queues[chat_id] = deque()
+            self._workers[chat_id] = asyncio.create_task(self._run_chat(chat_id, chat_queue))
+        chat_queue.append((job, on_done))
+        self.max_queue_depth = max(self.max_queue_depth, len(chat_queue))
+    
+    async def _run_chat(self, chat_id: int, 
+                        chat_queue: Deque[Tuple[Job, Optional[DoneCallback]]]):
+        """Выполнить задачи чата по порядку"""
+        try:
+            while chat_queue:
+                job, on_done = chat_queue.popleft()
+                started = time.perf_counter()
+                ok = False
+                try:
+                    await job()
+                    ok = True
+                    self.completed += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.exception(f"❌ Ошибка обработки обновления чата {chat_id}: {e}")
+                finally:
+                    self.in_flight -= 1
+                    self._capacity.release()
+                    if on_done:
+                        on_done(ok, time.perf_counter() - started)
+        finally:
+            del self._queues[chat_id]
+            del self._workers[chat_id]
+    
+    async def drain(self, timeout: float = UPDATES_DRAIN_TIMEOUT):
+        """Дождаться выполнения всех поставленных задач"""
+        if not self._workers:
+            return
+        logger.info(f"⏳ Дожидаемся обработки очередей: {self.in_flight} обновлений")
+        _, pending = await asyncio.wait(list(self._workers.values()), timeout=timeout)
+        if pending:
+            logger.warning(f"⚠️ Не дождались обработки очередей чатов: {len(pending)}")
+    
+    def stats(self) -> Dict[str, int]:
+        """Показатели очередей для мониторинга"""
+        return {
+            'in_flight': self.in_flight,
+            'chats': len(self._queues),
+            'queued': sum(len(chat_queue) for chat_queue in self._queues.values()),
+            'max_queue_depth': self.max_queue_depth,
+            'backpressure_waits': self.backpressure_waits,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+    
+    async def log_stats(self):
+        """Вывести метрики очередей в лог"""
+        stats = self.stats()
+        logger.info(
+            f"📊 Очереди чатов: в работе {stats['in_flight']}/{self.max_in_flight}, "
+            f"чатов {stats['chats']}, ожидают {stats['queued']}, "
+            f"макс. глубина {stats['max_queue_depth']}, "
+            f"ожиданий лимита {stats['backpressure_waits']}, "
+            f"обработано {stats['completed']}, ошибок {stats['failed']}"
+        )
+        self.max_queue_depth = 0
+
+
+class ChatOrderedDispatcher(Dispatcher):
+    """Диспетчер, который обрабатывает обновления через ChatScheduler
+    
+    feed_update только ставит обновление в очередь его чата. Перед
+    остановкой (и закрытием хранилища FSM) очереди дообрабатываются.
+    on_update_done получает результат и длительность обработки каждого
+    обновления (метрики процессов-обработчиков).
+    """
+    
+    def __init__(self, *, scheduler: ChatScheduler = None, 
+                 on_update_done: DoneCallback = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.scheduler = scheduler or ChatScheduler()
+        self.on_update_done = on_update_done
+    
+    async def feed_update(self, bot: Bot, update: Update, **kwargs: Any) -> Any:
+        async def job():
+            return await Dispatcher.feed_update(self, bot, update, **kwargs)
+        
+        await self.scheduler.submit(update_chat_id(update), job, self.on_update_done)
+    
+    async def emit_shutdown(self, *args: Any, **kwargs: Any) -> None:
+        await self.scheduler.drain()
+        await super().emit_shutdown(*args, **kwargs)
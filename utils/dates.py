@@ -0,0 +1,64 @@
+"""Время в базе и в сообщениях
+
+В базе время хранится целым числом секунд unix time (UTC): такие
+колонки сравниваются и сортируются как числа, а границы выборок
+(«старше N дней») считаются в Python одним вычитанием. В записях
+models.py время остаётся числом, в текст оно превращается только
+при показе - в часовом поясе DISPLAY_TIMEZONE.
+"""
+
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from config import DATE_FORMAT_CACHE_SIZE, DISPLAY_TIMEZONE
+
+# None - локальный пояс сервера
+DISPLAY_TZ = ZoneInfo(DISPLAY_TIMEZONE) if DISPLAY_TIMEZONE else None
+
+DAY = 24 * 3600
+
+
+def unix_now() -> int:
+    """Текущее время для записи в базу"""
+    return int(time.time())
+
+
+def days_ago(days: float) -> int:
+    """Граница выборки «старше N дней» в unix time"""
+    return unix_now() - int(days * DAY)
+
+
+def local_now() -> datetime:
+    """Текущее время в часовом поясе показа"""
+    return datetime.now(DISPLAY_TZ)
+
+
+# Смены смещения пояса (переход на летнее время) приходятся на границы
+# 15-минутных интервалов, поэтому смещение кэшируется по интервалам
+_OFFSET_STEP = 15 * 60
+
+
+@lru_cache(maxsize=DATE_FORMAT_CACHE_SIZE)
+def _utc_offset(step: int) -> int:
+    """Смещение пояса показа от UTC (секунды) в интервале step"""
+    moment = datetime.fromtimestamp(step * _OFFSET_STEP, timezone.utc).astimezone(DISPLAY_TZ)
+    return int(moment.utcoffset().total_seconds())
+
+
+@lru_cache(maxsize=DATE_FORMAT_CACHE_SIZE)
+def format_timestamp(timestamp: Optional[int], fmt: str = "%d.%m.%Y %H:%M") -> str:
+    """Дата для сообщений в поясе показа; повторные значения берутся из кэша"""
+    if timestamp is None:
+        return ''
+    # time.strftime заметно быстрее datetime.strftime; fmt без %z/%Z
+    return time.strftime(fmt, time.gmtime(timestamp + _utc_offset(timestamp // _OFFSET_STEP)))
+
+
+def format_utc(timestamp: Optional[int]) -> Optional[str]:
+    """Время в UTC в формате 'YYYY-MM-DD HH:MM:SS' (для выгрузок)"""
+    if timestamp is None:
+        return None
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp))
@@ -0,0 +1,105 @@
+"""Защита от повторной обработки обновлений
+
+После сбоя polling может получить уже обработанные обновления ещё раз,
+Telegram повторяет запросы вебхука. Middleware пропускает каждое
+update_id к обработчикам один раз: id проверяются по кольцу последних
+DEDUP_RING_SIZE обновлений в памяти, при запуске кольцо заполняется из
+таблицы processed_updates. На пути обработки база не трогается.
+
+Отметки в базе пишутся после обработки обновления и копятся в памяти,
+в processed_updates они попадают пачкой раз в DEDUP_FLUSH_INTERVAL и
+при остановке. Доставка - «хотя бы один раз»: обновление, обработка
+которого прервалась падением процесса (или отметка не успела попасть в
+базу), после перезапуска будет обработано ещё раз. Поэтому действия,
+создающие записи, дополнительно передают в базу ключ идемпотентности,
+построенный из исходного сообщения или нажатия.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, Update
+
+from config import DEDUP_RING_SIZE, DEDUP_TTL
+from database import db
+from utils.dates import unix_now
+
+logger = logging.getLogger(__name__)
+
+
+def message_key(message: Message) -> str:
+    """Ключ идемпотентности действия, вызванного сообщением"""
+    return f"msg:{message.chat.id}:{message.message_id}"
+
+
+def callback_key(callback: CallbackQuery) -> str:
+    """Ключ идемпотентности действия, вызванного нажатием кнопки"""
+    return f"cb:{callback.id}"
+
+
+class UpdateDeduplicationMiddleware(BaseMiddleware):
+    """Отбрасывает повторно доставленные обновления"""
+    
+    def __init__(self, ring_size: int = DEDUP_RING_SIZE):
+        self.ring_size = ring_size
+        self._recent: Deque[int] = deque()
+        self._recent_ids: Set[int] = set()
+        # Обработанные обновления, ещё не записанные в базу
+        self._pending: List[int] = []
+        self._flush_lock = asyncio.Lock()
+        self.dropped = 0
+    
+    def _remember(self, update_id: int):
+        self._recent.append(update_id)
+        self._recent_ids.add(update_id)
+        if len(self._recent) > self.ring_size:
+            self._recent_ids.discard(self._recent.popleft())
+    
+    async def load_recent(self):
+        """Заполнить кольцо отметками из базы (при запуске)"""
+        for update_id in await db.get_recent_processed_updates(self.ring_size):
+            if update_id not in self._recent_ids:
+                self._remember(update_id)
+    
+    async def flush(self):
+        """Записать накопленные отметки в базу одной транзакцией"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            update_ids, self._pending = self._pending, []
+            try:
+                await db.mark_updates_processed(update_ids)
+            except BaseException:
+                # Не теряем отметки: запишем их при следующей попытке
+                self._pending[:0] = update_ids
+                raise
+    
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        update_id = event.update_id
+        if update_id in self._recent_ids:
+            self.dropped += 1
+            logger.info(f"🔁 Повторное обновление {update_id} пропущено")
+            return None
+        
+        # В памяти - сразу (повтор во время обработки тоже отбрасывается),
+        # в базе - только после обработки
+        self._remember(update_id)
+        try:
+            return await handler(event, data)
+        finally:
+            self._pending.append(update_id)
+
+
+async def expire_processed_updates():
+    """Удалить устаревшие отметки об обработанных обновлениях"""
+    removed = await db.delete_expired_processed_updates(unix_now() - DEDUP_TTL)
+    if removed:
+        logger.info(f"🧹 Удалено отметок об обновлениях: {removed}")
@@ -0,0 +1,233 @@
+"""Потоковый экспорт данных в сжатые CSV/JSONL файлы
+
+Строки читаются из базы пачками и сразу пишутся в gzip-файл на диске,
+поэтому потребление памяти не зависит от размера таблиц.
+
+Выгрузка изменений (delta) отдаёт только записи, изменённые после
+водяного знака потребителя. Запуск из командной строки:
+
+    python -m utils.export delta --consumer bi --format jsonl --out exports/
+"""
+
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database import db
+from utils.dates import format_utc
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+
+def _yes_no(value: Any) -> str:
+    return 'Да' if value else 'Нет'
+
+
+# Описание экспортируемых сущностей: колонки соответствуют порядку
+# полей в Database.stream_*; dates - колонки времени (в базе unix time,
+# в файле 'YYYY-MM-DD HH:MM:SS' UTC); csv_row готовит строку для CSV
+EXPORTS: Dict[str, Dict[str, Any]] = {
+    'tickets': {
+        'stream': lambda: db.stream_tickets(include_archived=True),
+        'columns': [
+            'id', 'user_id', 'username', 'first_name', 'category', 'subject',
+            'description', 'status', 'priority', 'assigned_admin',
+            'created_at', 'updated_at', 'archived'
+        ],
+        'headers': [
+            'ID', 'User ID', 'Username', 'First Name', 'Category', 'Subject',
+            'Description', 'Status', 'Priority', 'Assigned', 'Created', 'Updated',
+            'Archived'
+        ],
+        'dates': (10, 11),
+        'csv_row': lambda row: (*row[:-1], _yes_no(row[-1])),
+    },
+    'messages': {
+        'stream': lambda: db.stream_ticket_messages(include_archived=True),
+        'columns': [
+            'id', 'ticket_id', 'user_id', 'is_admin', 'created_at', 'message', 'archived'
+        ],
+        'headers': [
+            'ID', 'Ticket ID', 'User ID', 'From Support', 'Created', 'Message', 'Archived'
+        ],
+        'dates': (4,),
+        'csv_row': lambda row: (*row[:3], _yes_no(row[3]), row[4], row[5], _yes_no(row[6])),
+    },
+    'users': {
+        'stream': lambda: db.stream_users(),
+        'columns': [
+            'user_id', 'username', 'first_name', 'last_name', 'role', 'is_active',
+            'created_at', 'updated_at'
+        ],
+        'headers': [
+            'User ID', 'Username', 'First Name', 'Last Name', 'Role', 'Active',
+            'Created', 'Updated'
+        ],
+        'dates': (6, 7),
+        'csv_row': lambda row: (*row[:5], _yes_no(row[5]), *row[6:]),
+    },
+}
+
+
+# Выгрузка изменений: stream получает водяной знак и верхнюю границу,
+# key достаёт из строки новый водяной знак (updated_at, id)
+DELTAS: Dict[str, Dict[str, Any]] = {
+    'tickets': {
+        'stream': lambda mark, until: db.stream_tickets_since(
+            mark['last_updated_at'], mark['last_id'], until
+        ),
+        'key': lambda row: (row[11], row[0]),
+    },
+    'messages': {
+        # Сообщения не редактируются, достаточно возрастающего id
+        'stream': lambda mark, until: db.stream_ticket_messages_since(mark['last_id']),
+        'key': lambda row: (0, row[0]),
+    },
+    'users': {
+        'stream': lambda mark, until: db.stream_users_since(
+            mark['last_updated_at'], mark['last_id'], until
+        ),
+        'key': lambda row: (row[7], row[0]),
+    },
+}
+
+
+def _format_dates(rows: List[tuple], dates: Tuple[int, ...]) -> List[tuple]:
+    """Заменить unix time в колонках dates на текст"""
+    formatted = []
+    for row in rows:
+        row = list(row)
+        for i in dates:
+            row[i] = format_utc(row[i])
+        formatted.append(row)
+    return formatted
+
+
+def _csv_chunk_writer(out, spec: Dict[str, Any]) -> Callable[[List[tuple]], None]:
+    writer = csv.writer(out)
+    writer.writerow(spec['headers'])
+    csv_row, dates = spec['csv_row'], spec['dates']
+    
+    def write(rows: List[tuple]):
+        writer.writerows(csv_row(row) for row in _format_dates(rows, dates))
+    return write
+
+
+def _jsonl_chunk_writer(out, spec: Dict[str, Any]) -> Callable[[List[tuple]], None]:
+    columns, dates = spec['columns'], spec['dates']
+    
+    def write(rows: List[tuple]):
+        out.writelines(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+            for row in _format_dates(rows, dates)
+        )
+    return write
+
+
+async def write_export(rows_stream, spec: Dict[str, Any], fmt: str,
+                       prefix: str) -> Tuple[Path, int]:
+    """Записать поток пачек строк во временный gzip-файл
+    
+    Возвращает путь к файлу и количество записанных строк.
+    Файл удаляет вызывающий код.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    
+    fd, path = tempfile.mkstemp(prefix=f'{prefix}_', suffix=f'.{fmt}.gz')
+    os.close(fd)
+    count = 0
+    try:
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as out:
+            if fmt == 'csv':
+                write_chunk = _csv_chunk_writer(out, spec)
+            else:
+                write_chunk = _jsonl_chunk_writer(out, spec)
+            
+            async for rows in rows_stream:
+                # Сжатие - работа для CPU, выносим из event loop
+                await asyncio.to_thread(write_chunk, rows)
+                count += len(rows)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return Path(path), count
+
+
+async def export_entity(entity: str, fmt: str = 'csv') -> Tuple[Path, int]:
+    """Экспортировать таблицу целиком во временный gzip-файл"""
+    spec = EXPORTS[entity]
+    return await write_export(spec['stream'](), spec, fmt, entity)
+
+
+
+async def export_delta(consumer: str, entity: str,
+                       fmt: str = 'jsonl') -> Tuple[Path, int, Dict[str, Any]]:
+    """Экспортировать изменения с водяного знака потребителя
+    
+    Возвращает путь к файлу, количество строк и новый водяной знак.
+    Знак сохраняется отдельно через commit_watermark после успешной
+    доставки файла, иначе при сбое изменения были бы потеряны.
+    """
+    spec, delta = EXPORTS[entity], DELTAS[entity]
+    mark = await db.get_export_watermark(consumer, entity)
+    until = db.get_delta_upper_bound()
+    new_mark = dict(mark)
+    
+    async def tracked():
+        async for rows in delta['stream'](mark, until):
+            new_mark['last_updated_at'], new_mark['last_id'] = delta['key'](rows[-1])
+            yield rows
+    
+    path, count = await write_export(tracked(), spec, fmt, f'{entity}_delta')
+    return path, count, new_mark
+
+
+async def commit_watermark(consumer: str, entity: str, mark: Dict[str, Any]):
+    """Сохранить водяной знак после доставки выгрузки"""
+    await db.set_export_watermark(consumer, entity, mark['last_updated_at'], mark['last_id'])
+
+
+async def _run_delta_cli(consumer: str, fmt: str, out_dir: str,
+                         entities: Optional[List[str]] = None):
+    """Выгрузить изменения всех сущностей в каталог"""
+    await db.create_tables()
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    for entity in entities or list(DELTAS):
+        path, count, mark = await export_delta(consumer, entity, fmt)
+        target = out / f"{consumer}_{entity}_{stamp}.{fmt}.gz"
+        shutil.move(path, target)
+        await commit_watermark(consumer, entity, mark)
+        print(f"{entity}: {count} -> {target}")
+
+
+def main(argv: List[str]):
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(prog='python -m utils.export')
+    commands = parser.add_subparsers(dest='command', required=True)
+    delta = commands.add_parser('delta', help='выгрузить изменения с прошлого запуска')
+    delta.add_argument('--consumer', required=True, help='имя потребителя выгрузки')
+    delta.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl')
+    delta.add_argument('--out', default='exports', help='каталог для файлов')
+    delta.add_argument('--entity', action='append', choices=list(DELTAS),
+                       help='сущность (по умолчанию все)')
+    args = parser.parse_args(argv)
+    
+    asyncio.run(_run_delta_cli(args.consumer, args.format, args.out, args.entity))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
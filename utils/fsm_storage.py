@@ -0,0 +1,254 @@
+"""Хранилища состояний FSM
+
+SQLiteStorage хранит состояния в базе SQLite. Состояние читается из
+базы один раз и дальше обслуживается из памяти. Изменения копятся в
+наборе "грязных" ключей и записываются пачкой раз в FSM_FLUSH_INTERVAL,
+поэтому частые update_data одного диалога дают одну запись в базу.
+Брошенные диалоги удаляются по FSM_STATE_TTL.
+
+BoundedMemoryStorage хранит состояния только в памяти, но, в отличие от
+MemoryStorage из aiogram, ограничивает их число (LRU) и удаляет записи,
+к которым давно не обращались.
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from config import (
+    FSM_CACHE_IDLE, FSM_STATE_TTL, FSM_STORAGE,
+    FSM_MEMORY_MAX_KEYS, FSM_MEMORY_IDLE_TTL
+)
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Record:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    updated_at: float = 0.0     # Последнее изменение (unix time, хранится в базе)
+    accessed: float = 0.0       # Последнее обращение (для выгрузки из памяти)
+    size: int = 0               # Приблизительный объём в памяти (байты)
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage с кэшем в памяти и отложенной записью в SQLite"""
+    
+    def __init__(self, database: Database = db, state_ttl: float = FSM_STATE_TTL,
+                 cache_idle: float = FSM_CACHE_IDLE):
+        self.db = database
+        self.state_ttl = state_ttl
+        self.cache_idle = cache_idle
+        self.key_builder = DefaultKeyBuilder(
+            with_bot_id=True, with_business_connection_id=True, with_destiny=True
+        )
+        self._cache: Dict[str, _Record] = {}
+        self._dirty: Set[str] = set()
+        self._flush_lock = asyncio.Lock()
+    
+    async def _load(self, key: StorageKey) -> tuple:
+        """Найти запись в кэше или подгрузить её из базы"""
+        db_key = self.key_builder.build(key)
+        record = self._cache.get(db_key)
+        if record is None:
+            record = _Record()
+            row = await self.db.get_fsm_record(db_key)
+            if row and row['updated_at'] >= time.time() - self.state_ttl:
+                record = _Record(row['state'], json.loads(row['data'] or '{}'), row['updated_at'])
+            # Пока шла загрузка, запись могли создать параллельно
+            record = self._cache.setdefault(db_key, record)
+        record.accessed = time.monotonic()
+        return db_key, record
+    
+    def _touch(self, db_key: str, record: _Record):
+        record.updated_at = time.time()
+        self._dirty.add(db_key)
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        db_key, record = await self._load(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(db_key, record)
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._load(key)
+        return record.state
+    
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        db_key, record = await self._load(key)
+        record.data = dict(data)
+        self._touch(db_key, record)
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._load(key)
+        return dict(record.data)
+    
+    async def flush(self):
+        """Записать накопленные изменения в базу одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            
+            records, deleted = [], []
+            for db_key in keys:
+                record = self._cache.get(db_key)
+                if record is None:
+                    continue
+                if record.state is None and not record.data:
+                    deleted.append(db_key)
+                    continue
+                try:
+                    data = json.dumps(record.data, ensure_ascii=False)
+                except (TypeError, ValueError) as e:
+                    logger.error(f"❌ Данные FSM {db_key} не сериализуются: {e}")
+                    continue
+                records.append((db_key, record.state, data, record.updated_at))
+            
+            try:
+                await self.db.save_fsm_records(records, deleted)
+            except BaseException:
+                # Не теряем изменения: запишем их при следующей попытке
+                self._dirty |= keys
+                raise
+    
+    async def expire(self):
+        """Удалить брошенные диалоги и выгрузить из памяти неактивные записи"""
+        async with self._flush_lock:
+            now, monotonic_now = time.time(), time.monotonic()
+            removed = await self.db.delete_expired_fsm_records(now - self.state_ttl)
+            
+            for db_key, record in list(self._cache.items()):
+                if db_key in self._dirty:
+                    continue
+                if (record.updated_at < now - self.state_ttl
+                        or record.accessed < monotonic_now - self.cache_idle):
+                    del self._cache[db_key]
+        
+        if removed:
+            logger.info(f"🧹 Удалено брошенных состояний FSM: {removed}")
+    
+    def stats(self) -> Dict[str, int]:
+        """Показатели хранилища для мониторинга"""
+        return {'live': len(self._cache), 'dirty': len(self._dirty)}
+    
+    async def close(self) -> None:
+        await self.flush()
+
+
+def _estimate_size(record: _Record) -> int:
+    """Приблизительный объём записи в памяти (байты)"""
+    size = sys.getsizeof(record) + sys.getsizeof(record.state) + sys.getsizeof(record.data)
+    for name, value in record.data.items():
+        size += sys.getsizeof(name) + sys.getsizeof(value)
+    return size
+
+
+class BoundedMemoryStorage(BaseStorage):
+    """FSM storage в памяти с вытеснением по LRU и сроку простоя"""
+    
+    def __init__(self, max_keys: int = FSM_MEMORY_MAX_KEYS,
+                 idle_ttl: float = FSM_MEMORY_IDLE_TTL):
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        # Порядок - от давно не использованных к недавним
+        self._records: "OrderedDict[StorageKey, _Record]" = OrderedDict()
+        self._memory = 0
+        self.evicted = 0
+        self.expired = 0
+    
+    def _get(self, key: StorageKey) -> Optional[_Record]:
+        record = self._records.get(key)
+        if record is None:
+            return None
+        if record.accessed < time.monotonic() - self.idle_ttl:
+            self._remove(key)
+            self.expired += 1
+            return None
+        record.accessed = time.monotonic()
+        self._records.move_to_end(key)
+        return record
+    
+    def _remove(self, key: StorageKey):
+        record = self._records.pop(key)
+        self._memory -= record.size
+    
+    def _put(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        """Сохранить запись; пустые записи не храним вовсе"""
+        if key in self._records:
+            self._remove(key)
+        if state is None and not data:
+            return
+        
+        record = _Record(state, data, accessed=time.monotonic())
+        record.size = _estimate_size(record)
+        self._records[key] = record
+        self._memory += record.size
+        
+        while len(self._records) > self.max_keys:
+            self._remove(next(iter(self._records)))
+            self.evicted += 1
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._get(key)
+        data = record.data if record else {}
+        self._put(key, state.state if isinstance(state, State) else state, data)
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._get(key)
+        return record.state if record else None
+    
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = self._get(key)
+        self._put(key, record.state if record else None, dict(data))
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._get(key)
+        return dict(record.data) if record else {}
+    
+    async def expire(self):
+        """Удалить записи, к которым не обращались дольше idle_ttl"""
+        deadline = time.monotonic() - self.idle_ttl
+        removed = 0
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if record.accessed >= deadline:
+                break
+            self._remove(key)
+            removed += 1
+        self.expired += removed
+        
+        stats = self.stats()
+        logger.info(
+            f"📊 FSM в памяти: {stats['live']} состояний, ~{stats['memory_bytes'] // 1024} КБ, "
+            f"удалено по простою {removed}"
+        )
+    
+    def stats(self) -> Dict[str, int]:
+        """Показатели хранилища для мониторинга"""
+        return {
+            'live': len(self._records),
+            'memory_bytes': self._memory,
+            'evicted': self.evicted,
+            'expired': self.expired,
+        }
+    
+    async def close(self) -> None:
+        self._records.clear()
+        self._memory = 0
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Создать хранилище FSM согласно FSM_STORAGE"""
+    if FSM_STORAGE == 'memory':
+        return BoundedMemoryStorage()
+    return SQLiteStorage(db)
@@ -0,0 +1,245 @@
+"""Подготовка длинных HTML-сообщений для Telegram
+
+Telegram ограничивает текст сообщения 4096 символами, считая их в
+единицах UTF-16 (эмодзи вне BMP занимают две единицы). Пользовательский
+текст экранируется один раз при подстановке (truncate/escape), обрезается
+по исходному тексту, поэтому сущности вида &amp; не разрезаются.
+Готовый HTML при необходимости делится на части (split_html) по границам
+строк, открытые теги закрываются в конце части и открываются заново в
+следующей. Все операции линейны по длине текста.
+"""
+
+import logging
+import re
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from config import RENDER_CACHE_SIZE
+from utils.render_cache import remember_message, render_message
+from utils.templates import Markup, escape
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины текста сообщения в единицах UTF-16
+MESSAGE_TEXT_LIMIT = 4096
+
+_TOKEN_RE = re.compile(r'<[^>]*>|&#?\w+;|[^<&]+|[<&]')
+_TAG_NAME_RE = re.compile(r'</?([\w-]+)')
+
+# (chat_id, message_id) части с клавиатурой -> все части сообщения по порядку
+_message_groups: 'OrderedDict[Tuple[int, int], List[Message]]' = OrderedDict()
+
+
+def utf16_len(text: str) -> int:
+    """Длина текста так, как её считает Telegram"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _cut_utf16(text: str, units: int) -> Tuple[str, str]:
+    """Разрезать текст после units единиц UTF-16, не разбивая суррогатную пару"""
+    data = text.encode('utf-16-le')
+    cut = units * 2
+    if cut >= len(data):
+        return text, ''
+    # Не оставляем старшую половину суррогатной пары в конце
+    if 0xD8 <= data[cut - 1] <= 0xDB:
+        cut -= 2
+    return data[:cut].decode('utf-16-le'), data[cut:].decode('utf-16-le')
+
+
+def shorten(text: Optional[str], limit: int, ellipsis: str = '…') -> str:
+    """Обрезать простой текст (например, надпись кнопки) до limit единиц UTF-16"""
+    text = text or ''
+    size = utf16_len(text)
+    if size > limit:
+        keep = max(limit - utf16_len(ellipsis), 0)
+        # Без суррогатных пар единица UTF-16 совпадает с символом строки
+        head = text[:keep] if size == len(text) else _cut_utf16(text, keep)[0]
+        text = head.rstrip() + ellipsis
+    return text
+
+
+def truncate(text: Optional[str], limit: int, ellipsis: str = '…') -> Markup:
+    """Обрезать пользовательский текст до limit единиц UTF-16 и экранировать
+
+    Обрезается исходный текст, экранирование выполняется после, поэтому
+    результат всегда корректный HTML.
+    """
+    return escape(shorten(text, limit, ellipsis))
+
+
+class _Splitter:
+    """Набор частей сообщения с учётом открытых тегов"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.chunks: List[str] = []
+        self.parts: List[str] = []
+        self.size = 0
+        self.has_text = False
+        # (имя, открывающий тег) в порядке открытия
+        self.open_tags: List[Tuple[str, str]] = []
+        self.closing_size = 0
+
+    def free(self) -> int:
+        return self.limit - self.size - self.closing_size
+
+    def flush(self):
+        if self.has_text:
+            closing = ''.join(f'</{name}>' for name, _ in reversed(self.open_tags))
+            self.chunks.append(''.join(self.parts) + closing)
+        # Следующая часть начинается с тегов, не закрытых в этой
+        self.parts = [tag for _, tag in self.open_tags]
+        self.size = sum(utf16_len(tag) for tag in self.parts)
+        self.has_text = False
+
+    def add_tag(self, tag: str):
+        match = _TAG_NAME_RE.match(tag)
+        name = match.group(1) if match else ''
+        size = utf16_len(tag)
+        if tag.startswith('</'):
+            for i in range(len(self.open_tags) - 1, -1, -1):
+                if self.open_tags[i][0] == name:
+                    del self.open_tags[i]
+                    self.closing_size -= len(name) + 3
+                    break
+            self.parts.append(tag)
+            self.size += size
+            return
+        if self.free() < size + len(name) + 3 and self.has_text:
+            self.flush()
+        self.parts.append(tag)
+        self.size += size
+        self.open_tags.append((name, tag))
+        self.closing_size += len(name) + 3
+
+    def add_text(self, text: str):
+        data = text.encode('utf-16-le')
+        pos = 0
+        while pos < len(data):
+            cut = min(len(data) - pos, max(self.free(), 0) * 2)
+            # Не оставляем старшую половину суррогатной пары в конце части
+            if cut and pos + cut < len(data) and 0xD8 <= data[pos + cut - 1] <= 0xDB:
+                cut -= 2
+            if cut <= 0:
+                if self.has_text:
+                    self.flush()
+                    continue
+                # Места нет даже в пустой части: добавляем как есть
+                cut = len(data) - pos
+            self.parts.append(data[pos:pos + cut].decode('utf-16-le'))
+            self.size += cut // 2
+            self.has_text = True
+            pos += cut
+            if pos < len(data):
+                self.flush()
+
+    def add_entity(self, entity: str):
+        if self.free() < len(entity) and self.has_text:
+            self.flush()
+        self.parts.append(entity)
+        self.size += len(entity)
+        self.has_text = True
+
+
+def split_html(text: str, limit: int = MESSAGE_TEXT_LIMIT) -> List[str]:
+    """Разделить готовый HTML на части не длиннее limit единиц UTF-16
+
+    Части разделяются по переводам строк; строка длиннее лимита режется
+    между тегами и сущностями.
+    """
+    if utf16_len(text) <= limit:
+        return [text]
+
+    splitter = _Splitter(limit)
+    for line in text.splitlines(keepends=True):
+        # Строку, которая целиком не помещается, начинаем с новой части
+        if utf16_len(line) > splitter.free() and splitter.has_text:
+            splitter.flush()
+        for token in _TOKEN_RE.findall(line):
+            if token.startswith('<') and len(token) > 1:
+                splitter.add_tag(token)
+            elif token.startswith('&') and len(token) > 1:
+                splitter.add_entity(token)
+            else:
+                splitter.add_text(token)
+    splitter.flush()
+    return [chunk.strip('\n') or chunk for chunk in splitter.chunks]
+
+
+def _remember_group(messages: List[Message]):
+    last = messages[-1]
+    key = (last.chat.id, last.message_id)
+    _message_groups[key] = messages
+    _message_groups.move_to_end(key)
+    while len(_message_groups) > RENDER_CACHE_SIZE:
+        _message_groups.popitem(last=False)
+
+
+async def edit_long_message(message: Message, text: str,
+                            reply_markup: Optional[InlineKeyboardMarkup] = None,
+                            parse_mode: Optional[str] = "HTML") -> bool:
+    """Показать текст в сообщении, продолжение - следующими сообщениями
+
+    Клавиатура прикрепляется к последней части, поэтому кнопки нажимают
+    именно в ней: части запоминаются по сообщению с клавиатурой, и при
+    повторной отрисовке из него редактируется вся группа, лишние части
+    удаляются. Если первая часть не изменилась, а группа неизвестна
+    (например, после перезапуска), новые сообщения не отправляются.
+
+    Возвращает False, если ничего не изменилось.
+    """
+    chunks = split_html(text)
+    group = _message_groups.pop((message.chat.id, message.message_id), None)
+    tracked = group or [message]
+
+    first = await render_message(
+        tracked[0], chunks[0],
+        reply_markup=reply_markup if len(chunks) == 1 else None,
+        parse_mode=parse_mode
+    )
+    if first is None and group is None:
+        return False
+
+    changed = first is not None
+    messages = [first or tracked[0]]
+    previous = iter(tracked[1:])
+    for i, chunk in enumerate(chunks[1:], 2):
+        markup = reply_markup if i == len(chunks) else None
+        old = next(previous, None)
+        if old is None:
+            sent = await message.answer(chunk, reply_markup=markup, parse_mode=parse_mode)
+            remember_message(sent, chunk, markup, parse_mode)
+            messages.append(sent)
+            changed = True
+            continue
+        edited = await render_message(old, chunk, reply_markup=markup, parse_mode=parse_mode)
+        messages.append(edited or old)
+        changed = changed or edited is not None
+
+    # Текст стал короче: лишние продолжения больше не нужны
+    for old in previous:
+        try:
+            await old.delete()
+        except TelegramBadRequest as e:
+            logger.warning(f"Не удалось удалить продолжение сообщения {old.message_id}: {e}")
+        changed = True
+
+    if len(messages) > 1:
+        _remember_group(messages)
+    return changed
+
+
+async def answer_long_message(message: Message, text: str, reply_markup=None,
+                              parse_mode: Optional[str] = "HTML"):
+    """Отправить текст одним или несколькими сообщениями"""
+    chunks = split_html(text)
+    for i, chunk in enumerate(chunks, 1):
+        await message.answer(
+            chunk,
+            reply_markup=reply_markup if i == len(chunks) else None,
+            parse_mode=parse_mode
+        )
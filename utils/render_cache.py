@@ -0,0 +1,103 @@
+"""Пропуск повторных редактирований сообщений
+
+Кнопки «Обновить» перерисовывают сообщение, даже если ничего не
+изменилось, а Telegram отвечает на такое редактирование ошибкой
+«message is not modified». Для каждого сообщения запоминается хеш
+последнего отрисованного текста и клавиатуры вместе с edit_date
+сообщения: если сообщение с тех пор не редактировалось и новый
+вариант совпадает, запрос к API не отправляется.
+"""
+
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from config import RENDER_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# (chat_id, message_id) -> (хеш содержимого, edit_date сообщения)
+_rendered: 'OrderedDict[Tuple[int, int], Tuple[int, Optional[int]]]' = OrderedDict()
+_stats = {'edits': 0, 'skipped': 0}
+
+
+def _content_hash(text: str, reply_markup: Optional[InlineKeyboardMarkup],
+                  parse_mode: Optional[str]) -> int:
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else None
+    return hash((text, markup, parse_mode))
+
+
+def _edit_date(message: Message) -> Optional[int]:
+    # В aiogram 3.8 edit_date - unix time (int), в других версиях бывает datetime
+    edit_date = message.edit_date
+    if isinstance(edit_date, datetime):
+        return int(edit_date.timestamp())
+    return edit_date
+
+
+def _remember(key: Tuple[int, int], content: int, edit_date: Optional[int]):
+    _rendered[key] = (content, edit_date)
+    _rendered.move_to_end(key)
+    while len(_rendered) > RENDER_CACHE_SIZE:
+        _rendered.popitem(last=False)
+
+
+def remember_message(message: Message, text: str,
+                     reply_markup: Optional[InlineKeyboardMarkup] = None,
+                     parse_mode: Optional[str] = "HTML"):
+    """Запомнить содержимое только что отправленного сообщения"""
+    _remember((message.chat.id, message.message_id),
+              _content_hash(text, reply_markup, parse_mode), _edit_date(message))
+
+
+async def render_message(message: Message, text: str,
+                         reply_markup: Optional[InlineKeyboardMarkup] = None,
+                         parse_mode: Optional[str] = "HTML") -> Optional[Message]:
+    """Отредактировать сообщение, если содержимое изменилось
+
+    Возвращает сообщение после редактирования или None, если сообщение
+    уже показывает этот текст.
+    """
+    key = (message.chat.id, message.message_id)
+    content = _content_hash(text, reply_markup, parse_mode)
+
+    cached = _rendered.get(key)
+    if cached == (content, _edit_date(message)):
+        _rendered.move_to_end(key)
+        _stats['skipped'] += 1
+        return None
+
+    try:
+        edited = await message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+        # Сообщение уже в нужном виде, дальше не дёргаем API
+        _remember(key, content, _edit_date(message))
+        _stats['skipped'] += 1
+        return None
+
+    _stats['edits'] += 1
+    if isinstance(edited, Message):
+        _remember(key, content, _edit_date(edited))
+        return edited
+    return message
+
+
+async def edit_message(message: Message, text: str,
+                       reply_markup: Optional[InlineKeyboardMarkup] = None,
+                       parse_mode: Optional[str] = "HTML") -> bool:
+    """Отредактировать сообщение, если содержимое изменилось
+
+    Возвращает False, если сообщение уже показывает этот текст.
+    """
+    return await render_message(message, text, reply_markup, parse_mode) is not None
+
+
+def stats() -> dict:
+    """Размер кэша и число выполненных/пропущенных редактирований"""
+    return {'cached': len(_rendered), **_stats}
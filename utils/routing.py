@@ -0,0 +1,235 @@
+"""Индекс обработчиков для быстрой маршрутизации
+
+aiogram перебирает обработчики всех роутеров по очереди и проверяет
+фильтры каждого. Индекс заранее разбирает фильтры вида
+F.text == "...", F.text.in_([...]), F.data == "...",
+F.data.startswith("...") и фильтры CallbackData: точные значения
+складываются в словарь, префиксы - в префиксное дерево. Для события
+проверяются только обработчики, которые могут подойти по тексту или
+данным кнопки, и обработчики без таких фильтров - в исходном порядке
+регистрации, поэтому результат совпадает с обычной маршрутизацией.
+"""
+
+import heapq
+import logging
+import operator
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware, Router
+from aiogram.dispatcher.event.bases import REJECTED, UNHANDLED, SkipHandler
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.filters.callback_data import CallbackQueryFilter
+from magic_filter.operations import (
+    CallOperation, ComparatorOperation, FunctionOperation, GetAttributeOperation
+)
+from magic_filter.util import in_op
+
+logger = logging.getLogger(__name__)
+
+# Поле события, по которому строится индекс
+INDEXED_FIELDS = {
+    'message': 'text',
+    'callback_query': 'data',
+}
+
+
+@dataclass(frozen=True)
+class _Entry:
+    position: int
+    router: Router
+    routers: FrozenSet[int]     # id роутера и всех его родителей
+    observer: TelegramEventObserver
+    handler: HandlerObject
+
+
+def _magic_keys(magic, field: str) -> Optional[Tuple[str, Set[str]]]:
+    """Разобрать магический фильтр: ('exact'|'prefix', значения) или None"""
+    operations = magic._operations
+    if len(operations) < 2 or not isinstance(operations[0], GetAttributeOperation):
+        return None
+    if operations[0].name != field:
+        return None
+    
+    if len(operations) == 2:
+        operation = operations[1]
+        if isinstance(operation, ComparatorOperation) and operation.comparator is operator.eq:
+            if isinstance(operation.right, str):
+                return 'exact', {operation.right}
+        if isinstance(operation, FunctionOperation) and operation.function is in_op:
+            values = operation.args[0]
+            if isinstance(values, (list, tuple, set, frozenset)) and all(
+                isinstance(value, str) for value in values
+            ):
+                return 'exact', set(values)
+        return None
+    
+    if (len(operations) == 3 and isinstance(operations[1], GetAttributeOperation)
+            and operations[1].name == 'startswith'
+            and isinstance(operations[2], CallOperation)
+            and len(operations[2].args) == 1 and not operations[2].kwargs):
+        prefixes = operations[2].args[0]
+        prefixes = (prefixes,) if isinstance(prefixes, str) else prefixes
+        if isinstance(prefixes, tuple) and all(isinstance(prefix, str) for prefix in prefixes):
+            return 'prefix', set(prefixes)
+    return None
+
+
+def _handler_keys(handler: HandlerObject, field: str) -> Optional[Tuple[str, Set[str]]]:
+    """Найти среди фильтров обработчика первый, пригодный для индекса"""
+    for filter_object in handler.filters or ():
+        if filter_object.magic is not None:
+            keys = _magic_keys(filter_object.magic, field)
+            if keys:
+                return keys
+        elif isinstance(filter_object.callback, CallbackQueryFilter) and field == 'data':
+            callback_data = filter_object.callback.callback_data
+            return 'prefix', {f"{callback_data.__prefix__}{callback_data.__separator__}"}
+    return None
+
+
+class DispatchIndex:
+    """Индекс обработчиков одного типа событий по всему дереву роутеров"""
+    
+    def __init__(self, root: Router, event_type: str):
+        self.event_type = event_type
+        self.field = INDEXED_FIELDS[event_type]
+        self._entries: List[_Entry] = []
+        self._exact: Dict[str, List[int]] = {}
+        self._trie: Dict[str, Any] = {}
+        self._unindexed: List[int] = []
+        self._collect(root, frozenset())
+    
+    def _collect(self, router: Router, parents: FrozenSet[int]):
+        """Обойти роутеры в порядке распространения событий aiogram"""
+        routers = parents | {id(router)}
+        observer = router.observers[self.event_type]
+        for handler in observer.handlers:
+            position = len(self._entries)
+            self._entries.append(_Entry(position, router, routers, observer, handler))
+            keys = _handler_keys(handler, self.field)
+            if keys is None:
+                self._unindexed.append(position)
+            elif keys[0] == 'exact':
+                for value in keys[1]:
+                    self._exact.setdefault(value, []).append(position)
+            else:
+                for prefix in keys[1]:
+                    node = self._trie
+                    for char in prefix:
+                        node = node.setdefault(char, {})
+                    node.setdefault('', []).append(position)
+        
+        for sub_router in router.sub_routers:
+            self._collect(sub_router, routers)
+    
+    def candidates(self, value: Optional[str]) -> List[_Entry]:
+        """Обработчики, которые могут подойти под значение, в порядке регистрации"""
+        lists = [self._unindexed]
+        if isinstance(value, str):
+            if value in self._exact:
+                lists.append(self._exact[value])
+            node = self._trie
+            if '' in node:
+                lists.append(node[''])
+            for char in value:
+                node = node.get(char)
+                if node is None:
+                    break
+                if '' in node:
+                    lists.append(node[''])
+        
+        if len(lists) == 1:
+            positions = lists[0]
+        else:
+            positions = heapq.merge(*lists)
+        return [self._entries[position] for position in positions]
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            'handlers': len(self._entries),
+            'exact': len(self._exact),
+            'unindexed': len(self._unindexed),
+        }
+
+
+def _is_indexable(root: Router, event_type: str) -> bool:
+    """Индекс корректен, только если вложенные роутеры не добавляют своих шагов"""
+    for router in root.chain_tail:
+        observer = router.observers[event_type]
+        if observer._handler.filters:
+            return False
+        # Внешние middleware диспетчера и так оборачивают индекс
+        if router is not root and list(observer.outer_middleware):
+            return False
+    return True
+
+
+class IndexedDispatchMiddleware(BaseMiddleware):
+    """Внешний middleware типа события, который вызывает обработчик через индекс
+    
+    Регистрируется на наблюдателе диспетчера (dp.message, dp.callback_query)
+    последним из внешних middleware. Если дерево роутеров использует
+    корневые фильтры или свои внешние middleware, работает обычная
+    маршрутизация.
+    """
+    
+    def __init__(self, root: Router, event_type: str):
+        self.root = root
+        self.event_type = event_type
+        self._index: Optional[DispatchIndex] = None
+        self._enabled: Optional[bool] = None
+    
+    def _get_index(self) -> Optional[DispatchIndex]:
+        # Строится при первом событии, когда все роутеры уже подключены
+        if self._enabled is None:
+            self._enabled = _is_indexable(self.root, self.event_type)
+            if self._enabled:
+                self._index = DispatchIndex(self.root, self.event_type)
+                logger.info(f"🧭 Индекс обработчиков {self.event_type}: {self._index.stats()}")
+            else:
+                logger.warning(f"⚠️ Индекс обработчиков {self.event_type} отключён")
+        return self._index
+    
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        index = self._get_index()
+        if index is None:
+            return await handler(event, data)
+        
+        rejected: Set[int] = set()
+        for entry in index.candidates(getattr(event, index.field, None)):
+            if rejected & entry.routers:
+                continue
+            
+            kwargs = {**data, 'event_router': entry.router, 'handler': entry.handler}
+            result, filter_data = await entry.handler.check(event, **kwargs)
+            if not result:
+                continue
+            kwargs.update(filter_data)
+            
+            try:
+                wrapped = entry.observer.outer_middleware.wrap_middlewares(
+                    entry.observer._resolve_middlewares(), entry.handler.call
+                )
+                response = await wrapped(event, kwargs)
+            except SkipHandler:
+                continue
+            if response is REJECTED:
+                # Как в aiogram: роутер и его вложенные роутеры больше не проверяются
+                rejected.add(id(entry.router))
+                continue
+            return response
+        return UNHANDLED
+
+
+def install_dispatch_index(root: Router):
+    """Включить индекс для сообщений и нажатий кнопок"""
+    for event_type in INDEXED_FIELDS:
+        observer = root.observers[event_type]
+        observer.outer_middleware(IndexedDispatchMiddleware(root, event_type))
@@ -0,0 +1,97 @@
+"""LRU-кэш строк базы с версиями по корзинам
+
+Строки (обращения, пользователи) хранятся в кэше процесса вместе с
+версией своей корзины (id по модулю числа корзин). Любая запись в
+строку увеличивает версию корзины, и закэшированное значение с
+устаревшей версией считается промахом. В многопроцессном режиме
+версии лежат в общей памяти, поэтому запись в одном процессе
+сбрасывает кэш во всех остальных.
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RowCache:
+    """Кэш строк одной таблицы"""
+
+    def __init__(self, name: str, max_size: int, buckets: int):
+        self.name = name
+        self.max_size = max_size
+        self.buckets = buckets
+        self._rows: 'OrderedDict[Hashable, Tuple[int, Any]]' = OrderedDict()
+        self._versions = [0] * buckets
+        self.hits = 0
+        self.misses = 0
+
+    def share_versions(self, versions):
+        """Использовать общий для процессов массив версий (multiprocessing.Array)"""
+        self._versions = versions
+        self._rows.clear()
+
+    def _bucket(self, key: Hashable) -> int:
+        return hash(key) % self.buckets
+
+    def version(self, key: Hashable) -> int:
+        """Текущая версия корзины; запоминается до чтения из базы"""
+        return self._versions[self._bucket(key)]
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Вернуть (найдено, значение)"""
+        cached = self._rows.get(key)
+        if cached is not None and cached[0] == self.version(key):
+            self._rows.move_to_end(key)
+            self.hits += 1
+            return True, cached[1]
+        self.misses += 1
+        return False, None
+
+    def put(self, key: Hashable, value: Any, version: int):
+        """Сохранить значение, прочитанное при версии version
+
+        Если строку успели изменить во время чтения, значение не сохраняется.
+        """
+        if version != self.version(key):
+            return
+        self._rows[key] = (version, value)
+        self._rows.move_to_end(key)
+        while len(self._rows) > self.max_size:
+            self._rows.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Сбросить строку во всех процессах"""
+        self.invalidate_many((key,))
+
+    def invalidate_many(self, keys: Iterable[Hashable]):
+        buckets = {self._bucket(key) for key in keys}
+        if not buckets:
+            return
+        lock = getattr(self._versions, 'get_lock', None)
+        if lock:
+            with lock():
+                for bucket in buckets:
+                    self._versions[bucket] += 1
+        else:
+            for bucket in buckets:
+                self._versions[bucket] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            'size': len(self._rows),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / requests, 3) if requests else 0.0,
+        }
+
+    async def log_stats(self):
+        """Вывести метрики кэша в лог"""
+        stats = self.stats()
+        logger.info(
+            f"🗃 Кэш {self.name}: строк {stats['size']}/{self.max_size}, "
+            f"попаданий {stats['hits']}, промахов {stats['misses']}, "
+            f"доля попаданий {stats['hit_rate']:.1%}"
+        )
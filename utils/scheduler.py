@@ -0,0 +1,37 @@
+"""Фоновые периодические задачи"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, List
+
+logger = logging.getLogger(__name__)
+
+_tasks: List[asyncio.Task] = []
+
+
+async def _run_periodic(name: str, interval: float, job: Callable[[], Awaitable]):
+    """Выполнять задачу с заданным интервалом до отмены"""
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка фоновой задачи {name}: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_periodic(name: str, interval: float, job: Callable[[], Awaitable]):
+    """Запустить периодическую задачу в фоне"""
+    task = asyncio.create_task(_run_periodic(name, interval, job), name=name)
+    _tasks.append(task)
+    logger.info(f"⏱ Фоновая задача {name} запущена (каждые {interval} с)")
+    return task
+
+
+async def stop_periodic_tasks():
+    """Остановить все фоновые задачи"""
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
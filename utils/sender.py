@@ -0,0 +1,52 @@
+"""Отправка уведомлений с ограничением скорости"""
+
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramAPIError
+
+from config import NOTIFY_RATE_PER_SECOND
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Равномерно распределяет вызовы: не более rate в секунду"""
+    
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_slot > now:
+                await asyncio.sleep(self._next_slot - now)
+                now = self._next_slot
+            self._next_slot = now + self.interval
+
+
+limiter = RateLimiter(NOTIFY_RATE_PER_SECOND)
+
+
+async def send_message_limited(bot: Bot, chat_id: int, text: str, **kwargs) -> bool:
+    """Отправить сообщение с учётом лимитов Telegram
+    
+    При ответе 429 ждём указанное время и повторяем один раз.
+    Возвращает True, если сообщение доставлено.
+    """
+    for attempt in range(2):
+        await limiter.wait()
+        try:
+            await bot.send_message(chat_id, text, **kwargs)
+            return True
+        except TelegramRetryAfter as e:
+            logger.warning(f"Flood control, ждём {e.retry_after} с")
+            await asyncio.sleep(e.retry_after)
+        except TelegramAPIError as e:
+            logger.warning(f"Не удалось отправить сообщение {chat_id}: {e}")
+            return False
+    return False
@@ -0,0 +1,94 @@
+"""Шаблоны HTML-сообщений с автоматическим экранированием
+
+Шаблон записывается в синтаксисе str.format и компилируется один раз
+при создании: из него генерируется функция с одной f-строкой, поэтому
+при отрисовке не разбирается формат и не собираются промежуточные
+списки. Все подставляемые значения экранируются, кроме Markup - уже
+готового HTML (результатов других шаблонов, escape и truncate).
+
+    CARD = Template("<b>{ticket.subject}</b>\\n{body}")
+    CARD.render(ticket=ticket, body=Markup("<i>...</i>"))
+"""
+
+import string
+from typing import Any, Dict, List
+
+
+class Markup(str):
+    """Строка с готовым HTML, при подстановке не экранируется"""
+    __slots__ = ()
+
+    def __html__(self) -> 'Markup':
+        return self
+
+
+def _escape(value: Any) -> str:
+    if isinstance(value, str):
+        if isinstance(value, Markup):
+            return value
+        return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    if value is None:
+        return ''
+    if hasattr(value, '__html__'):
+        return value.__html__()
+    return _escape(str(value))
+
+
+def escape(value: Any) -> Markup:
+    """Экранировать значение для parse_mode=HTML (Markup остаётся как есть)"""
+    if isinstance(value, Markup):
+        return value
+    return Markup(_escape(value))
+
+
+def _check_field(field: str) -> str:
+    """Имя поля: переменная или цепочка атрибутов (ticket.subject)"""
+    if not all(part.isidentifier() for part in field.split('.')):
+        raise ValueError(f"Unsupported template field: {{{field}}}")
+    return field.split('.', 1)[0]
+
+
+class Template:
+    """Скомпилированный шаблон сообщения"""
+    __slots__ = ('source', 'fields', 'render')
+
+    def __init__(self, source: str):
+        self.source = source
+        names: List[str] = []
+        constants: Dict[str, Any] = {'_e': _escape, '_M': Markup}
+        body = []
+        for i, (literal, field, spec, conversion) in enumerate(string.Formatter().parse(source)):
+            if literal:
+                # Текст шаблона подставляется константой, без разбора кавычек и скобок
+                constants[f'_l{i}'] = literal
+                body.append(f'{{_l{i}}}')
+            if field is None:
+                continue
+            root = _check_field(field)
+            if root not in names:
+                names.append(root)
+            value = field
+            if conversion:
+                value = f'{"repr" if conversion == "r" else "str"}({value})'
+            if spec:
+                constants[f'_s{i}'] = spec
+                value = f'format({value}, _s{i})'
+            # Строки экранируются на месте, Markup и числа подставляются как есть
+            body.append(
+                f"{{_v.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')"
+                f" if type(_v := {value}) is str"
+                f" else _v if type(_v) is _M or type(_v) is int else _e(_v)}}"
+            )
+
+        args = f'*, {", ".join(names)}' if names else ''
+        code = f'def render({args}):\n    return _M(f"{"".join(body)}")\n'
+        exec(compile(code, f'<template {source[:30]!r}>', 'exec'), constants)
+        self.fields = tuple(names)
+        # render(**значения) -> Markup; вызывается напрямую, без промежуточной обёртки
+        self.render = constants['render']
+
+    def __call__(self, **values: Any) -> Markup:
+        return self.render(**values)
+
+    def __repr__(self) -> str:
+        return f'Template({self.source[:40]!r})'
@@ -1,4 +1,11 @@
-"""Тексты сообщений бота"""
+"""Тексты сообщений бота
+
+Тексты с подстановками - скомпилированные шаблоны (utils.templates):
+они отрисовываются через .render(...) и экранируют подставляемые
+значения, готовый HTML передаётся как Markup.
+"""
+
+from utils.templates import Template
 
 # Приветственные сообщения
 WELCOME_MESSAGE = """
@@ -59,7 +66,7 @@ TICKET_DESCRIPTION_MESSAGE = """
 • Какой результат ожидали?</i>
 """
 
-TICKET_CREATED_MESSAGE = """
+TICKET_CREATED_MESSAGE = Template("""
 ✅ <b>Обращение создано!</b>
 
 <b>№ обращения:</b> #{ticket_id}
@@ -69,16 +76,16 @@ TICKET_CREATED_MESSAGE = """
 Ваше обращение принято в работу. Мы ответим в течение 24 часов.
 
 Вы можете отслеживать статус в разделе "Мои обращения".
-"""
+""")
 
 # Сообщения для просмотра обращений
-MY_TICKETS_MESSAGE = """
+MY_TICKETS_MESSAGE = Template("""
 📋 <b>Ваши обращения</b>
 
 {tickets_list}
 
 Выберите обращение для просмотра деталей или создайте новое.
-"""
+""")
 
 NO_TICKETS_MESSAGE = """
 📭 <b>У вас пока нет обращений</b>
@@ -86,7 +93,7 @@ NO_TICKETS_MESSAGE = """
 Вы можете создать первое обращение, нажав кнопку ниже.
 """
 
-TICKET_DETAILS_MESSAGE = """
+TICKET_DETAILS_MESSAGE = Template("""
 🎫 <b>Обращение #{ticket_id}</b>
 
 <b>📋 Тема:</b> {subject}
@@ -99,7 +106,9 @@ TICKET_DETAILS_MESSAGE = """
 {description}
 
 {messages_info}
-"""
+""")
+
+MESSAGE_PREVIEW = Template("• {sender} ({date}): {text}\n")
 
 # Статусы обращений
 TICKET_STATUSES = {
@@ -110,6 +119,33 @@ TICKET_STATUSES = {
     'closed': '🔒 Закрыто'
 }
 
+# Значки статусов и приоритетов в списках и карточках
+STATUS_EMOJI = {
+    'new': '🆕',
+    'in_progress': '⏳',
+    'waiting_response': '⏰',
+    'resolved': '✅',
+    'closed': '🔒'
+}
+UNKNOWN_STATUS_EMOJI = '❓'
+
+PRIORITY_EMOJI = {
+    'high': '🔴',
+    'medium': '🟡',
+    'low': '🟢'
+}
+DEFAULT_PRIORITY_EMOJI = '🟡'
+
+# Строки списков обращений (utils/ticket_list.py)
+TICKET_LIST_ENTRY = Template(
+    "{number}. {status_emoji} <b>#{ticket.id}</b> - {subject}\n"
+    "   📅 {date} | {status}\n\n"
+)
+STAFF_TICKET_LIST_ENTRY = Template(
+    "{number}. {priority_emoji}{status_emoji} <b>#{ticket.id}</b> - {subject}\n"
+    "   👤 {user_name} | 📅 {date} | {status}\n\n"
+)
+
 # FAQ
 FAQ_MESSAGE = """
 ❓ <b>Часто задаваемые вопросы</b>
@@ -202,30 +238,85 @@ CONTACTS_MESSAGE = """
 """
 
 # Админские сообщения
-ADMIN_PANEL_MESSAGE = """
+ADMIN_PANEL_MESSAGE = Template("""
 👨‍💼 <b>Панель администратора</b>
 
 <b>📊 Статистика:</b>
 {stats}
 
 Что хотите сделать?
-"""
+""")
+
+ADMIN_MESSAGE_PREVIEW = Template("• {sender} ({date}):\n  {text}\n\n")
+
+TICKET_FOUND_MESSAGE = Template("""
+🎫 <b>Найдено обращение #{ticket.id}</b>
+
+👤 <b>Клиент:</b> {user_name}
+📋 <b>Тема:</b> {ticket.subject}
+📂 <b>Категория:</b> {category}
+📊 <b>Статус:</b> {status_emoji} {status}
+⏰ <b>Создано:</b> {created_at}
+
+📝 <b>Описание:</b>
+{description}
+""")
+
+TRANSCRIPT_HEADER = Template(
+    "📜 <b>Переписка по обращению #{ticket.id}</b> (сообщений: {ticket.message_count})\n\n"
+)
+TRANSCRIPT_ENTRY = Template("<b>{sender}</b> · {date}\n{text}\n\n")
+
+AGENT_LIST_ENTRY = Template("""{number}. <b>{name}</b>
+   ID: {user_id} | {username}
+   Добавлен: {created}
 
-ADMIN_TICKETS_MESSAGE = """
+""")
+
+ADMIN_TICKETS_MESSAGE = Template("""
 📋 <b>Обращения в поддержку</b>
 
 {tickets_list}
 
 Выберите обращение для обработки.
-"""
+""")
 
-TICKET_RESPONSE_MESSAGE = """
+TICKET_RESPONSE_MESSAGE = Template("""
 💬 <b>Ответ на обращение #{ticket_id}</b>
 
 Напишите ваш ответ пользователю:
 
 <i>Сообщение будет отправлено пользователю и сохранено в истории обращения.</i>
-"""
+""")
+
+# Уведомления
+NEW_TICKET_NOTIFICATION = Template("""
+🆕 <b>Новое обращение #{ticket.id}</b>
+
+👤 <b>От:</b> {user_name}
+📂 <b>Категория:</b> {category}
+📝 <b>Тема:</b> {subject}
+⏰ <b>Время:</b> {time}
+
+Требует обработки.
+""")
+
+TICKET_UPDATE_NOTIFICATION = Template("""
+💬 <b>Новое сообщение в обращении #{ticket.id}</b>
+
+👤 <b>От:</b> {user_name}
+📝 <b>Тема:</b> {subject}
+📊 <b>Статус:</b> {status}
+⏰ <b>Время:</b> {time}
+
+Требует ответа.
+""")
+
+SUPPORT_RESPONSE_NOTIFICATION = Template(
+    "💬 <b>Новый ответ на обращение #{ticket_id}</b>\n\n"
+    "<b>Ответ поддержки:</b>\n{response}\n\n"
+    "Вы можете ответить, перейдя к обращению в разделе \"Мои обращения\"."
+)
 
 # Сообщения об ошибках
 ERROR_MESSAGE = """
@@ -253,4 +344,22 @@ CANCEL_MESSAGE = """
 ❌ <b>Операция отменена</b>
 
 Вы вернулись в главное меню.
-"""
\ No newline at end of file
+"""
+
+# Автоматическое закрытие обращений
+AUTO_CLOSED_MESSAGE = Template("""
+🔒 <b>Обращение #{ticket_id} закрыто автоматически</b>
+
+{reason}
+
+Если вопрос остался актуальным, создайте новое обращение.
+""")
+
+AUTO_CLOSE_REASONS = {
+    'resolved': 'Обращение было решено и не требовало дальнейших действий.',
+    'waiting_response': 'Мы не получили от вас ответа на запрос дополнительной информации.'
+}
+
+
+# Ограничение частоты действий
+THROTTLED_MESSAGE = "⏳ Слишком часто. Подождите немного и повторите."
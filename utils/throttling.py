@@ -0,0 +1,102 @@
+"""Ограничение частоты действий пользователей (token bucket)
+
+Для каждой пары (пользователь, группа) хранится ведро токенов: каждое
+действие тратит токен, токены восстанавливаются со скоростью группы.
+Группа задаётся флагом обработчика throttling_key, по умолчанию
+'default'. Лимиты групп - в THROTTLE_LIMITS.
+"""
+
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from config import THROTTLE_LIMITS, THROTTLE_SWEEP_INTERVAL
+from utils.texts import THROTTLED_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+# Индексы полей ведра: [токены, время обновления, предупреждён ли пользователь]
+TOKENS, UPDATED, WARNED = 0, 1, 2
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Отбрасывает действия пользователя сверх лимита его группы"""
+    
+    def __init__(self, limits: Dict[str, Tuple[float, int]] = THROTTLE_LIMITS,
+                 sweep_interval: float = THROTTLE_SWEEP_INTERVAL):
+        self.limits = limits
+        self.sweep_interval = sweep_interval
+        self._buckets: Dict[Tuple[int, str], List] = {}
+        self._last_sweep = time.monotonic()
+        self.dropped: Dict[str, int] = {}
+    
+    def _limit(self, group: str) -> Tuple[float, int]:
+        return self.limits.get(group, self.limits['default'])
+    
+    def _allow(self, user_id: int, group: str, now: float) -> Tuple[bool, bool]:
+        """Потратить токен; возвращает (разрешено, нужно ли предупредить)"""
+        rate, burst = self._limit(group)
+        bucket = self._buckets.get((user_id, group))
+        if bucket is None:
+            self._buckets[(user_id, group)] = [burst - 1, now, False]
+            return True, False
+        
+        bucket[TOKENS] = min(burst, bucket[TOKENS] + (now - bucket[UPDATED]) * rate)
+        bucket[UPDATED] = now
+        if bucket[TOKENS] >= 1:
+            bucket[TOKENS] -= 1
+            bucket[WARNED] = False
+            return True, False
+        
+        # Предупреждаем один раз за серию, чтобы не отвечать на каждый спам
+        warn = not bucket[WARNED]
+        bucket[WARNED] = True
+        return False, warn
+    
+    def _sweep(self, now: float):
+        """Удалить вёдра, которые уже успели наполниться (неактивные)"""
+        full = []
+        for key, bucket in self._buckets.items():
+            rate, burst = self._limit(key[1])
+            if bucket[TOKENS] + (now - bucket[UPDATED]) * rate >= burst:
+                full.append(key)
+        for key in full:
+            del self._buckets[key]
+        self._last_sweep = now
+        
+        if self.dropped:
+            logger.info(
+                f"🚦 Ограничение частоты: активных счётчиков {len(self._buckets)}, "
+                f"отброшено {self.dropped}"
+            )
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+        
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._sweep(now)
+        
+        group = get_flag(data, 'throttling_key', default='default')
+        allowed, warn = self._allow(user.id, group, now)
+        if allowed:
+            return await handler(event, data)
+        
+        self.dropped[group] = self.dropped.get(group, 0) + 1
+        if isinstance(event, CallbackQuery):
+            # На нажатие нужно ответить в любом случае, иначе кнопка "зависнет"
+            await event.answer(THROTTLED_MESSAGE if warn else None)
+        elif warn and isinstance(event, Message):
+            await event.answer(THROTTLED_MESSAGE)
+        return None
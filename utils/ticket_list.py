@@ -0,0 +1,75 @@
+"""Отрисовка списков обращений для всех ролей
+
+Текст списка и кнопки обращений строятся за один проход по записям.
+Значки статусов и приоритетов берутся из готовых таблиц utils/texts.py,
+даты форматируются один раз и дальше берутся из кэша (utils/dates.py).
+Строка списка выглядит одинаково во всех экранах роли: в «Моих
+обращениях» клиента, в очередях администратора и агента.
+"""
+
+from typing import List, Sequence, Tuple
+
+from aiogram.types import InlineKeyboardButton
+
+from keyboards.callback_data import AdminTicketCallback, TicketCallback
+from models import Ticket
+from utils.dates import format_timestamp
+from utils.render import shorten, truncate
+from utils.templates import Markup
+from utils.texts import (
+    STATUS_EMOJI, UNKNOWN_STATUS_EMOJI, PRIORITY_EMOJI, DEFAULT_PRIORITY_EMOJI,
+    TICKET_STATUSES, TICKET_LIST_ENTRY, STAFF_TICKET_LIST_ENTRY
+)
+
+
+def get_status_emoji(status: str) -> str:
+    """Получить эмодзи для статуса"""
+    return STATUS_EMOJI.get(status, UNKNOWN_STATUS_EMOJI)
+
+
+def get_priority_emoji(priority: str) -> str:
+    """Получить эмодзи для приоритета"""
+    return PRIORITY_EMOJI.get(priority, DEFAULT_PRIORITY_EMOJI)
+
+
+# Кнопки обращений: callback_data собирается так же, как pack() для
+# единственного поля ticket_id, но без модели на каждую строку списка
+_TICKET_PREFIX = f"{TicketCallback.__prefix__}{TicketCallback.__separator__}"
+_ADMIN_TICKET_PREFIX = f"{AdminTicketCallback.__prefix__}{AdminTicketCallback.__separator__}"
+
+
+def render_ticket_list(tickets: Sequence[Ticket], start: int = 1,
+                       staff: bool = False) -> Tuple[Markup, List[InlineKeyboardButton]]:
+    """Текст списка и кнопки обращений
+
+    start - номер первой строки (для постраничного вывода), staff - список
+    для сотрудников: с приоритетом, автором и кнопками карточки сотрудника.
+    """
+    entries = []
+    buttons = []
+    for number, ticket in enumerate(tickets, start):
+        status_emoji = STATUS_EMOJI.get(ticket.status, UNKNOWN_STATUS_EMOJI)
+        status = TICKET_STATUSES.get(ticket.status, ticket.status)
+        date = format_timestamp(ticket.created_at, "%d.%m.%Y")
+        if staff:
+            priority_emoji = PRIORITY_EMOJI.get(ticket.priority, DEFAULT_PRIORITY_EMOJI)
+            user_name = ticket.first_name or 'Неизвестно'
+            entries.append(STAFF_TICKET_LIST_ENTRY.render(
+                number=number, priority_emoji=priority_emoji, status_emoji=status_emoji,
+                ticket=ticket, subject=truncate(ticket.subject, 40),
+                user_name=user_name, date=date, status=status
+            ))
+            buttons.append(InlineKeyboardButton(
+                text=f"{priority_emoji} #{ticket.id} - {user_name} - {shorten(ticket.subject, 25)}",
+                callback_data=f"{_ADMIN_TICKET_PREFIX}{ticket.id}"
+            ))
+        else:
+            entries.append(TICKET_LIST_ENTRY.render(
+                number=number, status_emoji=status_emoji, ticket=ticket,
+                subject=truncate(ticket.subject, 40), date=date, status=status
+            ))
+            buttons.append(InlineKeyboardButton(
+                text=f"{status_emoji} #{ticket.id} - {shorten(ticket.subject, 30)}",
+                callback_data=f"{_TICKET_PREFIX}{ticket.id}"
+            ))
+    return Markup(''.join(entries)), buttons
@@ -0,0 +1,106 @@
+"""Выгрузка полной переписки по обращению в файл
+
+Сообщения читаются из базы пачками (Database.stream_ticket_transcript)
+и сразу дописываются во временный файл, поэтому даже обращения с
+тысячами сообщений не собираются в памяти целиком.
+"""
+
+import asyncio
+import os
+import tempfile
+from html import escape
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from database import db
+from models import Ticket
+from utils.dates import format_timestamp
+
+TRANSCRIPT_FORMATS = ('txt', 'html')
+
+_HTML_HEAD = '''<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; max-width: 800px; margin: 2em auto; }}
+.msg {{ margin: 1em 0; padding: .5em 1em; border-left: 3px solid #999; }}
+.support {{ border-color: #2a7ae2; }}
+.meta {{ color: #666; font-size: .9em; }}
+.text {{ white-space: pre-wrap; margin: .3em 0 0; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p>{subject}</p>
+'''
+_HTML_TAIL = '</body>\n</html>\n'
+
+
+def message_sender(is_admin: bool, first_name: str = None, username: str = None) -> str:
+    """Подпись отправителя сообщения"""
+    if is_admin:
+        return "Поддержка"
+    name = first_name or 'Пользователь'
+    return f"{name} (@{username})" if username else name
+
+
+def format_message_date(created_at: int) -> str:
+    return format_timestamp(created_at, "%d.%m.%Y %H:%M")
+
+
+def _txt_chunk_writer(out) -> Callable[[List[tuple]], None]:
+    def write(rows: List[tuple]):
+        out.writelines(
+            f"[{format_message_date(created_at)}] "
+            f"{message_sender(is_admin, first_name, username)}:\n{message}\n\n"
+            for _, is_admin, created_at, message, first_name, username in rows
+        )
+    return write
+
+
+def _html_chunk_writer(out) -> Callable[[List[tuple]], None]:
+    def write(rows: List[tuple]):
+        out.writelines(
+            f'<div class="msg{" support" if is_admin else ""}">'
+            f'<div class="meta">{escape(message_sender(is_admin, first_name, username))}'
+            f' · {format_message_date(created_at)}</div>'
+            f'<div class="text">{escape(message)}</div></div>\n'
+            for _, is_admin, created_at, message, first_name, username in rows
+        )
+    return write
+
+
+async def write_transcript(ticket: Ticket, fmt: str = 'html') -> Tuple[Path, int]:
+    """Записать переписку обращения во временный файл
+
+    Возвращает путь к файлу и количество сообщений. Файл удаляет
+    вызывающий код.
+    """
+    if fmt not in TRANSCRIPT_FORMATS:
+        raise ValueError(f"Unknown transcript format: {fmt}")
+
+    fd, path = tempfile.mkstemp(prefix=f'ticket_{ticket.id}_', suffix=f'.{fmt}')
+    os.close(fd)
+    count = 0
+    title = f"Обращение #{ticket.id}"
+    try:
+        with open(path, 'w', encoding='utf-8') as out:
+            if fmt == 'html':
+                out.write(_HTML_HEAD.format(title=title, subject=escape(ticket.subject)))
+                write_chunk = _html_chunk_writer(out)
+            else:
+                out.write(f"{title}\n{ticket.subject}\n\n")
+                write_chunk = _txt_chunk_writer(out)
+
+            async for rows in db.stream_ticket_transcript(ticket.id, ticket.archived):
+                await asyncio.to_thread(write_chunk, rows)
+                count += len(rows)
+
+            if fmt == 'html':
+                out.write(_HTML_TAIL)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return Path(path), count
@@ -0,0 +1,179 @@
+"""Приём обновлений через вебхук на встроенном сервере aiohttp
+
+Telegram получает ответ 200 сразу после проверки секретного токена,
+обновление обрабатывается диспетчером в фоне. При остановке сервер
+перестаёт принимать запросы и дожидается уже принятых обновлений.
+
+Для локальной проверки без Telegram можно отправить поддельные обновления:
+
+    python -m utils.webhook post --url http://localhost:8080/webhook --text /start
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import signal
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from aiohttp import ClientSession, web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+    WEBHOOK_DRAIN_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука, который умеет дождаться фоновых обновлений"""
+    
+    async def drain(self, app: web.Application = None):
+        """Дождаться обработки принятых обновлений (не дольше таймаута)"""
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        
+        logger.info(f"⏳ Дожидаемся обработки обновлений: {len(tasks)}")
+        _, pending = await asyncio.wait(tasks, timeout=WEBHOOK_DRAIN_TIMEOUT)
+        if pending:
+            logger.warning(f"⚠️ Не дождались обработки обновлений: {len(pending)}")
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """Собрать aiohttp-приложение с вебхуком"""
+    app = web.Application()
+    handler = DrainingRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET or None
+    )
+    # Дренаж должен отработать раньше остановки диспетчера и закрытия сессии бота
+    app.on_shutdown.append(handler.drain)
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def set_bot_webhook(bot: Bot, allowed_updates: List[str]):
+    """Зарегистрировать вебхук в Telegram, если задан публичный адрес"""
+    if not WEBHOOK_URL:
+        logger.warning("⚠️ WEBHOOK_URL не задан, вебхук в Telegram не регистрируется")
+        return
+    await bot.set_webhook(
+        f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=allowed_updates
+    )
+    logger.info(f"🔗 Вебхук установлен: {WEBHOOK_URL}{WEBHOOK_PATH}")
+
+
+async def wait_for_stop_signal():
+    """Дождаться SIGINT/SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: остаётся KeyboardInterrupt
+            pass
+    await stop.wait()
+
+
+async def serve(app: web.Application):
+    """Запустить aiohttp-приложение и работать до сигнала остановки"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+    logger.info(f"🌐 Вебхук слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+    
+    try:
+        await wait_for_stop_signal()
+    finally:
+        # Останавливает приём запросов, затем вызывает on_shutdown
+        await runner.cleanup()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Принимать обновления через вебхук до сигнала остановки"""
+    await set_bot_webhook(bot, dp.resolve_used_update_types())
+    await serve(create_app(dp, bot))
+
+
+def fake_update(update_id: int, chat_id: int, text: Optional[str] = None,
+                callback_data: Optional[str] = None) -> Dict[str, Any]:
+    """Синтетическое обновление Telegram для локальной проверки"""
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Test', 'username': f'test{chat_id}'}
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Test'},
+        'from': user,
+        'text': text or '',
+    }
+    if callback_data is None:
+        return {'update_id': update_id, 'message': message}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user,
+            'chat_instance': str(chat_id),
+            'message': message,
+            'data': callback_data,
+        },
+    }
+
+
+async def post_fake_updates(url: str, secret: str, chat_ids: List[int], count: int,
+                            text: Optional[str], callback_data: Optional[str]):
+    """Отправить count обновлений на вебхук и вывести время ответа"""
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+    update_ids = itertools.count(int(time.time()))
+    chats = itertools.cycle(chat_ids)
+    
+    async with ClientSession() as session:
+        async def post_one():
+            update = fake_update(next(update_ids), next(chats), text, callback_data)
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                await response.read()
+                return response.status, time.perf_counter() - started
+        
+        results = await asyncio.gather(*(post_one() for _ in range(count)))
+    
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(elapsed for _, elapsed in results)
+    print(f"Ответы: {statuses}")
+    print(f"Задержка: медиана {latencies[len(latencies) // 2] * 1000:.1f} мс, "
+          f"максимум {latencies[-1] * 1000:.1f} мс")
+
+
+def main(argv: List[str]):
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(prog='python -m utils.webhook')
+    commands = parser.add_subparsers(dest='command', required=True)
+    post = commands.add_parser('post', help='отправить поддельные обновления на вебхук')
+    post.add_argument('--url', default=f'http://127.0.0.1:{WEBAPP_PORT}{WEBHOOK_PATH}')
+    post.add_argument('--secret', default=WEBHOOK_SECRET)
+    post.add_argument('--chat-id', type=int, action='append', help='чат (можно несколько)')
+    post.add_argument('--count', type=int, default=1)
+    post.add_argument('--text', default='/start')
+    post.add_argument('--callback-data', help='отправить нажатие кнопки вместо сообщения')
+    args = parser.parse_args(argv)
+    
+    asyncio.run(post_fake_updates(
+        args.url, args.secret, args.chat_id or [1], args.count, args.text, args.callback_data
+    ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
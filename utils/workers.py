@@ -0,0 +1,250 @@
+"""Обработка обновлений в нескольких процессах
+
+Главный процесс только принимает обновления (polling или вебхук) и
+раскладывает их по очередям процессов-обработчиков по id чата. Все
+обновления одного чата попадают в один процесс и обрабатываются по
+порядку, разные чаты обрабатываются параллельно на всех ядрах.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import secrets
+import signal
+from typing import Any, Dict, List
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.dispatcher import DEFAULT_BACKOFF_CONFIG
+from aiogram.utils.backoff import Backoff
+
+from config import (
+    BOT_MODE, WEBHOOK_PATH, WEBHOOK_SECRET, WORKERS, WORKER_QUEUE_SIZE,
+    WORKER_METRICS_INTERVAL, ROW_CACHE_BUCKETS
+)
+from database import db
+from utils.scheduler import start_periodic, stop_periodic_tasks
+from utils.webhook import serve, set_bot_webhook, wait_for_stop_signal
+
+logger = logging.getLogger(__name__)
+
+POLLING_TIMEOUT = 30
+
+
+def chat_id_of(update: Dict[str, Any]) -> int:
+    """Определить чат, к которому относится обновление"""
+    for name, event in update.items():
+        if not isinstance(event, dict):
+            continue
+        chat = event.get('chat') or (event.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = event.get('from') or event.get('user')
+        if user:
+            return user['id']
+    return 0
+
+
+class WorkerMetrics:
+    """Счётчики процессов-обработчиков в общей памяти"""
+    
+    FIELDS = ('processed', 'failed', 'busy_seconds')
+    
+    def __init__(self, workers: int, ctx):
+        self.workers = workers
+        self._values = ctx.Array('d', workers * len(self.FIELDS))
+    
+    def add(self, worker: int, field: str, value: float = 1):
+        index = worker * len(self.FIELDS) + self.FIELDS.index(field)
+        with self._values.get_lock():
+            self._values[index] += value
+    
+    def snapshot(self) -> List[Dict[str, float]]:
+        with self._values.get_lock():
+            values = list(self._values)
+        size = len(self.FIELDS)
+        return [
+            dict(zip(self.FIELDS, values[i * size:(i + 1) * size]))
+            for i in range(self.workers)
+        ]
+
+
+def _worker_process(index: int, updates: multiprocessing.Queue, metrics: WorkerMetrics,
+                    cache_versions: tuple):
+    """Точка входа процесса-обработчика"""
+    # Останавливается по сигналу из главного процесса, дообработав очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    
+    # Запись в обращение в одном процессе сбрасывает его кэш во всех
+    db.share_cache_versions(*cache_versions)
+    
+    import bot as app
+    asyncio.run(_run_worker(app, index, updates, metrics))
+
+
+async def _run_worker(app, index: int, updates: multiprocessing.Queue, metrics: WorkerMetrics):
+    app.setup_dispatcher()
+    
+    # feed_raw_update только ставит обновление в очередь чата, поэтому
+    # счётчики обновляются, когда планировщик закончил обработку
+    def update_done(ok: bool, seconds: float):
+        metrics.add(index, 'processed')
+        if not ok:
+            metrics.add(index, 'failed')
+        metrics.add(index, 'busy_seconds', seconds)
+    
+    app.dp.on_update_done = update_done
+    try:
+        await app.dp.emit_startup(bot=app.bot, worker_index=index)
+        logger.info(f"👷 Обработчик {index} запущен")
+        while True:
+            update = await asyncio.to_thread(updates.get)
+            if update is None:
+                break
+            
+            try:
+                await app.dp.feed_raw_update(app.bot, update)
+            except Exception as e:
+                # Обновление не удалось даже разобрать и поставить в очередь
+                update_done(False, 0)
+                logger.error(f"❌ Обработчик {index}: ошибка обработки обновления: {e}")
+    finally:
+        await app.dp.emit_shutdown(bot=app.bot, worker_index=index)
+        await app.bot.session.close()
+        logger.info(f"👷 Обработчик {index} остановлен")
+
+
+class ShardedFront:
+    """Приём обновлений и распределение их по процессам"""
+    
+    def __init__(self, workers: int):
+        self.ctx = multiprocessing.get_context('spawn')
+        self.queues = [self.ctx.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self.metrics = WorkerMetrics(workers, self.ctx)
+        self.cache_versions = (
+            self.ctx.Array('q', ROW_CACHE_BUCKETS),
+            self.ctx.Array('q', ROW_CACHE_BUCKETS),
+        )
+        self.processes = [
+            self.ctx.Process(
+                target=_worker_process,
+                args=(i, self.queues[i], self.metrics, self.cache_versions),
+                name=f'worker-{i}'
+            )
+            for i in range(workers)
+        ]
+    
+    async def route(self, update: Dict[str, Any]):
+        """Отправить обновление процессу, отвечающему за его чат"""
+        target = self.queues[abs(chat_id_of(update)) % len(self.queues)]
+        try:
+            target.put_nowait(update)
+        except queue.Full:
+            # Обработчик не успевает: ждём места, не блокируя event loop
+            await asyncio.to_thread(target.put, update)
+    
+    async def log_metrics(self):
+        """Вывести метрики процессов-обработчиков"""
+        for index, stats in enumerate(self.metrics.snapshot()):
+            try:
+                depth = self.queues[index].qsize()
+            except NotImplementedError:
+                depth = -1
+            processed = stats['processed']
+            avg_ms = stats['busy_seconds'] / processed * 1000 if processed else 0
+            logger.info(
+                f"📊 Обработчик {index}: очередь {depth}, обработано {int(processed)}, "
+                f"ошибок {int(stats['failed'])}, в среднем {avg_ms:.1f} мс, "
+                f"{'работает' if self.processes[index].is_alive() else 'остановлен'}"
+            )
+    
+    async def poll(self, bot: Bot, allowed_updates: List[str]):
+        """Получать обновления через getUpdates и раздавать их обработчикам
+        
+        Любая ошибка запроса (сеть, 5xx, конфликт, RetryAfter) только
+        откладывает следующую попытку, как в Dispatcher._listen_updates.
+        """
+        offset = None
+        backoff = Backoff(config=DEFAULT_BACKOFF_CONFIG)
+        failed = False
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failed = True
+                logger.error(
+                    f"⚠️ Ошибка получения обновлений ({type(e).__name__}: {e}), "
+                    f"повтор через {backoff.next_delay:.1f} с"
+                )
+                await backoff.asleep()
+                continue
+            
+            if failed:
+                logger.info("✅ Получение обновлений восстановлено")
+                backoff.reset()
+                failed = False
+            
+            for update in updates:
+                await self.route(update.model_dump(mode='json', by_alias=True, exclude_none=True))
+                offset = update.update_id + 1
+    
+    def create_app(self) -> web.Application:
+        """aiohttp-приложение, которое только принимает вебхук"""
+        async def handle(request: web.Request) -> web.Response:
+            token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if WEBHOOK_SECRET and not secrets.compare_digest(token, WEBHOOK_SECRET):
+                return web.Response(status=401, text='Unauthorized')
+            await self.route(await request.json())
+            return web.Response()
+        
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, handle)
+        return app
+    
+    async def stop_workers(self):
+        """Дождаться, пока обработчики разберут очереди, и остановить их"""
+        for updates in self.queues:
+            await asyncio.to_thread(updates.put, None)
+        for process in self.processes:
+            await asyncio.to_thread(process.join)
+
+
+async def run_sharded(bot: Bot, dp: Dispatcher, workers: int = WORKERS):
+    """Запустить приём обновлений и workers процессов-обработчиков"""
+    await db.create_tables()
+    allowed_updates = dp.resolve_used_update_types()
+    
+    front = ShardedFront(workers)
+    for process in front.processes:
+        process.start()
+    start_periodic("worker_metrics", WORKER_METRICS_INTERVAL, front.log_metrics)
+    logger.info(f"🔀 Обновления распределяются по {workers} процессам")
+    
+    try:
+        if BOT_MODE == 'webhook':
+            await set_bot_webhook(bot, allowed_updates)
+            await serve(front.create_app())
+        else:
+            await bot.delete_webhook()
+            polling = asyncio.create_task(front.poll(bot, allowed_updates))
+            stop = asyncio.create_task(wait_for_stop_signal())
+            try:
+                # Остановка по сигналу или из-за падения приёма обновлений
+                await asyncio.wait({polling, stop}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                polling.cancel()
+                stop.cancel()
+                await asyncio.gather(polling, stop, return_exceptions=True)
+            if not polling.cancelled() and polling.exception():
+                logger.error(f"❌ Приём обновлений остановлен: {polling.exception()!r}")
+                raise polling.exception()
+    finally:
+        await stop_periodic_tasks()
+        await front.stop_workers()
+        await front.log_metrics()